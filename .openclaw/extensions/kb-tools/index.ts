@@ -1,18 +1,168 @@
-import { execFile } from "node:child_process";
+import { spawn } from "node:child_process";
+import http from "node:http";
 import path from "node:path";
+import { StringDecoder } from "node:string_decoder";
 
-function runPython(args: string[], timeoutMs: number): Promise<string> {
+// Resident daemon started with `python scripts/kb_cli.py serve`. One keep-alive agent
+// is shared by all tool calls so requests reuse the same TCP connection.
+const DAEMON_URL = new URL(process.env.KB_DAEMON_URL || "http://127.0.0.1:8765");
+const daemonAgent = new http.Agent({ keepAlive: true, maxSockets: 4 });
+
+class DaemonUnavailable extends Error {}
+
+// Receives the lines collected so far each time NDJSON output completes another one.
+type OnLines = (text: string) => void;
+
+// Collects NDJSON output as it arrives, checking each line as soon as it is complete and
+// handing it to `onLines`, so a caller sees the first hits while later ones are written.
+class NdjsonLines {
+  private rest = "";
+  private decoder = new StringDecoder("utf8"); // a chunk may end inside a multi-byte character
+  readonly lines: string[] = [];
+
+  constructor(private onLines?: OnLines) {}
+
+  push(chunk: Buffer): void {
+    const parts = (this.rest + this.decoder.write(chunk)).split("\n");
+    this.rest = parts.pop() ?? "";
+    const before = this.lines.length;
+    for (const line of parts) this.add(line);
+    if (this.onLines && this.lines.length > before) this.onLines(this.lines.join("\n"));
+  }
+
+  end(): string {
+    this.add(this.rest + this.decoder.end());
+    this.rest = "";
+    return this.lines.join("\n");
+  }
+
+  private add(line: string): void {
+    if (!line.trim()) return;
+    JSON.parse(line); // throws on a truncated or garbled line
+    this.lines.push(line);
+  }
+}
+
+function callDaemon(route: string, body: unknown, timeoutMs: number, onLines?: OnLines): Promise<string> {
+  return new Promise((resolve, reject) => {
+    const payload = JSON.stringify(body);
+    const req = http.request(
+      {
+        hostname: DAEMON_URL.hostname,
+        port: DAEMON_URL.port || 80,
+        path: route,
+        method: "POST",
+        agent: daemonAgent,
+        timeout: timeoutMs,
+        headers: { "Content-Type": "application/json", "Content-Length": Buffer.byteLength(payload) },
+      },
+      (res) => {
+        if (res.statusCode === 200 && String(res.headers["content-type"] ?? "").includes("ndjson")) {
+          const out = new NdjsonLines(onLines);
+          res.on("data", (c: Buffer) => {
+            try {
+              out.push(c);
+            } catch {
+              req.destroy(new Error("KB daemon streamed invalid NDJSON."));
+            }
+          });
+          res.on("end", () => {
+            try {
+              resolve(out.end());
+            } catch {
+              reject(new Error("KB daemon streamed invalid NDJSON."));
+            }
+          });
+          return;
+        }
+        const chunks: Buffer[] = [];
+        res.on("data", (c: Buffer) => chunks.push(c));
+        res.on("end", () => {
+          const text = Buffer.concat(chunks).toString("utf8");
+          let data: any;
+          try {
+            data = JSON.parse(text);
+          } catch {
+            return reject(new Error(`KB daemon returned invalid JSON (HTTP ${res.statusCode}).`));
+          }
+          if (res.statusCode !== 200) {
+            return reject(new Error(`KB tool failed.\n\n${data.error ?? text}`));
+          }
+          resolve(JSON.stringify(data));
+        });
+      }
+    );
+    req.on("timeout", () => req.destroy(new Error(`KB daemon timed out after ${timeoutMs} ms.`)));
+    req.on("error", (err: NodeJS.ErrnoException) => {
+      const down = ["ECONNREFUSED", "ENOTFOUND", "EHOSTUNREACH"].includes(err.code ?? "");
+      reject(down ? new DaemonUnavailable(err.message) : err);
+    });
+    req.end(payload);
+  });
+}
+
+async function runKb(
+  route: string,
+  body: unknown,
+  args: string[],
+  timeoutMs: number,
+  ndjson = false,
+  onLines?: OnLines
+): Promise<string> {
+  try {
+    return await callDaemon(route, body, timeoutMs, onLines);
+  } catch (err) {
+    if (!(err instanceof DaemonUnavailable)) throw err;
+    // Daemon is not running: fall back to a one-off CLI process.
+    return runPython(args, timeoutMs, ndjson, onLines);
+  }
+}
+
+// With `ndjson`, stdout is parsed line by line as the CLI prints it (and passed to `onLines`).
+function runPython(args: string[], timeoutMs: number, ndjson = false, onLines?: OnLines): Promise<string> {
   return new Promise((resolve, reject) => {
     const py = process.env.KB_PYTHON || "python3";
     const scriptPath = path.resolve(process.cwd(), "scripts", "kb_cli.py");
 
-    execFile(py, [scriptPath, ...args], { timeout: timeoutMs }, (err, stdout, stderr) => {
+    const child = spawn(py, [scriptPath, ...args], { stdio: ["ignore", "pipe", "pipe"] });
+    const lines = new NdjsonLines(onLines);
+    const stdout: Buffer[] = [];
+    let stderr = "";
+    let failure: Error | null = null;
+    const timer = setTimeout(() => {
+      failure = new Error(`timed out after ${timeoutMs} ms`);
+      child.kill("SIGKILL");
+    }, timeoutMs);
+
+    child.stdout.on("data", (c: Buffer) => {
+      if (!ndjson) return void stdout.push(c);
+      try {
+        lines.push(c);
+      } catch {
+        failure = new Error("invalid NDJSON on stdout");
+        child.kill();
+      }
+    });
+    child.stderr.on("data", (c: Buffer) => (stderr += c.toString()));
+    child.on("error", (err) => (failure = err));
+    child.on("close", (code) => {
+      clearTimeout(timer);
+      let out = "";
+      if (!failure && code === 0) {
+        try {
+          out = ndjson ? lines.end() : Buffer.concat(stdout).toString("utf8").trim();
+        } catch {
+          failure = new Error("invalid NDJSON on stdout");
+        }
+      }
+      const err = failure ?? (code === 0 ? null : new Error(`exit code ${code}`));
       if (err) {
         const msg =
           [
             "KB tool failed.",
             "",
             `Command: ${py} ${scriptPath} ${args.join(" ")}`,
+            `Error: ${err.message}`,
             "",
             "stderr:",
             (stderr || "").trim(),
@@ -25,28 +175,81 @@ function runPython(args: string[], timeoutMs: number): Promise<string> {
           ].join("\n");
         return reject(new Error(msg));
       }
-      resolve((stdout || "").trim());
+      resolve(out);
     });
   });
 }
 
+// Output options shared by the daemon request body and the CLI flags (see kb/output.py).
+// Without a width, snippets use kb/output.py's DEFAULT_SNIPPET_CHARS.
+function outputOptions(params: any): { body: Record<string, unknown>; args: string[] } {
+  const snippet: number | boolean = typeof params.snippet === "number" ? params.snippet : params.snippet !== false;
+  const maxChars = params.max_chars ?? 6000;
+  const fields: string[] | undefined = Array.isArray(params.fields) ? params.fields : undefined;
+  return {
+    body: { fields, snippet, max_chars: maxChars, metrics: false, stream: true },
+    args: [
+      ...(fields ? ["--fields", fields.join(",")] : []),
+      ...(snippet === true ? ["--snippet"] : snippet !== false ? ["--snippet", String(snippet)] : []),
+      "--max-chars",
+      String(maxChars),
+      "--no-metrics",
+    ],
+  };
+}
+
 export default function (api: any) {
   api.registerTool(
     {
       name: "kb_search",
-      description: "Search the local Knowledge Base (RAG). Returns top matching snippets and sources.",
+      description:
+        "Search the local Knowledge Base (RAG). Returns top matching snippets and sources. " +
+        "Pass `queries` to run several related searches in one call (results are returned in the same order). " +
+        "Hits carry a snippet around the best-matching sentence (with highlight offsets) unless `snippet` is false; " +
+        "`max_chars` caps the text returned per query and `fields` picks result keys (e.g. source, score, metadata.page_start).",
       parameters: {
         type: "object",
         additionalProperties: false,
         properties: {
           query: { type: "string", minLength: 1 },
+          queries: { type: "array", items: { type: "string", minLength: 1 }, minItems: 1, maxItems: 1000 },
           top_k: { type: "integer", minimum: 1, maximum: 20 },
+          mode: { type: "string", enum: ["vector", "lexical", "hybrid"] },
+          fields: {
+            type: "array",
+            items: { type: "string", pattern: "^(score|source|chunk_id|text|metadata|snippet)(\\..+)?$" },
+          },
+          snippet: { anyOf: [{ type: "boolean" }, { type: "integer", minimum: 40, maximum: 4000 }] },
+          max_chars: { type: "integer", minimum: 200, maximum: 100000 },
         },
-        required: ["query"],
       },
-      async execute(_id: string, params: any) {
+      // `onUpdate` gets a partial result with the hits received so far, as each one arrives.
+      async execute(_id: string, params: any, _signal?: AbortSignal, onUpdate?: (partial: any) => void) {
         const topK = params.top_k ?? 5;
-        const out = await runPython(["search", "--query", params.query, "--top-k", String(topK), "--json"], 120_000);
+        const mode = params.mode ? ["--mode", params.mode] : [];
+        const output = outputOptions(params);
+        const onLines = onUpdate && ((text: string) => onUpdate({ content: [{ type: "text", text }] }));
+        if (Array.isArray(params.queries) && params.queries.length > 0) {
+          const queries: string[] = params.query ? [params.query, ...params.queries] : params.queries;
+          const out = await runKb(
+            "/search-batch",
+            { queries, top_k: topK, mode: params.mode, ...output.body },
+            ["search-batch", ...queries.flatMap((q) => ["--query", q]), "--top-k", String(topK), ...mode, ...output.args],
+            120_000,
+            true,
+            onLines
+          );
+          return { content: [{ type: "text", text: out }] };
+        }
+        if (!params.query) throw new Error("kb_search needs `query` or `queries`.");
+        const out = await runKb(
+          "/search",
+          { query: params.query, top_k: topK, mode: params.mode, ...output.body },
+          ["search", "--query", params.query, "--top-k", String(topK), ...mode, "--format", "ndjson", ...output.args],
+          120_000,
+          true,
+          onLines
+        );
         return { content: [{ type: "text", text: out }] };
       },
     },
@@ -68,7 +271,12 @@ export default function (api: any) {
       },
       async execute(_id: string, params: any) {
         const ingest = params.ingest === true ? ["--ingest"] : [];
-        const out = await runPython(["add-note", "--text", params.text, "--json", ...ingest], 120_000);
+        const out = await runKb(
+          "/add-note",
+          { text: params.text, ingest: params.ingest === true },
+          ["add-note", "--text", params.text, "--json", ...ingest],
+          120_000
+        );
         return { content: [{ type: "text", text: out }] };
       },
     },
@@ -88,7 +296,7 @@ export default function (api: any) {
       },
       async execute(_id: string, params: any) {
         const cmd = params.rebuild === true ? "rebuild" : "ingest";
-        const out = await runPython([cmd, "--json"], 15 * 60_000);
+        const out = await runKb("/ingest", { rebuild: params.rebuild === true }, [cmd, "--json"], 15 * 60_000);
         return { content: [{ type: "text", text: out }] };
       },
     },
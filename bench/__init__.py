@@ -0,0 +1 @@
+"""Reproducible ingest/search benchmarks (see bench/run.py)."""
@@ -0,0 +1,114 @@
+"""Synthetic corpus generator covering every format kb.loaders supports."""
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import Dict, List
+
+FORMATS = ("txt", "md", "docx", "pdf")
+
+_VOCAB = (
+    "river caravan desert city sultan merchant journey market mosque camel silk spice "
+    "harbor ship monsoon scholar judge palace garden letter ledger coin salt gold road "
+    "winter summer pilgrim traveler guide oasis fortress bridge valley mountain island"
+).split()
+
+
+def make_paragraphs(rng: random.Random, words: int) -> List[str]:
+    paragraphs: List[str] = []
+    remaining = words
+    while remaining > 0:
+        n = min(remaining, rng.randint(40, 120))
+        sentences = []
+        left = n
+        while left > 0:
+            k = min(left, rng.randint(6, 18))
+            s = " ".join(rng.choice(_VOCAB) for _ in range(k))
+            sentences.append(s.capitalize() + ".")
+            left -= k
+        paragraphs.append(" ".join(sentences))
+        remaining -= n
+    return paragraphs
+
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, paragraphs: List[str], lines_per_page: int = 45, width: int = 90) -> None:
+    """Write a minimal text PDF (Helvetica, one content stream per page) without extra deps."""
+    lines: List[str] = []
+    for para in paragraphs:
+        line = ""
+        for word in para.split():
+            if len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.extend([line, ""])
+    pages = [lines[i : i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[""]]
+
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    page_ids = [4 + 2 * i for i in range(n_pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, page in enumerate(pages):
+        content = "BT /F1 10 Tf 14 TL 50 760 Td " + " ".join(f"({_pdf_escape(ln)}) '" for ln in page) + " ET"
+        data = content.encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def write_docx(path: Path, paragraphs: List[str]) -> None:
+    from docx import Document
+
+    doc = Document()
+    for para in paragraphs:
+        doc.add_paragraph(para)
+    doc.save(str(path))
+
+
+def generate_corpus(out_dir: Path, n_docs: int, words_per_doc: int = 800, seed: int = 0) -> Dict[str, int]:
+    """Write `n_docs` documents cycling through txt/md/docx/pdf; returns a count per format."""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    counts = {fmt: 0 for fmt in FORMATS}
+    for i in range(n_docs):
+        fmt = FORMATS[i % len(FORMATS)]
+        # Vary document size so batching and chunking see a realistic spread.
+        paragraphs = make_paragraphs(rng, max(50, int(words_per_doc * rng.uniform(0.25, 2.0))))
+        path = out_dir / f"doc{i:05d}.{fmt}"
+        if fmt == "txt":
+            path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+        elif fmt == "md":
+            path.write_text(f"# Document {i}\n\n" + "\n\n".join(paragraphs), encoding="utf-8")
+        elif fmt == "docx":
+            write_docx(path, paragraphs)
+        else:
+            write_pdf(path, paragraphs)
+        counts[fmt] += 1
+    return counts
+
+
+def make_queries(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(_VOCAB) for _ in range(rng.randint(2, 6))) for _ in range(n)]
@@ -0,0 +1,170 @@
+"""Local stand-in for the embedding providers used by kb.embedder.
+
+Speaks Ollama `/api/embed` and `/api/embeddings` and OpenAI `/v1/embeddings` with
+deterministic bag-of-words hash vectors (similar texts get similar vectors), plus
+configurable latency and error rate. Endpoints listed in `missing` answer 404, like
+older Ollama releases. `GET /stats` returns call and TCP connection counters and
+`POST /reset` clears them.
+
+    python -m bench.fake_embed_server --port 11435 --latency-ms 20 --error-rate 0.01
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def fake_vector(text: str, dim: int = 64) -> List[float]:
+    vec = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()) or [text]:
+        h = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        idx = int.from_bytes(h[:4], "little") % dim
+        vec[idx] += 1.0 if h[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class FakeEmbedState:
+    def __init__(
+        self, dim: int = 64, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0, missing: Iterable[str] = ()
+    ):
+        self.dim = dim
+        self.missing = frozenset(missing)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = {}
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeEmbedState
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.state.count("connections")
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._send(200, dict(self.state.stats))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(n) or b"{}")
+        st = self.state
+        if self.path == "/reset":
+            st.reset()
+            self._send(200, {"ok": True})
+            return
+
+        st.count("requests")
+        st.count(f"requests:{self.path}")
+        if st.latency_ms:
+            time.sleep(st.latency_ms / 1000.0)
+        if self.path not in ("/api/embed", "/api/embeddings", "/v1/embeddings") or self.path in st.missing:
+            self._send(404, {"error": "not found"})
+            return
+        if st.should_fail():
+            st.count("errors")
+            self._send(500, {"error": "injected failure"})
+            return
+
+        if self.path == "/api/embeddings":
+            st.count("inputs")
+            self._send(200, {"embedding": fake_vector(str(body.get("prompt", "")), st.dim)})
+            return
+
+        inputs = body.get("input", "")
+        texts = inputs if isinstance(inputs, list) else [inputs]
+        st.count("inputs", len(texts))
+        vectors = [fake_vector(str(t), st.dim) for t in texts]
+        if self.path == "/api/embed":
+            self._send(200, {"model": body.get("model"), "embeddings": vectors})
+        else:
+            self._send(
+                200,
+                {
+                    "object": "list",
+                    "model": body.get("model"),
+                    "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                },
+            )
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    dim: int = 64,
+    latency_ms: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+    missing: Iterable[str] = (),
+) -> Tuple[ThreadingHTTPServer, FakeEmbedState]:
+    """Start the server on a background thread; call `server.shutdown()` to stop it."""
+    state = FakeEmbedState(dim=dim, latency_ms=latency_ms, error_rate=error_rate, seed=seed, missing=missing)
+    handler = type("FakeEmbedHandler", (_Handler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-embed", daemon=True).start()
+    return server, state
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Fake Ollama/OpenAI embedding server for benchmarks.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=11435)
+    p.add_argument("--dim", type=int, default=64)
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--missing", nargs="*", default=[], help="Endpoints to answer with 404, e.g. /api/embed")
+    args = p.parse_args()
+
+    server, _ = start_server(args.host, args.port, args.dim, args.latency_ms, args.error_rate, args.seed, args.missing)
+    print(f"Fake embedding server on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
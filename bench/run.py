@@ -0,0 +1,244 @@
+"""Ingest/search benchmark against the local fake embedding server.
+
+Each corpus size runs in its own subprocess so peak RSS is measured per size:
+
+    python -m bench.run --sizes 20 100 500 --latency-ms 5
+    python -m bench.run --sizes 100 --compare bench/results/<older>.json
+
+Results are written to bench/results/<timestamp>-<git sha>.json.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_ROOT / "bench" / "results"
+
+
+def _git_sha() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS; loader workers are children.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    if len(samples) == 1:
+        q = [samples[0]] * 99
+    else:
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50_ms": round(q[49] * 1000, 3), "p95_ms": round(q[94] * 1000, 3), "p99_ms": round(q[98] * 1000, 3)}
+
+
+def write_bench_config(root: Path, base_url: str, chunk_size: int, chunk_overlap: int) -> Path:
+    """Write an agent_config.yaml for a throwaway KB under `root` embedding via `base_url`."""
+    k = root / "knowledge"
+    for d in ("raw", "notes", "processed", "index/chroma", "snapshots"):
+        (k / d).mkdir(parents=True, exist_ok=True)
+    (root / "logs").mkdir(exist_ok=True)
+    (k / "notes" / "notes.md").write_text("# Notes\n", encoding="utf-8")
+    cfg = {
+        "agent": {"name": "bench", "role": "bench", "description": "bench"},
+        "mode": "local",
+        "kb": {
+            "paths": {
+                "raw_dir": str(k / "raw"),
+                "notes_file": str(k / "notes" / "notes.md"),
+                "processed_dir": str(k / "processed"),
+                "index_dir": str(k / "index"),
+                "chroma_dir": str(k / "index" / "chroma"),
+                "manifest_path": str(k / "index" / "manifest.json"),
+                "snapshots_dir": str(k / "snapshots"),
+                "logs_dir": str(root / "logs"),
+            },
+            "chunking": {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap},
+            "embeddings": {
+                "local": {"provider": "ollama", "model": "fake-embed", "base_url": base_url, "timeout_seconds": 30},
+            },
+        },
+        "reliability": {"retries": 3, "retry_backoff_seconds": 0.1},
+    }
+    path = root / "agent_config.yaml"
+    path.write_text(yaml.safe_dump(cfg, sort_keys=False), encoding="utf-8")
+    return path
+
+
+def _fetch_stats(base_url: str) -> Dict[str, int]:
+    import requests
+
+    return requests.get(f"{base_url}/stats", timeout=5).json()
+
+
+def run_size(args: argparse.Namespace) -> Dict[str, Any]:
+    """Benchmark one corpus size in this process (invoked through `--worker`)."""
+    import requests
+
+    from bench.corpus import generate_corpus, make_queries
+    from kb.config import load_config
+    from kb.service import KBService
+
+    with tempfile.TemporaryDirectory(prefix="kb-bench-") as tmp:
+        root = Path(tmp)
+        cfg_path = write_bench_config(root, args.base_url, args.chunk_size, args.chunk_overlap)
+        formats = generate_corpus(root / "knowledge" / "raw", args.docs, words_per_doc=args.words, seed=args.seed)
+        os.chdir(root)
+        cfg = load_config(cfg_path)
+
+        requests.post(f"{args.base_url}/reset", timeout=5)
+        service = KBService(cfg)
+        t0 = time.perf_counter()
+        res = service.ingest(rebuild=True)
+        ingest_s = time.perf_counter() - t0
+        ingest_calls = _fetch_stats(args.base_url)
+
+        requests.post(f"{args.base_url}/reset", timeout=5)
+        service.warm_up()
+        search: Dict[str, Any] = {}
+        for mode in args.modes:
+            latencies = []
+            for q in make_queries(args.queries, seed=args.seed + 1):
+                t = time.perf_counter()
+                service.search(q, top_k=5, mode=mode)
+                latencies.append(time.perf_counter() - t)
+            search[mode] = {"queries": len(latencies), **percentiles(latencies)}
+        search_calls = _fetch_stats(args.base_url)
+
+        return {
+            "docs": args.docs,
+            "formats": formats,
+            "chunks": res.get("added_chunks", 0),
+            "failed_docs": res.get("failed_docs", 0),
+            "ingest_seconds": round(ingest_s, 3),
+            "docs_per_second": round(args.docs / ingest_s, 2) if ingest_s > 0 else 0.0,
+            "chunks_per_second": round(res.get("added_chunks", 0) / ingest_s, 2) if ingest_s > 0 else 0.0,
+            "embed_requests": ingest_calls.get("requests", 0),
+            "embed_inputs": ingest_calls.get("inputs", 0),
+            "embed_errors": ingest_calls.get("errors", 0),
+            "search_embed_requests": search_calls.get("requests", 0),
+            "pipelined": res.get("pipelined"),
+            "search": search,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Render per-size ratios (current / baseline) for the headline metrics."""
+    base = {r["docs"]: r for r in baseline.get("runs", [])}
+    lines = [f"Compared with {baseline.get('git_sha', '?')} ({baseline.get('created_at', '?')}):"]
+    for run in current.get("runs", []):
+        old = base.get(run["docs"])
+        if old is None:
+            continue
+        parts = []
+        for key in ("docs_per_second", "chunks_per_second", "peak_rss_mb"):
+            if old.get(key):
+                parts.append(f"{key} x{run[key] / old[key]:.2f}")
+        for mode, s in run["search"].items():
+            o = old.get("search", {}).get(mode)
+            if o and o.get("p95_ms"):
+                parts.append(f"{mode} p95 x{s['p95_ms'] / o['p95_ms']:.2f}")
+        lines.append(f"  {run['docs']} docs: " + ", ".join(parts))
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark KB ingest and search against a fake embedding server.")
+    p.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 400], help="Corpus sizes (documents)")
+    p.add_argument("--words", type=int, default=800, help="Mean words per document")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--modes", nargs="+", default=["vector", "lexical"], choices=["vector", "lexical", "hybrid"])
+    p.add_argument("--chunk-size", type=int, default=900)
+    p.add_argument("--chunk-overlap", type=int, default=150)
+    p.add_argument("--latency-ms", type=float, default=5.0, help="Fake embedding latency per request")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of embed requests answered with 500")
+    p.add_argument("--dim", type=int, default=256)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="", help="Result file (default: bench/results/<time>-<sha>.json)")
+    p.add_argument("--compare", default="", help="Earlier result JSON to compare against")
+    p.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--docs", type=int, default=0, help=argparse.SUPPRESS)
+    p.add_argument("--base-url", default="", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_size(args)))
+        return 0
+
+    from bench.fake_embed_server import start_server
+
+    server, _ = start_server(latency_ms=args.latency_ms, error_rate=args.error_rate, dim=args.dim, seed=args.seed)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")]))}
+    runs = []
+    try:
+        for size in args.sizes:
+            cmd = [
+                sys.executable, "-m", "bench.run", "--worker",
+                "--docs", str(size), "--base-url", base_url,
+                "--words", str(args.words), "--queries", str(args.queries),
+                "--chunk-size", str(args.chunk_size), "--chunk-overlap", str(args.chunk_overlap),
+                "--seed", str(args.seed), "--modes", *args.modes,
+            ]
+            proc = subprocess.run(cmd, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit(f"benchmark run for {size} docs failed")
+            run = json.loads(proc.stdout.strip().splitlines()[-1])
+            runs.append(run)
+            lat = ", ".join(f"{m} p50/p95/p99 {s['p50_ms']}/{s['p95_ms']}/{s['p99_ms']} ms" for m, s in run["search"].items())
+            print(
+                f"{size:>6} docs  {run['chunks']:>7} chunks  {run['docs_per_second']:>8} docs/s  "
+                f"{run['chunks_per_second']:>9} chunks/s  {run['embed_requests']:>6} embed calls  "
+                f"{run['peak_rss_mb']:>7} MB  | {lat}"
+            )
+    finally:
+        server.shutdown()
+
+    result = {
+        "git_sha": _git_sha(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            k: getattr(args, k)
+            for k in ("words", "queries", "modes", "chunk_size", "chunk_overlap", "latency_ms", "error_rate", "dim", "seed")
+        },
+        "runs": runs,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{result['git_sha']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"Wrote {out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        print("\n".join(compare(result, baseline)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
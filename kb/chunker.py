@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import hashlib
+import math
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Sequence
 
 
 @dataclass(frozen=True)
 class Chunk:
     text: str
     chunk_index: int
+    start: int = 0  # offset of `text` in the stripped input text
 
 
 def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[Chunk]:
@@ -25,12 +31,91 @@ def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[Chunk]:
     idx = 0
     while start < len(t):
         end = min(start + chunk_size, len(t))
-        piece = t[start:end].strip()
+        window = t[start:end]
+        piece = window.strip()
         if piece:
-            chunks.append(Chunk(text=piece, chunk_index=idx))
+            lead = len(window) - len(window.lstrip())
+            chunks.append(Chunk(text=piece, chunk_index=idx, start=start + lead))
             idx += 1
         if end == len(t):
             break
         start += step
 
     return chunks
+
+
+# Gear table for the rolling hash: one fixed pseudo-random 64-bit value per byte value.
+_GEAR = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "big") for i in range(256)]
+_MASK64 = (1 << 64) - 1
+_WINDOW = 64  # a gear hash only depends on the last 64 characters
+# Where a chunk may end: after a paragraph break, a sentence end, or a line break.
+_EDGE_RE = re.compile(r"\n\s*\n|[.!?][\"'”’)\]]*\s+|\n")
+
+
+def _cut(t: str, start: int, edges: List[int], mask: int, min_size: int, max_size: int) -> int:
+    limit = min(len(t), start + max_size)
+    lo = start + min_size
+    if lo >= len(t):
+        return len(t)
+    h = 0
+    # Warm the hash on the window before `lo` so cut points depend only on nearby text.
+    for i in range(max(start, lo - _WINDOW), limit):
+        h = ((h << 1) + _GEAR[ord(t[i]) & 0xFF]) & _MASK64
+        if i >= lo and not h & mask:
+            k = bisect_left(edges, i + 1)
+            if k < len(edges) and edges[k] <= limit:
+                return edges[k]
+            break
+    # No cut point before max_size: end at the last sentence edge that fits, else mid-sentence.
+    k = bisect_right(edges, limit) - 1
+    if k >= 0 and edges[k] > lo:
+        return edges[k]
+    return limit
+
+
+def chunk_text_cdc(
+    text: str, chunk_size: int, min_size: Optional[int] = None, max_size: Optional[int] = None
+) -> List[Chunk]:
+    """Content-defined chunking: boundaries come from the text, not from character offsets.
+
+    A gear rolling hash marks cut points (about one per `chunk_size - min_size` characters),
+    each snapped forward to the next paragraph or sentence edge; chunks stay within
+    [min_size, max_size] characters except the last. Because a cut point depends only on
+    the characters just before it, an edit moves the boundaries around it and leaves the
+    chunks elsewhere in the document byte-for-byte unchanged. There is no overlap.
+    """
+    t = (text or "").strip()
+    if not t:
+        return []
+    min_size = chunk_size // 2 if min_size is None else min_size
+    max_size = chunk_size * 2 if max_size is None else max_size
+    if not 0 < min_size <= chunk_size <= max_size:
+        raise ValueError("content chunking needs 0 < min_size <= chunk_size <= max_size")
+
+    bits = max(1, round(math.log2(max(chunk_size - min_size, 2))))
+    mask = ((1 << bits) - 1) << (64 - bits)  # high bits: they depend on the whole window
+    edges = [m.end() for m in _EDGE_RE.finditer(t)]
+
+    chunks: List[Chunk] = []
+    start = 0
+    while start < len(t):
+        end = _cut(t, start, edges, mask, min_size, max_size)
+        window = t[start:end]
+        piece = window.strip()
+        if piece:
+            lead = len(window) - len(window.lstrip())
+            chunks.append(Chunk(text=piece, chunk_index=len(chunks), start=start + lead))
+        start = end
+    return chunks
+
+
+def content_chunk_ids(source_path: str, texts: Sequence[str]) -> List[str]:
+    """Ids that depend only on the source and the chunk text, so unchanged chunks keep theirs."""
+    seen: Counter = Counter()
+    ids = []
+    for text in texts:
+        h = hashlib.sha256(f"{source_path}\n{text}".encode("utf-8")).hexdigest()[:32]
+        n = seen[h]
+        seen[h] += 1
+        ids.append(h if n == 0 else f"{h}-{n}")  # a paragraph repeated within one document
+    return ids
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import dataclasses
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Literal, Optional
@@ -20,17 +22,97 @@ class Paths:
     manifest_path: Path
     snapshots_dir: Path
     logs_dir: Path
+    embed_cache_path: Path
+    lexical_path: Path
+    flat_dir: Path
+    page_cache_path: Path
+    dedup_path: Path
+    # Set by kb.generations.resolve(): the index generation the index paths point into.
+    generation: Optional[str] = None
 
 
 @dataclass(frozen=True)
 class Chunking:
     chunk_size: int
     chunk_overlap: int
+    # "fixed": chunk_size windows every chunk_size - chunk_overlap characters.
+    # "content": content-defined boundaries between min_size and max_size (kb.chunker.chunk_text_cdc).
+    strategy: Literal["fixed", "content"] = "fixed"
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+
+
+SearchMode = Literal["vector", "lexical", "hybrid"]
 
 
 @dataclass(frozen=True)
 class Retrieval:
     top_k_default: int
+    mode: SearchMode = "vector"
+    rrf_k: int = 60
+
+
+@dataclass(frozen=True)
+class VectorStoreConfig:
+    backend: Literal["chroma", "flat"] = "chroma"
+    quantization: Literal["fp16", "int8"] = "fp16"
+
+
+@dataclass(frozen=True)
+class SnapshotsConfig:
+    keep: int = 2
+
+
+@dataclass(frozen=True)
+class DedupConfig:
+    enabled: bool = False
+    max_distance: int = 6
+    min_tokens: int = 8
+
+
+@dataclass(frozen=True)
+class WatchConfig:
+    debounce_seconds: float = 1.0
+    max_delay_seconds: float = 10.0
+
+
+@dataclass(frozen=True)
+class IngestConfig:
+    workers: int = 0
+    max_in_flight: Optional[int] = None
+    pipelined: bool = True
+    embed_concurrency: int = 4
+    queue_size: int = 8
+    pdf_split_pages: int = 64
+    pdf_pages_per_task: int = 16
+    page_cache: bool = True
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+
+
+@dataclass(frozen=True)
+class WebConfig:
+    host: str = "127.0.0.1"
+    port: int = 8099
+    max_concurrency: int = 4
+
+
+@dataclass(frozen=True)
+class EmbedCacheConfig:
+    enabled: bool = True
+    max_entries: int = 200_000
+
+
+@dataclass(frozen=True)
+class SearchCacheConfig:
+    query_vectors: bool = True
+    results: bool = True
+    max_entries: int = 1024
+    ttl_seconds: float = 300.0
 
 
 @dataclass(frozen=True)
@@ -39,6 +121,11 @@ class EmbeddingProviderConfig:
     model: str
     base_url: Optional[str] = None
     timeout_seconds: int = 60
+    batch_size: Optional[int] = None
+    batch_max_tokens: Optional[int] = None
+    rate_limit_rpm: Optional[float] = None
+    rate_limit_tpm: Optional[float] = None
+    pool_size: int = 8
 
 
 @dataclass(frozen=True)
@@ -48,6 +135,21 @@ class KBConfig:
     retrieval: Retrieval
     local_embeddings: EmbeddingProviderConfig
     openai_embeddings: EmbeddingProviderConfig
+    embed_cache: EmbedCacheConfig
+    search_cache: SearchCacheConfig
+    server: ServerConfig
+    web: WebConfig
+    ingest: IngestConfig
+    vector_store: VectorStoreConfig
+    snapshots: SnapshotsConfig
+    watch: WatchConfig
+    dedup: DedupConfig
+
+
+@dataclass(frozen=True)
+class CircuitBreakerConfig:
+    failure_threshold: int = 5  # transient failures in a row before calls fail fast; 0 disables
+    reset_seconds: float = 30.0
 
 
 @dataclass(frozen=True)
@@ -70,12 +172,22 @@ class AppConfig:
     kb: KBConfig
     retries: int
     retry_backoff_seconds: float
+    retry_max_backoff_seconds: float = 30.0
+    circuit_breaker: CircuitBreakerConfig = CircuitBreakerConfig()
 
 
 def _as_path(p: str) -> Path:
     return Path(p).expanduser().resolve()
 
 
+def _opt_int(v: Any) -> Optional[int]:
+    return None if v is None else int(v)
+
+
+def _opt_float(v: Any) -> Optional[float]:
+    return None if v is None else float(v)
+
+
 def load_config(config_path: str | Path = "agent_config.yaml") -> AppConfig:
     cp = Path(config_path).expanduser().resolve()
     if not cp.exists():
@@ -99,21 +211,39 @@ def load_config(config_path: str | Path = "agent_config.yaml") -> AppConfig:
     emb = kb.get("embeddings", {})
     emb_local = emb.get("local", {})
     emb_openai = emb.get("openai", {})
-
+    emb_cache = kb.get("embed_cache", {})
+    search_cache = kb.get("search_cache", {})
+    server = kb.get("server", {})
+    web = kb.get("web", {})
+    ingest_cfg = kb.get("ingest", {})
+    vector_store = kb.get("vector_store", {})
+    snapshots = kb.get("snapshots", {})
+    watch = kb.get("watch", {})
+    dedup = kb.get("dedup", {})
+
+    index_dir = _as_path(paths["index_dir"])
     paths_obj = Paths(
         raw_dir=_as_path(paths["raw_dir"]),
         notes_file=_as_path(paths["notes_file"]),
         processed_dir=_as_path(paths["processed_dir"]),
-        index_dir=_as_path(paths["index_dir"]),
+        index_dir=index_dir,
         chroma_dir=_as_path(paths["chroma_dir"]),
         manifest_path=_as_path(paths["manifest_path"]),
         snapshots_dir=_as_path(paths["snapshots_dir"]),
         logs_dir=_as_path(paths["logs_dir"]),
+        embed_cache_path=_as_path(paths.get("embed_cache_path", index_dir / "embed_cache.sqlite3")),
+        lexical_path=_as_path(paths.get("lexical_path", index_dir / "lexical.sqlite3")),
+        flat_dir=_as_path(paths.get("flat_dir", index_dir / "flat")),
+        page_cache_path=_as_path(paths.get("page_cache_path", index_dir / "page_cache.sqlite3")),
+        dedup_path=_as_path(paths.get("dedup_path", index_dir / "dedup.sqlite3")),
     )
 
     chunk_obj = Chunking(
         chunk_size=int(chunking.get("chunk_size", 900)),
         chunk_overlap=int(chunking.get("chunk_overlap", 150)),
+        strategy=str(chunking.get("strategy", "fixed")),
+        min_size=_opt_int(chunking.get("min_size")),
+        max_size=_opt_int(chunking.get("max_size")),
     )
     if chunk_obj.chunk_size <= 0:
         raise ValueError("chunk_size must be > 0")
@@ -121,27 +251,110 @@ def load_config(config_path: str | Path = "agent_config.yaml") -> AppConfig:
         raise ValueError("chunk_overlap must be >= 0")
     if chunk_obj.chunk_overlap >= chunk_obj.chunk_size:
         raise ValueError("chunk_overlap must be < chunk_size")
-
-    retr_obj = Retrieval(top_k_default=int(retrieval.get("top_k_default", 5)))
+    if chunk_obj.strategy not in ("fixed", "content"):
+        raise ValueError("chunking.strategy must be 'fixed' or 'content'")
+    if chunk_obj.strategy == "content":
+        chunk_obj = dataclasses.replace(
+            chunk_obj,
+            min_size=chunk_obj.min_size or chunk_obj.chunk_size // 2,
+            max_size=chunk_obj.max_size or chunk_obj.chunk_size * 2,
+        )
+        if not 0 < chunk_obj.min_size <= chunk_obj.chunk_size <= chunk_obj.max_size:
+            raise ValueError("chunking needs 0 < min_size <= chunk_size <= max_size")
+
+    retr_obj = Retrieval(
+        top_k_default=int(retrieval.get("top_k_default", 5)),
+        mode=str(retrieval.get("mode", "vector")),
+        rrf_k=int(retrieval.get("rrf_k", 60)),
+    )
+    if retr_obj.mode not in ("vector", "lexical", "hybrid"):
+        raise ValueError("retrieval.mode must be 'vector', 'lexical' or 'hybrid'")
 
     local_emb = EmbeddingProviderConfig(
         provider="ollama",
         model=str(emb_local.get("model", "nomic-embed-text")),
         base_url=str(emb_local.get("base_url", "http://127.0.0.1:11434")),
         timeout_seconds=int(emb_local.get("timeout_seconds", 60)),
+        batch_size=_opt_int(emb_local.get("batch_size")),
+        batch_max_tokens=_opt_int(emb_local.get("batch_max_tokens")),
+        rate_limit_rpm=_opt_float((emb_local.get("rate_limit") or {}).get("rpm")),
+        rate_limit_tpm=_opt_float((emb_local.get("rate_limit") or {}).get("tpm")),
+        pool_size=max(1, int(emb_local.get("pool_size", 8))),
     )
     openai_emb = EmbeddingProviderConfig(
         provider=str(emb_openai.get("provider", "openai")),
         model=str(emb_openai.get("model", "text-embedding-3-small")),
         timeout_seconds=int(emb_openai.get("timeout_seconds", 60)),
+        batch_size=_opt_int(emb_openai.get("batch_size")),
+        batch_max_tokens=_opt_int(emb_openai.get("batch_max_tokens")),
+        rate_limit_rpm=_opt_float((emb_openai.get("rate_limit") or {}).get("rpm")),
+        rate_limit_tpm=_opt_float((emb_openai.get("rate_limit") or {}).get("tpm")),
+        pool_size=max(1, int(emb_openai.get("pool_size", 8))),
     )
 
+    cache_obj = EmbedCacheConfig(
+        enabled=bool(emb_cache.get("enabled", True)),
+        max_entries=int(emb_cache.get("max_entries", 200_000)),
+    )
+    if cache_obj.max_entries <= 0:
+        raise ValueError("embed_cache.max_entries must be > 0")
+
+    vs_obj = VectorStoreConfig(
+        backend=str(vector_store.get("backend", "chroma")),
+        quantization=str(vector_store.get("quantization", "fp16")),
+    )
+    if vs_obj.backend not in ("chroma", "flat"):
+        raise ValueError("vector_store.backend must be 'chroma' or 'flat'")
+    if vs_obj.quantization not in ("fp16", "int8"):
+        raise ValueError("vector_store.quantization must be 'fp16' or 'int8'")
+
+    dedup_obj = DedupConfig(
+        enabled=bool(dedup.get("enabled", False)),
+        max_distance=int(dedup.get("max_distance", 6)),
+        min_tokens=max(1, int(dedup.get("min_tokens", 8))),
+    )
+    if not 0 <= dedup_obj.max_distance <= 16:
+        raise ValueError("dedup.max_distance must be between 0 and 16 (bits of a 64-bit SimHash)")
+
     kb_obj = KBConfig(
         paths=paths_obj,
         chunking=chunk_obj,
         retrieval=retr_obj,
         local_embeddings=local_emb,
         openai_embeddings=openai_emb,
+        embed_cache=cache_obj,
+        search_cache=SearchCacheConfig(
+            query_vectors=bool(search_cache.get("query_vectors", True)),
+            results=bool(search_cache.get("results", True)),
+            max_entries=max(1, int(search_cache.get("max_entries", 1024))),
+            ttl_seconds=max(0.0, float(search_cache.get("ttl_seconds", 300.0))),
+        ),
+        server=ServerConfig(
+            host=str(server.get("host", "127.0.0.1")),
+            port=int(server.get("port", 8765)),
+        ),
+        web=WebConfig(
+            host=str(web.get("host", "127.0.0.1")),
+            port=int(web.get("port", 8099)),
+            max_concurrency=max(1, int(web.get("max_concurrency", 4))),
+        ),
+        ingest=IngestConfig(
+            workers=int(ingest_cfg.get("workers", min(4, os.cpu_count() or 1))),
+            max_in_flight=_opt_int(ingest_cfg.get("max_in_flight")),
+            pipelined=bool(ingest_cfg.get("pipelined", True)),
+            embed_concurrency=max(1, int(ingest_cfg.get("embed_concurrency", 4))),
+            queue_size=max(1, int(ingest_cfg.get("queue_size", 8))),
+            pdf_split_pages=max(0, int(ingest_cfg.get("pdf_split_pages", 64))),
+            pdf_pages_per_task=max(1, int(ingest_cfg.get("pdf_pages_per_task", 16))),
+            page_cache=bool(ingest_cfg.get("page_cache", True)),
+        ),
+        vector_store=vs_obj,
+        snapshots=SnapshotsConfig(keep=max(0, int(snapshots.get("keep", 2)))),
+        watch=WatchConfig(
+            debounce_seconds=max(0.0, float(watch.get("debounce_seconds", 1.0))),
+            max_delay_seconds=max(0.0, float(watch.get("max_delay_seconds", 10.0))),
+        ),
+        dedup=dedup_obj,
     )
 
     oc_obj = OpenClawConfig(
@@ -156,6 +369,14 @@ def load_config(config_path: str | Path = "agent_config.yaml") -> AppConfig:
     rel = data.get("reliability", {})
     retries = int(rel.get("retries", 3))
     backoff = float(rel.get("retry_backoff_seconds", 1.5))
+    max_backoff = float(rel.get("retry_max_backoff_seconds", 30.0))
+    if retries < 0 or backoff < 0 or max_backoff < backoff:
+        raise ValueError("reliability needs retries >= 0 and 0 <= retry_backoff_seconds <= retry_max_backoff_seconds")
+    breaker = rel.get("circuit_breaker", {})
+    breaker_obj = CircuitBreakerConfig(
+        failure_threshold=max(0, int(breaker.get("failure_threshold", 5))),
+        reset_seconds=max(0.0, float(breaker.get("reset_seconds", 30.0))),
+    )
 
     return AppConfig(
         agent_name=str(agent.get("name", "KnowledgeBot")),
@@ -166,4 +387,6 @@ def load_config(config_path: str | Path = "agent_config.yaml") -> AppConfig:
         kb=kb_obj,
         retries=retries,
         retry_backoff_seconds=backoff,
+        retry_max_backoff_seconds=max_backoff,
+        circuit_breaker=breaker_obj,
     )
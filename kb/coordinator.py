@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from kb.config import AppConfig
+
+# Files in kb.paths.index_dir (shared by every generation):
+#
+#   ingest.lock         flock held by the process running an ingest
+#   ingest.state.json   request/run sequence numbers, the pending and running scopes, recent runs
+#   ingest.state.lock   flock held while ingest.state.json is read and rewritten
+#
+# Searches never touch these files.
+
+IngestFn = Callable[[bool, bool, Optional[List[Path]]], Dict[str, Any]]
+
+_EMPTY_STATE: Dict[str, Any] = {
+    "requested": 0,
+    "completed": 0,
+    "pending": None,
+    "active": None,
+    "last": None,
+    "runs": [],
+}
+
+# Finished runs kept in the state file, so a waiter learns the outcome of the run that
+# covered its own request even if later runs finished (or failed) in the meantime.
+_KEEP_RUNS = 16
+
+
+class IngestTimeout(TimeoutError):
+    pass
+
+
+def _runner_id() -> str:
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def _scope(paths: Optional[Iterable[Path]], rebuild: bool = False, resume: bool = False) -> Dict[str, Any]:
+    return {
+        "full": paths is None,
+        "paths": sorted({str(Path(p).absolute()) for p in paths or []}),
+        "rebuild": rebuild,
+        "resume": resume,
+    }
+
+
+def _union(a: Optional[Dict[str, Any]], b: Dict[str, Any]) -> Dict[str, Any]:
+    """One ingest that does the work of both scopes (a rebuild or full scan covers any paths)."""
+    if a is None:
+        return b
+    out = {k: a[k] or b[k] for k in ("full", "rebuild", "resume")}
+    out["paths"] = [] if out["full"] or out["rebuild"] else sorted(set(a["paths"]) | set(b["paths"]))
+    return out
+
+
+class IngestCoordinator:
+    """Serializes ingests across processes and folds concurrent requests into one follow-up run.
+
+    `request()` records what should be ingested and returns a sequence number. Whoever
+    holds ingest.lock runs ingests until nothing is pending, each run covering every
+    request made before it started: N requests made during one ingest cost one more run,
+    not N. `wait()` blocks until the run covering a sequence number finished (taking over
+    the runs itself if nobody else is running them); `status()` polls without blocking.
+    """
+
+    def __init__(self, cfg: AppConfig, poll_seconds: float = 0.2):
+        index_dir = cfg.kb.paths.index_dir
+        index_dir.mkdir(parents=True, exist_ok=True)
+        self.lock_path = index_dir / "ingest.lock"
+        self.state_path = index_dir / "ingest.state.json"
+        self._state_lock_path = index_dir / "ingest.state.lock"
+        self.poll_seconds = poll_seconds
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, Any]]:
+        fd = os.open(self._state_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = {**_EMPTY_STATE, **json.loads(self.state_path.read_text(encoding="utf-8"))}
+            except (FileNotFoundError, ValueError):
+                state = dict(_EMPTY_STATE)
+            before = json.dumps(state, sort_keys=True)
+            yield state
+            if json.dumps(state, sort_keys=True) != before:
+                tmp = self.state_path.with_name(f".{self.state_path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+                os.replace(tmp, self.state_path)
+        finally:
+            os.close(fd)  # releases the flock
+
+    def request(self, paths: Optional[Iterable[Path]] = None, rebuild: bool = False, resume: bool = False) -> int:
+        """Ask for an ingest of `paths` (None: everything); returns the request's sequence number."""
+        with self._state() as state:
+            state["requested"] += 1
+            state["pending"] = _union(state["pending"], _scope(paths, rebuild, resume))
+            return state["requested"]
+
+    def status(self, seq: Optional[int] = None) -> Dict[str, Any]:
+        with self._state() as state:
+            out = {
+                "requested": state["requested"],
+                "completed": state["completed"],
+                "pending": state["pending"],
+                "running": self.running(),
+                "last": state["last"],
+            }
+        if seq is not None:
+            out["seq"] = seq
+            out["done"] = state["completed"] >= seq
+        return out
+
+    def running(self) -> bool:
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+    def run_pending(self, ingest_fn: IngestFn) -> Optional[Dict[str, Any]]:
+        """Run pending ingests if no other process is; returns the last run's record, else None.
+
+        `ingest_fn(rebuild, resume, paths)` does the work (paths None: a full scan).
+        """
+        last = None
+        while True:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return last  # the running process picks our request up after its current run
+                while True:
+                    with self._state() as state:
+                        if state["active"] is not None:  # left behind by a runner that died
+                            state["pending"] = _union(state["pending"], state["active"])
+                        scope, covers = state["pending"], state["requested"]
+                        state["pending"], state["active"] = None, scope
+                    if scope is None:
+                        break
+                    last = self._run(ingest_fn, scope, covers)
+            finally:
+                os.close(fd)
+            # A request that found the lock taken just before we let go is ours to run.
+            with self._state() as state:
+                if state["pending"] is None:
+                    return last
+
+    def _run(self, ingest_fn: IngestFn, scope: Dict[str, Any], covers: int) -> Dict[str, Any]:
+        paths = None if scope["full"] or scope["rebuild"] else [Path(p) for p in scope["paths"]]
+        record: Dict[str, Any] = {"covers": covers, "runner": _runner_id(), "scope": scope}
+        t0 = time.time()
+        try:
+            record["result"] = ingest_fn(scope["rebuild"], scope["resume"], paths)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            self._finish(record, covers, t0)
+            raise
+        self._finish(record, covers, t0)
+        return record
+
+    def _finish(self, record: Dict[str, Any], covers: int, t0: float) -> None:
+        record["seconds"] = round(time.time() - t0, 3)
+        with self._state() as state:
+            state["completed"] = max(state["completed"], covers)
+            state["active"] = None
+            if "error" in record:
+                # Its waiters get the failed record, but the next run retries its paths.
+                state["pending"] = _union(state["pending"], record["scope"])
+            state["last"] = record
+            state["runs"] = (state["runs"] + [record])[-_KEEP_RUNS:]
+
+    def wait(self, seq: int, ingest_fn: IngestFn, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Block until request `seq` is covered by a finished run and return that run's record.
+
+        The record is that of the first run covering `seq`, the one that did its work; later
+        runs (successful or not) do not change it. If the process that was running ingests
+        is gone, the waiter runs the pending ones.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._state() as state:
+                if state["completed"] >= seq and state["last"] is not None:
+                    # Runs are kept in order and cover ever higher sequence numbers.
+                    return next((r for r in state["runs"] if r["covers"] >= seq), state["last"])
+            if not self.running() and self.run_pending(ingest_fn) is not None:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                raise IngestTimeout(f"Ingest request {seq} was not finished within {timeout}s.")
+            time.sleep(self.poll_seconds)
+
+    def ingest(
+        self,
+        ingest_fn: IngestFn,
+        paths: Optional[Iterable[Path]] = None,
+        rebuild: bool = False,
+        resume: bool = False,
+        wait: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Request an ingest and run it here unless another process is already ingesting.
+
+        Returns the finished run's result with an `ingest_run` summary; with `wait=False`
+        and another process running, returns right away with the sequence number to poll.
+        """
+        seq = self.request(paths, rebuild=rebuild, resume=resume)
+        if not wait:
+            self.run_pending(ingest_fn)
+            status = self.status(seq)
+            if not status["done"]:
+                return {"ingest_run": {"seq": seq, "done": False, "running": status["running"]}}
+        record = self.wait(seq, ingest_fn, timeout=timeout)  # our own failed run raises here
+        if "error" in record:
+            raise RuntimeError(f"Ingest run covering request {seq} failed: {record['error']}")
+        out = dict(record.get("result") or {})
+        out["ingest_run"] = {
+            "seq": seq,
+            "done": True,
+            "covers": record["covers"],
+            "ran_here": record["runner"] == _runner_id(),
+            "seconds": record["seconds"],
+        }
+        return out
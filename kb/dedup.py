@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from kb.lexical import tokenize
+
+_BITS = 64
+_SHINGLE = 3
+
+
+def simhash(text: str, min_tokens: int = 8) -> Optional[int]:
+    """64-bit SimHash of the word 3-shingles of `text`; None for texts too short to compare.
+
+    Near-identical texts (a reflowed footer, a note pasted twice with a typo fixed) differ
+    in few bits, so the Hamming distance between hashes approximates their similarity.
+    """
+    tokens = tokenize(text)
+    if len(tokens) < max(min_tokens, 1):
+        return None
+    shingles = {" ".join(tokens[i : i + _SHINGLE]) for i in range(max(1, len(tokens) - _SHINGLE + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles],
+        dtype=">u8",
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)  # most significant bit first
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+    return int("".join("1" if v > 0 else "0" for v in votes), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _signed(h: int) -> int:
+    # SQLite integers are signed 64-bit.
+    return h - (1 << _BITS) if h >= 1 << (_BITS - 1) else h
+
+
+def _unsigned(h: int) -> int:
+    return h + (1 << _BITS) if h < 0 else h
+
+
+def _bands(h: int, n: int) -> List[Tuple[int, int]]:
+    # Pigeonhole: two hashes within n - 1 bits of each other agree exactly on at least one of n bands.
+    edges = [round(i * _BITS / n) for i in range(n + 1)]
+    return [(i, (h >> edges[i]) & ((1 << (edges[i + 1] - edges[i])) - 1)) for i in range(n)]
+
+
+class DedupIndex:
+    """Near-duplicate chunk registry kept in SQLite next to the vector store.
+
+    Every stored (canonical) chunk is registered with its SimHash, split into
+    `max_distance + 1` bands for lookup. A new chunk within `max_distance` bits of a
+    canonical one is not embedded or stored; it is recorded as a duplicate of it, with its
+    text and metadata, so search can report every place the text occurs and the duplicate
+    can be promoted if its canonical chunk goes away.
+    """
+
+    def __init__(self, path: Path, max_distance: int = 6, min_tokens: int = 8):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self._n_bands = max_distance + 1
+        self._lock = threading.Lock()
+        # Canonical chunks assigned this run but not yet written: id -> (source_path, hash).
+        self._pending: Dict[str, Tuple[str, int]] = {}
+        self._pending_bands: Dict[Tuple[int, int], List[str]] = {}
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS canonical (
+                chunk_id TEXT PRIMARY KEY,
+                source_path TEXT NOT NULL,
+                simhash INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS canonical_source ON canonical(source_path);
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (band, value, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                source_path TEXT NOT NULL,
+                simhash INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS duplicates_canonical ON duplicates(canonical_id);
+            CREATE INDEX IF NOT EXISTS duplicates_source ON duplicates(source_path);
+            """
+        )
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'bands'").fetchone()
+        if row is None or int(row[0]) != self._n_bands:
+            self._rebuild_bands()
+        self._conn.commit()
+
+    def _rebuild_bands(self) -> None:
+        self._conn.execute("DELETE FROM bands")
+        for cid, h in self._conn.execute("SELECT chunk_id, simhash FROM canonical").fetchall():
+            self._insert_bands(cid, _unsigned(h))
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bands', ?)", (str(self._n_bands),))
+
+    def _insert_bands(self, chunk_id: str, h: int) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO bands (band, value, chunk_id) VALUES (?, ?, ?)",
+            [(b, v, chunk_id) for b, v in _bands(h, self._n_bands)],
+        )
+
+    def _nearest(self, h: int, exclude_source: str) -> Optional[str]:
+        best: Optional[Tuple[int, str]] = None
+        seen = set()
+        for band in _bands(h, self._n_bands):
+            stored = self._conn.execute(
+                "SELECT c.chunk_id, c.source_path, c.simhash FROM bands b JOIN canonical c USING (chunk_id)"
+                " WHERE b.band = ? AND b.value = ?",
+                band,
+            ).fetchall()
+            pending = [(cid, *self._pending[cid]) for cid in self._pending_bands.get(band, ())]
+            for cid, source, other in stored + pending:
+                if cid in seen or (source == exclude_source and cid not in self._pending):
+                    continue
+                seen.add(cid)
+                d = hamming(h, _unsigned(other))
+                if d <= self.max_distance and (best is None or (d, cid) < best):
+                    best = (d, cid)
+        return best[1] if best else None
+
+    def assign(self, source_path: str, ids: Sequence[str], texts: Sequence[str]) -> List[Optional[str]]:
+        """For each chunk, the id of the canonical chunk it duplicates, or None if it is new.
+
+        Chunks previously stored for `source_path` are not candidates (they are about to be
+        replaced); new chunks become candidates for the rest of the run straight away.
+        """
+        out: List[Optional[str]] = []
+        with self._lock:
+            for cid, text in zip(ids, texts):
+                h = simhash(text, self.min_tokens)
+                canonical = None if h is None else self._nearest(h, exclude_source=source_path)
+                if canonical is None and h is not None:
+                    self._pending[cid] = (source_path, h)
+                    for band in _bands(h, self._n_bands):
+                        self._pending_bands.setdefault(band, []).append(cid)
+                out.append(canonical)
+        return out
+
+    def _forget_pending(self, chunk_id: str) -> None:
+        entry = self._pending.pop(chunk_id, None)
+        if entry is None:
+            return
+        for band in _bands(entry[1], self._n_bands):
+            ids = self._pending_bands.get(band, [])
+            if chunk_id in ids:
+                ids.remove(chunk_id)
+
+    def _drop_source(self, source_path: str) -> None:
+        old = [cid for (cid,) in self._conn.execute("SELECT chunk_id FROM canonical WHERE source_path = ?", (source_path,))]
+        self._conn.executemany("DELETE FROM bands WHERE chunk_id = ?", [(cid,) for cid in old])
+        self._conn.execute("DELETE FROM canonical WHERE source_path = ?", (source_path,))
+        self._conn.execute("DELETE FROM duplicates WHERE source_path = ?", (source_path,))
+
+    def drop_source(self, source_path: str) -> None:
+        """Forget a removed document; duplicates elsewhere of its chunks become orphans()."""
+        with self._lock, self._conn:
+            self._drop_source(source_path)
+
+    def replace_source(
+        self,
+        source_path: str,
+        canonical_ids: Sequence[str],
+        texts: Sequence[str],
+        duplicates: Sequence[Tuple[str, str, str, Dict[str, Any]]],
+    ) -> None:
+        """Record what was stored for `source_path`: its canonical chunks and its duplicates
+        as (chunk_id, canonical_id, text, metadata)."""
+        with self._lock, self._conn:
+            self._drop_source(source_path)
+            for cid, text in zip(canonical_ids, texts):
+                pending = self._pending.get(cid)
+                h = pending[1] if pending else simhash(text, self.min_tokens)
+                self._forget_pending(cid)
+                if h is None:
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO canonical (chunk_id, source_path, simhash) VALUES (?, ?, ?)",
+                    (cid, source_path, _signed(h)),
+                )
+                self._insert_bands(cid, h)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO duplicates (chunk_id, canonical_id, source_path, simhash, text, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (cid, canonical, source_path, _signed(simhash(text, self.min_tokens) or 0), text, json.dumps(meta))
+                    for cid, canonical, text, meta in duplicates
+                ],
+            )
+
+    def orphans(self) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        """Duplicates whose canonical chunk is gone: (chunk_id, old canonical_id, text, metadata)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.chunk_id, d.canonical_id, d.text, d.metadata FROM duplicates d"
+                " WHERE NOT EXISTS (SELECT 1 FROM canonical c WHERE c.chunk_id = d.canonical_id)"
+                " ORDER BY d.canonical_id, d.source_path, d.chunk_id"
+            ).fetchall()
+        return [(cid, canonical, text, json.loads(meta)) for cid, canonical, text, meta in rows]
+
+    def promote(self, chunk_id: str, others: Sequence[str]) -> None:
+        """Make duplicate `chunk_id` canonical (it has just been stored) and point `others` at it."""
+        with self._lock, self._conn:
+            source, h = self._conn.execute(
+                "SELECT source_path, simhash FROM duplicates WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            self._conn.execute("DELETE FROM duplicates WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO canonical (chunk_id, source_path, simhash) VALUES (?, ?, ?)",
+                (chunk_id, source, h),
+            )
+            self._insert_bands(chunk_id, _unsigned(h))
+            self._conn.executemany(
+                "UPDATE duplicates SET canonical_id = ? WHERE chunk_id = ?", [(chunk_id, o) for o in others]
+            )
+
+    def locations(self, chunk_ids: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Metadata of the duplicates of each of `chunk_ids` (only ids that have any)."""
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        ids = list(dict.fromkeys(chunk_ids))
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i : i + 500]
+                marks = ",".join("?" * len(part))
+                for canonical, meta in self._conn.execute(
+                    f"SELECT canonical_id, metadata FROM duplicates WHERE canonical_id IN ({marks})"
+                    " ORDER BY source_path, chunk_id",
+                    part,
+                ):
+                    out.setdefault(canonical, []).append(json.loads(meta))
+        return out
+
+    def count_duplicates(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM duplicates").fetchone()[0]
+
+    def reset(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript("DELETE FROM bands; DELETE FROM canonical; DELETE FROM duplicates;")
+            self._pending.clear()
+            self._pending_bands.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
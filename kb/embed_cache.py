@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from kb.embedder import _normalize
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk cache of embeddings, keyed by (embedder, normalized text hash).
+
+    Vectors are stored as float32 blobs in SQLite and evicted least-recently-used
+    once the cache grows past `max_entries`.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 200_000):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clock = 0.0
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " embedder TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (embedder, text_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _tick(self) -> float:
+        # Strictly increasing timestamps keep LRU order stable within one process.
+        self._clock = max(time.time(), self._clock + 1e-6)
+        return self._clock
+
+    def get_many(self, embedder: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings WHERE embedder = ? AND text_hash IN ({marks})",
+                    [embedder, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = blob
+            if found:
+                now = self._tick()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE embedder = ? AND text_hash = ?",
+                    [(now, embedder, h) for h in found],
+                )
+                self._conn.commit()
+
+        out: List[Optional[List[float]]] = []
+        for k in keys:
+            blob = found.get(k)
+            if blob is None:
+                self.misses += 1
+                out.append(None)
+            else:
+                self.hits += 1
+                vec = array("f")
+                vec.frombytes(blob)
+                out.append(vec.tolist())
+        return out
+
+    def put_many(self, embedder: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        with self._lock:
+            now = self._tick()
+        rows = [
+            (embedder, text_hash(t), len(v), array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (embedder, text_hash, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        n = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = n - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE (embedder, text_hash) IN "
+                "(SELECT embedder, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,18 +1,39 @@
 from __future__ import annotations
 
+import logging
 import os
+import threading
 from dataclasses import dataclass
-from typing import List, Literal, Optional
-
-import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal, Mapping, Optional, Tuple
 
 import requests
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
+from requests.adapters import HTTPAdapter
+
+from kb.metrics import Metrics
+from kb.ratelimit import RateLimiter, get_limiter, parse_retry_after
+from kb.reliability import CircuitBreaker, CircuitOpenError, RetryPolicy, get_breaker, is_rejected_input, is_retryable
 
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+logger = logging.getLogger("kb")
 
 Provider = Literal["ollama", "openai", "gemini"]
 
+# Per-provider request limits: (max inputs per request, max estimated tokens per request).
+# OpenAI accepts up to 2048 inputs / 300k tokens, Gemini batchEmbedContents up to 100 requests.
+DEFAULT_BATCH_LIMITS = {
+    "openai": (256, 250_000),
+    "gemini": (100, 100_000),
+    "ollama": (64, 32_000),
+}
+
+# Used when kb.embeddings.*.rate_limit is not configured: (requests/min, tokens/min).
+# Gemini's free tier allows roughly 13 embedding requests per minute.
+DEFAULT_RATE_LIMITS = {
+    "gemini": (13.0, None),
+}
+
 
 @dataclass(frozen=True)
 class EmbedderSpec:
@@ -20,85 +41,308 @@ class EmbedderSpec:
     model: str
     base_url: Optional[str] = None
     timeout_seconds: int = 60
+    batch_size: Optional[int] = None
+    batch_max_tokens: Optional[int] = None
+    rate_limit_rpm: Optional[float] = None
+    rate_limit_tpm: Optional[float] = None
+    pool_size: int = 8
 
 
 class EmbeddingError(RuntimeError):
     pass
 
 
+class InvalidInputError(EmbeddingError):
+    """An input that cannot be embedded whatever the provider's state (e.g. empty text)."""
+
+
 def _normalize(text: str) -> str:
     return " ".join((text or "").split()).strip()
 
 
+def _openai_client(**kwargs: Any) -> "OpenAI":
+    # The openai package takes about a second to import, so only pay for it when it is used.
+    from openai import OpenAI
+
+    return OpenAI(**kwargs)
+
+
+def _http_session(pool_size: int) -> requests.Session:
+    # Keep-alive connections shared by every request this embedder makes (and its threads).
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, pool_size))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Ollama routes, probed once per Embedder: native endpoints first, then the OpenAI-compatible /v1.
+_OLLAMA_ONE_ROUTES = ("/api/embeddings", "/api/embed", "/v1")
+_OLLAMA_BATCH_ROUTES = ("/api/embed", "/v1")
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 chars per token) that is good enough for sizing requests.
+    return max(1, len(text) // 4)
+
+
 class Embedder:
-    def __init__(self, spec: EmbedderSpec, retries: int = 3):
+    def __init__(
+        self,
+        spec: EmbedderSpec,
+        retries: int = 3,
+        policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
         self.spec = spec
         self.retries = retries
+        self.policy = policy or RetryPolicy(retries=retries)
+        # Shared by every embedder for the same provider endpoint in this process.
+        self.breaker = breaker or get_breaker(f"{spec.provider}:{spec.base_url or ''}", 5, 30.0)
 
+        self.http = _http_session(spec.pool_size)
         if spec.provider == "openai":
-            self.oa = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+            self.oa = _openai_client(api_key=os.environ.get("OPENAI_API_KEY"))
         else:
             self.oa = None
         self._gemini_api_key: Optional[str] = os.environ.get("GOOGLE_API_KEY")
+        # Ollama: the route that answered for single and batch requests, and the /v1 client.
+        self._ollama_routes: Dict[str, str] = {}
+        self._compat_client: Optional["OpenAI"] = None
+        self._client_lock = threading.Lock()
+
+        default_items, default_tokens = DEFAULT_BATCH_LIMITS.get(spec.provider, (32, 16_000))
+        self.batch_size = max(1, spec.batch_size or default_items)
+        self.batch_max_tokens = max(1, spec.batch_max_tokens or default_tokens)
+
+        default_rpm, default_tpm = DEFAULT_RATE_LIMITS.get(spec.provider, (None, None))
+        rpm = spec.rate_limit_rpm if spec.rate_limit_rpm is not None else default_rpm
+        tpm = spec.rate_limit_tpm if spec.rate_limit_tpm is not None else default_tpm
+        self.limiter: RateLimiter = get_limiter(f"{spec.provider}:{spec.base_url or ''}", rpm or None, tpm or None)
+        # Lifetime counters; callers diff them around a run (see kb.pipeline).
+        self.metrics = Metrics()
+
+    def _check_credentials(self) -> None:
+        # Before _throttle(), so a config error neither spends rate-limit budget nor sleeps.
+        if self.spec.provider == "openai" and not os.environ.get("OPENAI_API_KEY"):
+            raise EmbeddingError("OPENAI_API_KEY is missing. Put it in .env then run make mode-cloud.")
+        if self.spec.provider == "gemini" and not self._gemini_api_key:
+            raise EmbeddingError("GOOGLE_API_KEY is missing. Get a free key at https://aistudio.google.com/apikey and add it to .env.")
+
+    def _throttle(self, texts: List[str]) -> None:
+        tokens = sum(estimate_tokens(t) for t in texts)
+        m = self.metrics
+        m.inc("embed_requests")
+        m.inc("embed_inputs", len(texts))
+        m.inc("embed_tokens_sent", tokens)
+        m.inc("embed_bytes_sent", sum(len(t.encode("utf-8")) for t in texts))
+        self.limiter.acquire(tokens=tokens)
+
+    def _check_rate_limited(self, status_code: int, headers: Mapping[str, Any]) -> None:
+        if status_code == 429:
+            self.limiter.penalize(parse_retry_after(headers.get("Retry-After")) or 1.0)
+
+    def close(self) -> None:
+        self.http.close()
+        if self._compat_client is not None:
+            self._compat_client.close()
+
+    def _ollama_base(self) -> str:
+        return (self.spec.base_url or "http://127.0.0.1:11434").rstrip("/")
+
+    def _ollama_compat(self) -> "OpenAI":
+        with self._client_lock:
+            if self._compat_client is None:
+                self._compat_client = _openai_client(
+                    base_url=f"{self._ollama_base()}/v1", api_key="ollama-local", timeout=self.spec.timeout_seconds
+                )
+            return self._compat_client
+
+    def _ollama_call(self, kind: str, routes: Tuple[str, ...], texts: List[str]) -> List[List[float]]:
+        """Embed via the first Ollama route that exists, remembering it for later calls.
+
+        A 404 from a native route moves on to the next one; any other answer means the
+        route exists, so its errors (429, 5xx) are raised rather than masked by a fallback.
+        """
+        base = self._ollama_base()
+        cached = self._ollama_routes.get(kind)
+        last_error: Optional[Exception] = None
+        for route in (cached,) if cached else routes:
+            if route == "/v1":
+                try:
+                    resp = self._openai_embed(self._ollama_compat(), texts if kind == "batch" else texts[0])
+                except Exception as e:
+                    last_error = e
+                    break
+                self._ollama_routes[kind] = route
+                return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+            url = f"{base}{route}"
+            if route == "/api/embeddings":
+                payload: Dict[str, Any] = {"model": self.spec.model, "prompt": texts[0]}
+            else:
+                payload = {"model": self.spec.model, "input": texts}
+            try:
+                r = self.http.post(url, json=payload, timeout=self.spec.timeout_seconds)
+            except requests.RequestException as e:
+                last_error = e
+                continue
+            if r.status_code == 404:
+                self.metrics.inc("embed_route_misses")
+                continue
+            self._check_rate_limited(r.status_code, r.headers)
+            r.raise_for_status()
+            data = r.json()
+            embs = [data["embedding"]] if route == "/api/embeddings" and data.get("embedding") else data.get("embeddings") or []
+            if len(embs) != len(texts):
+                raise EmbeddingError(f"Ollama returned {len(embs)} embeddings for {len(texts)} inputs from {url}.")
+            self._ollama_routes[kind] = route
+            return embs
+
+        if cached:
+            # The server changed under us (e.g. an Ollama upgrade); probe again next time.
+            self._ollama_routes.pop(kind, None)
+        raise EmbeddingError(
+            "Failed to embed via Ollama.\n"
+            f"- Is Ollama running on {base}?\n"
+            f"- Did you pull the embeddings model: ollama pull {self.spec.model}?\n"
+            f"- Raw error: {last_error or 'no embeddings endpoint found'}"
+        ) from last_error
+
+    def _openai_embed(self, client: "OpenAI", inputs: Any) -> Any:
+        from openai import RateLimitError
+
+        try:
+            return client.embeddings.create(model=self.spec.model, input=inputs)
+        except RateLimitError as e:
+            self._check_rate_limited(429, e.response.headers)
+            raise
+
+    def _call(self, fn: Callable[[], Any]) -> Any:
+        """Call the provider under the retry policy and the circuit breaker."""
+
+        def retried(e: BaseException, wait: float) -> None:
+            self.metrics.inc("embed_retries")
+            logger.warning("Embedding request failed (%s); retrying in %.1fs.", e, wait)
+
+        try:
+            return self.policy.call(fn, breaker=self.breaker, on_retry=retried)
+        except CircuitOpenError:
+            self.metrics.inc("embed_circuit_open")
+            raise
 
-    @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2.0, min=4, max=60))
     def embed_one(self, text: str) -> List[float]:
+        """Embed one text, retrying timeouts, 429 and 5xx per the retry policy."""
+        return self._call(lambda: self._embed_one(text))
+
+    def _embed_one(self, text: str) -> List[float]:
         t = _normalize(text)
         if not t:
-            raise EmbeddingError("Cannot embed empty text.")
+            raise InvalidInputError("Cannot embed empty text.")
+        self._check_credentials()
+        self._throttle([t])
 
         if self.spec.provider == "openai":
-            if not os.environ.get("OPENAI_API_KEY"):
-                raise EmbeddingError("OPENAI_API_KEY is missing. Put it in .env then run make mode-cloud.")
-            resp = self.oa.embeddings.create(model=self.spec.model, input=t)
+            resp = self._openai_embed(self.oa, t)
             return resp.data[0].embedding
 
         if self.spec.provider == "gemini":
             key = self._gemini_api_key
-            if not key:
-                raise EmbeddingError("GOOGLE_API_KEY is missing. Get a free key at https://aistudio.google.com/apikey and add it to .env.")
             model = self.spec.model or "text-embedding-004"
             url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:embedContent?key={key}"
-            r = requests.post(url, json={"content": {"parts": [{"text": t}]}}, timeout=self.spec.timeout_seconds)
+            r = self.http.post(url, json={"content": {"parts": [{"text": t}]}}, timeout=self.spec.timeout_seconds)
+            self._check_rate_limited(r.status_code, r.headers)
             r.raise_for_status()
             return r.json()["embedding"]["values"]
 
-        base = (self.spec.base_url or "http://127.0.0.1:11434").rstrip("/")
-        timeout = self.spec.timeout_seconds
+        return self._ollama_call("one", _OLLAMA_ONE_ROUTES, [t])[0]
 
-        # Try Ollama native endpoints (newer/older variants)
-        for endpoint in ("/api/embeddings", "/api/embed"):
-            url = f"{base}{endpoint}"
-            try:
-                r = requests.post(url, json={"model": self.spec.model, "prompt": t}, timeout=timeout)
-                if r.status_code == 404:
-                    continue
-                r.raise_for_status()
-                data = r.json()
-                emb = data.get("embedding")
-                if not emb:
-                    raise EmbeddingError(f"Ollama response missing embedding field from {url}: {data}")
-                return emb
-            except requests.RequestException:
-                pass
-
-        # Fallback: OpenAI-compatible endpoint
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts in a single provider request (no retries, no splitting)."""
+        ts = [_normalize(t) for t in texts]
+        if any(not t for t in ts):
+            raise InvalidInputError("Cannot embed empty text.")
+        self._check_credentials()
+        self._throttle(ts)
+
+        if self.spec.provider == "openai":
+            resp = self._openai_embed(self.oa, ts)
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+        if self.spec.provider == "gemini":
+            key = self._gemini_api_key
+            model = self.spec.model or "text-embedding-004"
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:batchEmbedContents?key={key}"
+            body = {"requests": [{"model": f"models/{model}", "content": {"parts": [{"text": t}]}} for t in ts]}
+            r = self.http.post(url, json=body, timeout=self.spec.timeout_seconds)
+            self._check_rate_limited(r.status_code, r.headers)
+            r.raise_for_status()
+            embs = [e["values"] for e in r.json().get("embeddings", [])]
+            if len(embs) != len(ts):
+                raise EmbeddingError(f"Gemini returned {len(embs)} embeddings for {len(ts)} inputs.")
+            return embs
+
+        # Ollama >= 0.3 accepts an array `input` on /api/embed; older servers only have /v1.
+        return self._ollama_call("batch", _OLLAMA_BATCH_ROUTES, ts)
+
+    def plan_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group input positions into batches bounded by item count and estimated tokens."""
+        batches: List[List[int]] = []
+        cur: List[int] = []
+        cur_tokens = 0
+        for i, t in enumerate(texts):
+            n = estimate_tokens(t)
+            if cur and (len(cur) >= self.batch_size or cur_tokens + n > self.batch_max_tokens):
+                batches.append(cur)
+                cur, cur_tokens = [], 0
+            cur.append(i)
+            cur_tokens += n
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def _embed_split(self, texts: List[str], rejected: List[str]) -> List[Optional[List[float]]]:
+        # Transient failures retry the whole batch. An input the provider rejects (400, 413,
+        # 422) halves it; one still rejected on its own comes back as None (its error
+        # appended to `rejected`) so it does not fail the inputs around it. Anything else
+        # (a missing key, 401/403, an unknown model) fails every request alike: raise now.
         try:
-            client = OpenAI(base_url=f"{base}/v1", api_key="ollama-local")
-            resp = client.embeddings.create(model=self.spec.model, input=t)
-            return resp.data[0].embedding
+            return self._call(lambda: self.embed_batch(texts))
         except Exception as e:
-            raise EmbeddingError(
-                "Failed to embed via Ollama.\n"
-                f"- Is Ollama running on {base}?\n"
-                f"- Did you pull the embeddings model: ollama pull {self.spec.model}?\n"
-                f"- Raw error: {e}"
-            ) from e
-
-    def embed_many(self, texts: List[str]) -> List[List[float]]:
-        results = []
-        for i, t in enumerate(texts):
-            results.append(self.embed_one(t))
-            if self.spec.provider == "gemini" and i < len(texts) - 1:
-                time.sleep(4.5)  # Stay within Gemini free tier (~13 req/min)
+            self._raise_unless_rejected(e)
+            self.metrics.inc("embed_batch_failures")
+            if len(texts) > 1:
+                mid = len(texts) // 2
+                return self._embed_split(texts[:mid], rejected) + self._embed_split(texts[mid:], rejected)
+        try:
+            return [self.embed_one(texts[0])]
+        except Exception as e:
+            self._raise_unless_rejected(e)
+            self.metrics.inc("embed_failed_inputs")
+            logger.warning("Embedding provider rejected an input of %d chars: %s", len(texts[0]), e)
+            rejected.append(f"{type(e).__name__}: {e}")
+            return [None]
+
+    @staticmethod
+    def _raise_unless_rejected(e: Exception) -> None:
+        if isinstance(e, InvalidInputError) or is_rejected_input(e):
+            return
+        if isinstance(e, (CircuitOpenError, EmbeddingError)) or is_retryable(e):
+            raise e
+        raise EmbeddingError(f"Embedding provider refused the request: {e}") from e
+
+    def embed_many(self, texts: List[str], skip_failed: bool = False) -> List[Optional[List[float]]]:
+        """Embed texts in as few provider requests as the batch limits allow, in input order.
+
+        Inputs the provider rejects (not transient errors) raise EmbeddingError, or with
+        `skip_failed` come back as None while every other input is still embedded.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        rejected: List[str] = []
+        for positions in self.plan_batches(texts):
+            embs = self._embed_split([texts[i] for i in positions], rejected)
+            for i, e in zip(positions, embs):
+                results[i] = e
+        if rejected and not skip_failed:
+            raise EmbeddingError(f"Embedding provider rejected {len(rejected)} input(s): {rejected[0]}")
         return results
@@ -0,0 +1,453 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from kb.vectordb import SearchResult
+
+Quantization = Literal["fp16", "int8"]
+T = TypeVar("T")
+
+# Rows scored per matrix product; bounds the float32 temporary to block x dim x 4 bytes.
+_BLOCK_ROWS = 16384
+
+
+class FlatIndex:
+    """Exact brute-force vector store: quantized vectors in a memory-mapped file plus SQLite metadata.
+
+    Vectors are L2-normalized on write and stored either as float16 or as int8 with a
+    per-vector float32 scale, in append-only files under `root`. Row `i` of the vector
+    file belongs to row `i` of the `items` table; deletes and overwrites only clear the
+    row's `live` flag, and the files are compacted once dead rows outnumber live ones.
+    Compaction writes a new, numbered set of files and switches `info.file_gen` to it in
+    the same transaction that renumbers the rows, so readers never pair old rows with new files.
+    Scores are cosine similarities, like `VectorDB` (Chroma with the cosine space).
+    """
+
+    def __init__(self, root: Path, quantization: Quantization = "fp16"):
+        if quantization not in ("fp16", "int8"):
+            raise ValueError("quantization must be 'fp16' or 'int8'")
+        root.mkdir(parents=True, exist_ok=True)
+        self.root = root
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(root / "items.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL,
+                source_path TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                live INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS items_chunk ON items(chunk_id) WHERE live = 1;
+            CREATE INDEX IF NOT EXISTS items_source ON items(source_path) WHERE live = 1;
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        info = dict(self._conn.execute("SELECT key, value FROM info"))
+        stored = info.get("quantization")
+        if stored and stored != quantization and self._max_row() >= 0:
+            raise ValueError(
+                f"Flat index at {root} holds {stored} vectors, config asks for {quantization}; "
+                "run `kb_cli migrate-store` or rebuild."
+            )
+        self.quantization: Quantization = quantization
+        self.dim: Optional[int] = int(info["dim"]) if "dim" in info else None
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('quantization', ?)", (quantization,))
+        self._conn.commit()
+
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._live: np.ndarray = np.zeros(0, dtype=bool)
+        self._file_gen = 0
+        self._data_version = -1
+        self._refresh()
+
+    # -- files ---------------------------------------------------------------------------
+
+    @property
+    def _dtype(self) -> Any:
+        return np.float16 if self.quantization == "fp16" else np.int8
+
+    def _paths(self, file_gen: int) -> Tuple[Path, Path]:
+        # File generation 0 keeps the names used before compactions numbered their files.
+        tag = f".{file_gen}" if file_gen else ""
+        return self.root / f"vectors{tag}.{self.quantization}", self.root / f"scales{tag}.f32"
+
+    @property
+    def _vec_path(self) -> Path:
+        return self._paths(self._file_gen)[0]
+
+    @property
+    def _scale_path(self) -> Path:
+        return self._paths(self._file_gen)[1]
+
+    def _max_row(self) -> int:
+        return self._conn.execute("SELECT COALESCE(MAX(row), -1) FROM items").fetchone()[0]
+
+    def _file_rows(self) -> int:
+        if self.dim is None:
+            return 0
+        try:
+            size = self._vec_path.stat().st_size
+        except FileNotFoundError:
+            if self._max_row() >= 0:
+                raise  # a compaction committed after our snapshot began has removed it
+            return 0
+        return size // (self.dim * np.dtype(self._dtype).itemsize)
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[None]:
+        """Hold one read transaction, so the row numbers _refresh() saw still name the same items
+        in later queries even if another process compacts (renumbers) the index meanwhile."""
+        if self._conn.in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self._conn.rollback()  # nothing was written
+
+    def _read(self, fn: Callable[[], T]) -> T:
+        """Run `fn` on a fresh mapping inside one snapshot, starting over if a compaction removed
+        the files that snapshot names before we mapped them."""
+        for attempt in range(3):
+            with self._lock, self._snapshot():
+                try:
+                    self._refresh()
+                    return fn()
+                except FileNotFoundError:
+                    if attempt == 2:
+                        raise
+                    self._data_version = -1
+        raise AssertionError("unreachable")
+
+    def _refresh(self) -> None:
+        """(Re)map the vector files and liveness mask if this or another process changed them."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'file_gen'").fetchone()
+        file_gen = int(row[0]) if row else 0
+        if file_gen != self._file_gen:
+            self._file_gen, self._vectors, self._scales = file_gen, None, None
+        n = self._file_rows()
+        if version == self._data_version and self._vectors is not None and len(self._vectors) == n:
+            return
+        if self.dim is None:
+            row = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+            n = self._file_rows()
+        self._data_version = version
+        if n == 0 or self.dim is None:
+            self._vectors, self._scales, self._live = None, None, np.zeros(0, dtype=bool)
+            return
+        self._vectors = np.memmap(self._vec_path, dtype=self._dtype, mode="r", shape=(n, self.dim))
+        if self.quantization == "int8":
+            self._scales = np.memmap(self._scale_path, dtype=np.float32, mode="r", shape=(n,))
+        live = np.zeros(n, dtype=bool)
+        rows = np.fromiter((r for (r,) in self._conn.execute("SELECT row FROM items WHERE live = 1")), dtype=np.int64)
+        # Another process may be mid-append; rows beyond the mapped length are picked up next time.
+        live[rows[rows < n]] = True
+        self._live = live
+
+    def _encode(self, embeddings: Sequence[Sequence[float]]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        mat = np.asarray(embeddings, dtype=np.float32)
+        if mat.ndim != 2:
+            raise ValueError("embeddings must be a 2-D list of vectors")
+        if self.dim is None:
+            self.dim = int(mat.shape[1])
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),))
+        elif mat.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {mat.shape[1]} does not match the index ({self.dim}).")
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        mat = mat / np.where(norms == 0, 1.0, norms)
+        if self.quantization == "fp16":
+            return mat.astype(np.float16), None
+        scales = np.abs(mat).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(mat / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _append(self, codes: np.ndarray, scales: Optional[np.ndarray]) -> int:
+        # Vectors are written (and fsynced) before their rows are committed. Writing at
+        # start * row size drops any torn tail left by an append that crashed midway.
+        start = self._file_rows()
+        for path, data, width in ((self._vec_path, codes, codes.shape[1] * codes.itemsize), (self._scale_path, scales, 4)):
+            if data is None:
+                continue
+            with open(path, "r+b" if path.exists() else "wb") as f:
+                f.seek(start * width)
+                f.write(data.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        return start
+
+    # -- VectorStore API -----------------------------------------------------------------
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        if not ids:
+            return
+        with self._lock:
+            codes, scales = self._encode(embeddings)
+            start = self._append(codes, scales)
+            self._kill(self._conn.execute(
+                f"SELECT row FROM items WHERE live = 1 AND chunk_id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall())
+            self._conn.executemany(
+                "INSERT INTO items (row, chunk_id, source_path, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (start + i, cid, str(meta.get("source_path", "")), doc or "", json.dumps(meta))
+                    for i, (cid, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._conn.commit()
+            self._data_version = -1  # our own commits do not bump PRAGMA data_version
+            self._refresh()
+
+    def _kill(self, rows: Sequence[Tuple[int]]) -> None:
+        if rows:
+            self._conn.executemany("UPDATE items SET live = 0 WHERE row = ?", rows)
+
+    def delete_where(self, where: Dict[str, Any]) -> None:
+        with self._lock:
+            if set(where) == {"source_path"}:
+                rows = self._conn.execute(
+                    "SELECT row FROM items WHERE live = 1 AND source_path = ?", (str(where["source_path"]),)
+                ).fetchall()
+            else:
+                rows = [
+                    (row,)
+                    for row, meta in self._conn.execute("SELECT row, metadata FROM items WHERE live = 1")
+                    if all(json.loads(meta).get(k) == v for k, v in where.items())
+                ]
+            self._kill(rows)
+            self._conn.commit()
+            self._data_version = -1
+            self._maybe_compact()
+            self._refresh()
+
+    def delete_ids(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i : i + 500]
+                self._kill(self._conn.execute(
+                    f"SELECT row FROM items WHERE live = 1 AND chunk_id IN ({','.join('?' * len(part))})", part
+                ).fetchall())
+            self._conn.commit()
+            self._data_version = -1
+            self._maybe_compact()
+            self._refresh()
+
+    def source_ids(self, source_path: str) -> List[str]:
+        with self._lock:
+            return [
+                cid
+                for (cid,) in self._conn.execute(
+                    "SELECT chunk_id FROM items WHERE live = 1 AND source_path = ?", (source_path,)
+                )
+            ]
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of stored chunks; their documents and vectors stay as they are."""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE items SET source_path = ?, metadata = ? WHERE live = 1 AND chunk_id = ?",
+                [(str(meta.get("source_path", "")), json.dumps(meta), cid) for cid, meta in zip(ids, metadatas)],
+            )
+            self._conn.commit()
+            self._data_version = -1
+
+    def _maybe_compact(self) -> None:
+        # Rewriting costs O(live rows) and happens only after more rows than that died, so the
+        # amortized cost per delete stays constant.
+        live, total = self._conn.execute("SELECT COALESCE(SUM(live), 0), COUNT(*) FROM items").fetchone()
+        if total - live > live:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the vector files and row numbers with only live rows."""
+        with self._lock:
+            self._refresh()
+            if self._vectors is None:
+                return
+            keep = np.flatnonzero(self._live)
+            old = (self._vec_path, self._scale_path)
+            file_gen = self._file_gen + 1
+            self._write_files(
+                file_gen,
+                np.asarray(self._vectors[keep]),
+                None if self._scales is None else np.asarray(self._scales[keep]),
+            )
+            remap = [(int(new), int(old)) for new, old in enumerate(keep)]
+            self._vectors = self._scales = None
+            self._conn.execute("DELETE FROM items WHERE live = 0")
+            # Two passes so new row numbers never collide with rows not yet renumbered.
+            self._conn.executemany("UPDATE items SET row = -1 - ? WHERE row = ?", remap)
+            self._conn.execute("UPDATE items SET row = -1 - row")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO info (key, value) VALUES ('file_gen', ?)", (str(file_gen),)
+            )
+            self._conn.commit()
+            # Readers whose snapshot predates the commit still map the old files; once they
+            # are gone such a reader starts over on the new files (see _read).
+            for path in old:
+                path.unlink(missing_ok=True)
+            self._data_version = -1
+            self._refresh()
+
+    def _write_files(self, file_gen: int, codes: np.ndarray, scales: Optional[np.ndarray]) -> None:
+        # Fully written and fsynced before the commit that points readers at them; leftovers
+        # from a compaction that crashed before committing are overwritten by the next one.
+        for path, data in zip(self._paths(file_gen), (codes, scales)):
+            if data is None:
+                continue
+            with open(path, "wb") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        for ids, docs, metas, _ in self._iter(batch_size, with_vectors=False):
+            yield ids, docs, metas
+
+    def iter_vectors(
+        self, batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[List[float]]]]:
+        """Yield (ids, documents, metadatas, embeddings) pages; embeddings are dequantized."""
+        yield from self._iter(batch_size, with_vectors=True)  # type: ignore[misc]
+
+    def _iter(self, batch_size: int, with_vectors: bool) -> Iterator[Tuple[Any, Any, Any, Any]]:
+        last = -1
+        while True:
+            page, vecs = self._read(lambda: self._page(last, batch_size, with_vectors))
+            if not page:
+                return
+            last = page[-1][0]
+            yield [r[1] for r in page], [r[2] for r in page], [json.loads(r[3]) for r in page], vecs
+
+    def _page(self, last: int, batch_size: int, with_vectors: bool) -> Tuple[List[Tuple[Any, ...]], Any]:
+        page = self._conn.execute(
+            "SELECT row, chunk_id, document, metadata FROM items WHERE live = 1 AND row > ? ORDER BY row LIMIT ?",
+            (last, batch_size),
+        ).fetchall()
+        if not page or not with_vectors:
+            return page, None
+        return page, self._decode(np.array([r[0] for r in page], dtype=np.int64)).tolist()
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        assert self._vectors is not None
+        mat = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            mat *= np.asarray(self._scales[rows])[:, None]
+        return mat
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items WHERE live = 1").fetchone()[0]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._vectors = self._scales = None
+            for p in (self._vec_path, self._scale_path):
+                p.unlink(missing_ok=True)
+            self._conn.execute("DELETE FROM items")
+            self._conn.execute("DELETE FROM info WHERE key IN ('dim', 'file_gen')")
+            self._conn.commit()
+            self.dim = None
+            self._data_version = -1
+            self._refresh()
+
+    def query(self, query_embedding: List[float], top_k: int = 5) -> List[SearchResult]:
+        return self.query_many([query_embedding], top_k=top_k)[0]
+
+    def query_many(self, query_embeddings: List[List[float]], top_k: int = 5) -> List[List[SearchResult]]:
+        if not query_embeddings:
+            return []
+        return self._read(lambda: self._query_many(query_embeddings, top_k))
+
+    def _query_many(self, query_embeddings: List[List[float]], top_k: int) -> List[List[SearchResult]]:
+        if self._vectors is None or top_k <= 0 or not self._live.any():
+            return [[] for _ in query_embeddings]
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {q.shape[1]} does not match the index ({self.dim}).")
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q /= np.where(norms == 0, 1.0, norms)
+        best_rows, best_scores = self._top_k(q, top_k)
+        out: List[List[SearchResult]] = []
+        for rows, scores in zip(best_rows, best_scores):
+            out.append(self._results(rows.tolist(), scores.tolist()))
+        return out
+
+    def _top_k(self, q: np.ndarray, k: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        assert self._vectors is not None
+        n = len(self._vectors)
+        cand_rows: List[np.ndarray] = []
+        cand_scores: List[np.ndarray] = []
+        for start in range(0, n, _BLOCK_ROWS):
+            stop = min(n, start + _BLOCK_ROWS)
+            live = self._live[start:stop]
+            if not live.any():
+                continue
+            scores = np.asarray(self._vectors[start:stop], dtype=np.float32) @ q.T  # (block, n_queries)
+            if self._scales is not None:
+                scores *= np.asarray(self._scales[start:stop])[:, None]
+            scores[~live] = -np.inf
+            if k < stop - start:
+                idx = np.argpartition(-scores, k - 1, axis=0)[:k]
+            else:
+                idx = np.tile(np.arange(stop - start)[:, None], (1, q.shape[0]))
+            cand_rows.append(idx + start)
+            cand_scores.append(np.take_along_axis(scores, idx, axis=0))
+
+        rows = np.concatenate(cand_rows, axis=0).T  # (n_queries, candidates)
+        scores = np.concatenate(cand_scores, axis=0).T
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        rows = np.take_along_axis(rows, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        keep = np.isfinite(scores)
+        return [r[m] for r, m in zip(rows, keep)], [s[m] for s, m in zip(scores, keep)]
+
+    def _results(self, rows: List[int], scores: List[float]) -> List[SearchResult]:
+        if not rows:
+            return []
+        found = {
+            row: (cid, source, doc, meta)
+            for row, cid, source, doc, meta in self._conn.execute(
+                f"SELECT row, chunk_id, source_path, document, metadata FROM items WHERE row IN ({','.join('?' * len(rows))})",
+                rows,
+            )
+        }
+        out = []
+        for row, score in zip(rows, scores):
+            if row not in found:  # only if the vector files changed without a committed row change
+                continue
+            cid, source, doc, meta = found[row]
+            out.append(SearchResult(score=float(score), text=doc, source=source, chunk_id=cid, metadata=json.loads(meta)))
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors = self._scales = None
+            self._conn.close()
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import dataclasses
+import errno
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from kb.config import AppConfig, Paths
+from kb.manifest import Manifest, manifest_db_path, now_iso
+
+# Index generations live in kb.paths.snapshots_dir:
+#
+#   CURRENT                  name of the live generation (absent: the "base" layout in index_dir)
+#   gen-<timestamp>/         chroma/, flat/, lexical.sqlite3, manifest.sqlite3, VERSION, COMPLETE
+#
+# A rebuild fills a fresh generation while searches keep using the live one, then
+# replaces CURRENT atomically. The embedding cache stays shared in index_dir.
+
+BASE = "base"
+POINTER = "CURRENT"
+COMPLETE = "COMPLETE"
+VERSION = "VERSION"
+GEN_PREFIX = "gen-"
+
+_FICLONE = 0x40049409  # ioctl(dest_fd, FICLONE, src_fd): reflink on btrfs, XFS, bcachefs
+
+
+def current_generation(snapshots_dir: Path) -> str:
+    try:
+        name = (snapshots_dir / POINTER).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return BASE
+    return name or BASE
+
+
+def generation_dir(cfg: AppConfig, name: str) -> Path:
+    return cfg.kb.paths.snapshots_dir / name
+
+
+def generation_paths(cfg: AppConfig, name: str) -> Paths:
+    """The index paths of generation `name`; "base" is the layout configured under kb.paths."""
+    paths = cfg.kb.paths
+    if name == BASE:
+        _require_base_paths(cfg)
+        return dataclasses.replace(paths, generation=BASE)
+    root = generation_dir(cfg, name)
+    return dataclasses.replace(
+        paths,
+        chroma_dir=root / "chroma",
+        flat_dir=root / "flat",
+        lexical_path=root / "lexical.sqlite3",
+        dedup_path=root / "dedup.sqlite3",
+        manifest_path=root / "manifest.json",
+        generation=name,
+    )
+
+
+def _require_base_paths(cfg: AppConfig) -> None:
+    # The base layout is only known from the loaded config, not from one bound to a generation.
+    if cfg.kb.paths.generation not in (None, BASE):
+        raise ValueError(f"Config is bound to generation {cfg.kb.paths.generation!r}; pass the loaded config.")
+
+
+def with_generation(cfg: AppConfig, name: str) -> AppConfig:
+    return dataclasses.replace(cfg, kb=dataclasses.replace(cfg.kb, paths=generation_paths(cfg, name)))
+
+
+def resolve(cfg: AppConfig) -> AppConfig:
+    """Point `cfg` at the live generation; a cfg already bound to a generation is returned as is."""
+    if cfg.kb.paths.generation is not None:
+        return cfg
+    return with_generation(cfg, current_generation(cfg.kb.paths.snapshots_dir))
+
+
+def new_generation(cfg: AppConfig) -> AppConfig:
+    """Create an empty generation directory and return `cfg` bound to it (not yet live)."""
+    snaps = cfg.kb.paths.snapshots_dir
+    snaps.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    for i in range(1000):
+        name = f"{GEN_PREFIX}{stamp}" + (f"-{i}" if i else "")
+        try:
+            (snaps / name).mkdir()
+            return with_generation(cfg, name)
+        except FileExistsError:
+            continue
+    raise RuntimeError(f"Could not allocate a generation directory in {snaps}")
+
+
+def mark_complete(cfg: AppConfig, **info: Any) -> None:
+    name = cfg.kb.paths.generation
+    if name in (None, BASE):
+        return
+    _write_atomic(generation_dir(cfg, name) / COMPLETE, json.dumps({"completed_at": now_iso(), **info}, indent=2))
+
+
+def is_complete(cfg: AppConfig, name: str) -> bool:
+    return name == BASE or (generation_dir(cfg, name) / COMPLETE).exists()
+
+
+def activate(cfg: AppConfig, name: str) -> None:
+    """Make `name` the live generation (atomic rename of the pointer file)."""
+    if not is_complete(cfg, name):
+        raise ValueError(f"Generation {name!r} is missing or incomplete.")
+    _write_atomic(cfg.kb.paths.snapshots_dir / POINTER, name + "\n")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _version_path(cfg: AppConfig) -> Path:
+    return cfg.kb.paths.manifest_path.with_name(VERSION)
+
+
+def index_version(cfg: AppConfig) -> str:
+    """Names the current contents of the index `cfg` is bound to; see bump_version."""
+    try:
+        token = _version_path(cfg).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        token = ""
+    paths = cfg.kb.paths
+    return f"{paths.manifest_path.parent}:{paths.generation}:{token}"
+
+
+def bump_version(cfg: AppConfig) -> None:
+    """Record that the index changed, so results cached for the previous version are not served.
+
+    Called after every committed write; a fresh random token (not a counter) cannot repeat
+    an earlier version even if the file is lost. No fsync: a stale token cannot outlive
+    the processes holding cached results.
+    """
+    path = _version_path(cfg)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{VERSION}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(uuid.uuid4().hex + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def list_generations(cfg: AppConfig) -> List[Dict[str, Any]]:
+    """All generations, oldest first, with completion info and size on disk."""
+    _require_base_paths(cfg)
+    snaps = cfg.kb.paths.snapshots_dir
+    current = current_generation(snaps)
+    out: List[Dict[str, Any]] = []
+    base_exists = Manifest.exists(cfg.kb.paths.manifest_path)
+    if base_exists or current == BASE:
+        out.append({"name": BASE, "current": current == BASE, "complete": True, "path": str(cfg.kb.paths.index_dir)})
+    if snaps.is_dir():
+        for d in sorted(p for p in snaps.iterdir() if p.is_dir() and p.name.startswith(GEN_PREFIX)):
+            info: Dict[str, Any] = {}
+            if (d / COMPLETE).exists():
+                info = json.loads((d / COMPLETE).read_text(encoding="utf-8") or "{}")
+            out.append(
+                {
+                    "name": d.name,
+                    "current": d.name == current,
+                    "complete": (d / COMPLETE).exists(),
+                    "path": str(d),
+                    "bytes": sum(f.stat().st_size for f in d.rglob("*") if f.is_file()),
+                    **info,
+                }
+            )
+    return out
+
+
+def prune(cfg: AppConfig, keep: int) -> List[str]:
+    """Delete generations beyond the live one plus the `keep` newest complete others.
+
+    Incomplete generations are removed only when older than the live one, so a rebuild that
+    is still running in another process is never touched. The base layout counts as the
+    oldest generation; deleting it removes its index files but keeps the embedding cache.
+    """
+    current = current_generation(cfg.kb.paths.snapshots_dir)
+    gens = [g for g in list_generations(cfg) if not g["current"]]
+    complete = [g["name"] for g in gens if g["complete"]]
+    doomed = complete[: max(0, len(complete) - keep)]
+    if current != BASE:
+        doomed += [g["name"] for g in gens if not g["complete"] and g["name"] < current]
+    for name in doomed:
+        _remove(cfg, name)
+    return doomed
+
+
+def _remove(cfg: AppConfig, name: str) -> None:
+    if name != BASE:
+        shutil.rmtree(generation_dir(cfg, name), ignore_errors=True)
+        return
+    paths = cfg.kb.paths
+    # The manifest goes first: without it the base layout no longer counts as a generation.
+    for db in (manifest_db_path(paths.manifest_path), paths.lexical_path, paths.dedup_path):
+        for f in (db, db.with_name(db.name + "-wal"), db.with_name(db.name + "-shm")):
+            f.unlink(missing_ok=True)
+    paths.manifest_path.unlink(missing_ok=True)
+    _version_path(cfg).unlink(missing_ok=True)
+    for d in (paths.chroma_dir, paths.flat_dir):
+        shutil.rmtree(d, ignore_errors=True)
+
+
+def resumable(cfg: AppConfig) -> Optional[str]:
+    """The newest incomplete generation started after the live one, i.e. an interrupted rebuild."""
+    current = current_generation(cfg.kb.paths.snapshots_dir)
+    pending = [
+        g["name"]
+        for g in list_generations(cfg)
+        if not g["complete"] and (current == BASE or g["name"] > current)
+    ]
+    return pending[-1] if pending else None
+
+
+def rollback(cfg: AppConfig, to: Optional[str] = None) -> Tuple[str, str]:
+    """Switch the live generation to `to` (default: the newest other complete one)."""
+    gens = list_generations(cfg)
+    current = next((g["name"] for g in gens if g["current"]), BASE)
+    if to is None:
+        others = [g["name"] for g in gens if g["complete"] and g["name"] != current]
+        if not others:
+            raise ValueError("No other complete generation to roll back to.")
+        to = others[-1]
+    activate(cfg, to)
+    return current, to
+
+
+def _clone_file(src: Path, dst: Path) -> str:
+    """Reflink `src` to `dst` when the filesystem supports it, else copy. Returns the method used.
+
+    Hardlinks are not an option: SQLite, Chroma and the flat index update files in place,
+    so a write in one generation would show up in every generation sharing the inode.
+    """
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+            return "reflink"
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM):
+                raise
+    shutil.copyfile(src, dst)  # uses copy_file_range/sendfile where available
+    return "copy"
+
+
+def clone_generation(cfg: AppConfig, source: str, **info: Any) -> Tuple[AppConfig, Dict[str, int]]:
+    """Copy generation `source` into a new complete generation (not made live).
+
+    SQLite databases are copied with the online backup API so a concurrent writer cannot
+    leave a torn copy; they are copied before the vector files they reference.
+    """
+    src = generation_paths(cfg, source)
+    dst_cfg = new_generation(cfg)
+    dst = dst_cfg.kb.paths
+    methods: Dict[str, int] = {}
+    pairs = [
+        (src.chroma_dir, dst.chroma_dir),
+        (src.flat_dir, dst.flat_dir),
+        (src.lexical_path, dst.lexical_path),
+        (src.dedup_path, dst.dedup_path),
+        (manifest_db_path(src.manifest_path), manifest_db_path(dst.manifest_path)),
+        (src.manifest_path, dst.manifest_path),
+    ]
+    files: List[Tuple[Path, Path]] = []
+    for s, d in pairs:
+        if s.is_dir():
+            files += [(f, d / f.relative_to(s)) for f in s.rglob("*") if f.is_file()]
+        elif s.is_file():
+            files.append((s, d))
+    # Online-backup databases first, then everything else (WAL side files are folded in).
+    dbs = [(s, d) for s, d in files if s.suffix == ".sqlite3"]
+    rest = [(s, d) for s, d in files if s.suffix != ".sqlite3" and not s.name.endswith(("-wal", "-shm"))]
+    for s, d in dbs:
+        d.parent.mkdir(parents=True, exist_ok=True)
+        sc, dc = sqlite3.connect(str(s)), sqlite3.connect(str(d))
+        try:
+            sc.backup(dc)
+        finally:
+            sc.close()
+            dc.close()
+        methods["sqlite_backup"] = methods.get("sqlite_backup", 0) + 1
+    for s, d in rest:
+        d.parent.mkdir(parents=True, exist_ok=True)
+        m = _clone_file(s, d)
+        methods[m] = methods.get(m, 0) + 1
+    mark_complete(dst_cfg, source=f"snapshot of {source}", **info)
+    return dst_cfg, methods
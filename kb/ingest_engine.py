@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int = 1
+    items: int = 0
+    busy_seconds: float = 0.0
+    max_queue_depth: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+    def as_dict(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "items_per_second": round(self.items / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One step of the pipeline: `fn` maps an item to the next item (or None to drop it)."""
+
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+
+
+class StagedPipeline:
+    """Run `source -> stage -> stage -> ...` with a thread pool per stage and bounded queues.
+
+    Queues between stages hold at most `queue_size` items, so a slow stage applies
+    backpressure upstream instead of letting work pile up in memory. The first
+    exception raised by any stage stops the pipeline and is re-raised from `run()`.
+    """
+
+    def __init__(self, source_name: str, stages: Sequence[Stage], queue_size: int = 8):
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage")
+        self.source_name = source_name
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.stats: Dict[str, StageStats] = {source_name: StageStats(source_name)}
+        for st in self.stages:
+            self.stats[st.name] = StageStats(st.name, workers=max(1, st.workers))
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                self._error = exc
+        self._stop.set()
+
+    def _put(self, q: "queue.Queue[Any]", item: Any, stats: StageStats) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                stats.max_queue_depth = max(stats.max_queue_depth, q.qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue[Any]") -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, source: Iterable[Any], out_q: "queue.Queue[Any]", consumers: int) -> None:
+        stats = self.stats[self.source_name]
+        try:
+            it = iter(source)
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                stats.record(time.perf_counter() - t0)
+                if not self._put(out_q, item, stats):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None and self._stop.is_set():
+                close()
+            for _ in range(consumers):
+                self._put(out_q, _DONE, stats)
+
+    def _work(
+        self,
+        stage: Stage,
+        in_q: "queue.Queue[Any]",
+        out_q: Optional["queue.Queue[Any]"],
+        finished: List[int],
+        finished_lock: threading.Lock,
+        consumers: int,
+    ) -> None:
+        stats = self.stats[stage.name]
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    break
+                t0 = time.perf_counter()
+                out = stage.fn(item)
+                stats.record(time.perf_counter() - t0)
+                if out is not None and out_q is not None and not self._put(out_q, out, stats):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # The last worker of a stage to finish tells every downstream worker to stop.
+            with finished_lock:
+                finished[0] += 1
+                last = finished[0] == stats.workers
+            if last and out_q is not None:
+                for _ in range(consumers):
+                    self._put(out_q, _DONE, stats)
+
+    def run(self, source: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        queues: List["queue.Queue[Any]"] = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [
+            threading.Thread(
+                target=self._feed,
+                args=(source, queues[0], self.stats[self.stages[0].name].workers),
+                name=f"kb-{self.source_name}",
+                daemon=True,
+            )
+        ]
+        for i, stage in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(queues) else None
+            consumers = self.stats[self.stages[i + 1].name].workers if out_q is not None else 0
+            finished, finished_lock = [0], threading.Lock()
+            for w in range(self.stats[stage.name].workers):
+                threads.append(
+                    threading.Thread(
+                        target=self._work,
+                        args=(stage, queues[i], out_q, finished, finished_lock, consumers),
+                        name=f"kb-{stage.name}-{w}",
+                        daemon=True,
+                    )
+                )
+
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        if self._error is not None:
+            raise self._error
+        return {name: st.as_dict(wall) for name, st in self.stats.items()}
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+from kb.vectordb import SearchResult
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 or t.isdigit()]
+
+
+class LexicalIndex:
+    """BM25 inverted index kept in SQLite next to the vector store.
+
+    Postings are (term id, chunk row, term frequency) integer triples in a WITHOUT ROWID
+    table. Document frequencies and corpus totals are maintained incrementally, so
+    replacing the chunks of one source only touches that source's postings, and queries
+    need no embedding provider.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA cache_size=-32768")  # 32 MiB: postings inserts touch many pages
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                source_path TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_source ON chunks(source_path);
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                row INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term_id, row)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                n_chunks INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (id, n_chunks, total_length) VALUES (0, 0, 0);
+            """
+        )
+        self._conn.commit()
+
+    def _term_ids(self, terms: Sequence[str], create: bool) -> Dict[str, int]:
+        ids: Dict[str, int] = {}
+        uniq = list(set(terms))
+        for i in range(0, len(uniq), 500):
+            part = uniq[i : i + 500]
+            marks = ",".join("?" * len(part))
+            ids.update({t: tid for tid, t in self._conn.execute(f"SELECT id, term FROM terms WHERE term IN ({marks})", part)})
+        if create:
+            missing = [t for t in uniq if t not in ids]
+            for t in missing:
+                ids[t] = self._conn.execute("INSERT INTO terms (term, df) VALUES (?, 0)", (t,)).lastrowid
+        return ids
+
+    def _delete_rows(self, rows: Sequence[Tuple[int, str, int]]) -> None:
+        # Postings are keyed by term, so re-tokenize the stored text to find a row's terms.
+        if not rows:
+            return
+        tfs = {row: Counter(tokenize(text)) for row, text, _ in rows}
+        term_ids = self._term_ids([t for tf in tfs.values() for t in tf], create=False)
+        df: Counter = Counter()
+        postings = []
+        for row, tf in tfs.items():
+            for t in tf:
+                if t in term_ids:
+                    postings.append((term_ids[t], row))
+                    df[term_ids[t]] += 1
+        self._conn.executemany("DELETE FROM postings WHERE term_id = ? AND row = ?", postings)
+        self._conn.executemany("UPDATE terms SET df = df - ? WHERE id = ?", [(n, tid) for tid, n in df.items()])
+        self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row, _, _ in rows])
+        self._conn.execute(
+            "UPDATE stats SET n_chunks = n_chunks - ?, total_length = total_length - ?",
+            (len(rows), sum(length for _, _, length in rows)),
+        )
+
+    def _rows_for_source(self, source_path: str) -> List[Tuple[int, str, int]]:
+        return self._conn.execute("SELECT row, text, length FROM chunks WHERE source_path = ?", (source_path,)).fetchall()
+
+    def delete_source(self, source_path: str) -> None:
+        with self._lock:
+            self._delete_rows(self._rows_for_source(source_path))
+            self._conn.commit()
+
+    def replace_source(
+        self,
+        source_path: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        with self._lock:
+            self._insert(source_path, ids, texts, metadatas, self._rows_for_source(source_path))
+
+    def add_chunks(
+        self,
+        source_path: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        """Add chunks to `source_path` without touching the chunks it already has."""
+        with self._lock:
+            self._insert(source_path, ids, texts, metadatas, [])
+
+    def _insert(
+        self,
+        source_path: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        old: List[Tuple[int, str, int]],
+    ) -> None:
+        marks = ",".join("?" * len(ids))
+        if ids:
+            # Chunk ids are unique index-wide, so drop any row already registered under them.
+            taken = self._conn.execute(f"SELECT row, text, length FROM chunks WHERE chunk_id IN ({marks})", list(ids))
+            old = list({row[0]: row for row in old + taken.fetchall()}.values())
+        self._delete_rows(old)
+
+        tfs = [Counter(tokenize(t)) for t in texts]
+        term_ids = self._term_ids([t for tf in tfs for t in tf], create=True)
+        df: Counter = Counter()
+        postings = []
+        total = 0
+        for cid, text, meta, tf in zip(ids, texts, metadatas, tfs):
+            length = sum(tf.values())
+            total += length
+            row = self._conn.execute(
+                "INSERT INTO chunks (chunk_id, source_path, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                (cid, source_path, length, text, json.dumps(meta)),
+            ).lastrowid
+            for t, n in tf.items():
+                postings.append((term_ids[t], row, n))
+                df[term_ids[t]] += 1
+        self._conn.executemany("INSERT INTO postings (term_id, row, tf) VALUES (?, ?, ?)", postings)
+        self._conn.executemany("UPDATE terms SET df = df + ? WHERE id = ?", [(n, tid) for tid, n in df.items()])
+        self._conn.execute(
+            "UPDATE stats SET n_chunks = n_chunks + ?, total_length = total_length + ?", (len(ids), total)
+        )
+        self._conn.commit()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.executescript(
+                "DELETE FROM postings; DELETE FROM terms; DELETE FROM chunks;"
+                " UPDATE stats SET n_chunks = 0, total_length = 0;"
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT n_chunks FROM stats").fetchone()[0]
+
+    def search(self, query: str, top_k: int = 5) -> List[SearchResult]:
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n, total_len = self._conn.execute("SELECT n_chunks, total_length FROM stats").fetchone()
+            if n <= 0:
+                return []
+            avg_len = total_len / n or 1.0
+            marks = ",".join("?" * len(terms))
+            found = self._conn.execute(f"SELECT id, df FROM terms WHERE df > 0 AND term IN ({marks})", terms).fetchall()
+
+            tf_by_row: Dict[int, List[Tuple[float, int]]] = {}
+            for tid, df in found:
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                for row, tf in self._conn.execute("SELECT row, tf FROM postings WHERE term_id = ?", (tid,)):
+                    tf_by_row.setdefault(row, []).append((idf, tf))
+            if not tf_by_row:
+                return []
+
+            lengths: Dict[int, int] = {}
+            rows = list(tf_by_row)
+            for i in range(0, len(rows), 500):
+                part = rows[i : i + 500]
+                lengths.update(
+                    self._conn.execute(f"SELECT row, length FROM chunks WHERE row IN ({','.join('?' * len(part))})", part)
+                )
+
+            k1, b = self.k1, self.b
+            scores = {
+                row: sum(idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * lengths[row] / avg_len)) for idf, tf in hits)
+                for row, hits in tf_by_row.items()
+            }
+            best = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+            out: List[SearchResult] = []
+            for row, score in best:
+                cid, source, text, meta = self._conn.execute(
+                    "SELECT chunk_id, source_path, text, metadata FROM chunks WHERE row = ?", (row,)
+                ).fetchone()
+                out.append(SearchResult(score=score, text=text, source=source, chunk_id=cid, metadata=json.loads(meta)))
+            return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[SearchResult]], top_k: int, k: int = 60) -> List[SearchResult]:
+    """Fuse several ranked lists: each hit scores sum(1 / (k + rank)) over the lists it appears in."""
+    fused: Dict[str, float] = {}
+    first: Dict[str, SearchResult] = {}
+    for ranking in rankings:
+        for rank, r in enumerate(ranking, start=1):
+            fused[r.chunk_id] = fused.get(r.chunk_id, 0.0) + 1.0 / (k + rank)
+            first.setdefault(r.chunk_id, r)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [
+        SearchResult(score=score, text=first[cid].text, source=first[cid].source, chunk_id=cid, metadata=first[cid].metadata)
+        for cid, score in best
+    ]
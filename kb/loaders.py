@@ -1,20 +1,29 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
-from docx import Document
-from pypdf import PdfReader
+from kb.manifest import sha256_file
+from kb.page_cache import PageCache
 
 
 SUPPORTED_EXTS = {".pdf", ".txt", ".md", ".docx"}
+# Formats whose extraction is CPU-bound enough to be worth shipping to a worker process.
+CPU_HEAVY_EXTS = {".pdf", ".docx"}
 
 
 @dataclass(frozen=True)
 class LoadedDoc:
     source_path: Path
     text: str
+    error: Optional[str] = None
+    load_seconds: float = 0.0
+    # PDFs: (offset in `text`, 1-based page number) for each page that has text.
+    pages: Tuple[Tuple[int, int], ...] = ()
 
 
 def list_source_files(raw_dir: Path) -> List[Path]:
@@ -32,26 +41,53 @@ def load_text_file(path: Path) -> str:
 
 
 def load_docx(path: Path) -> str:
+    from docx import Document  # imported lazily: parsers are only needed when a file changed
+
     doc = Document(str(path))
     parts = [p.text for p in doc.paragraphs if p.text.strip()]
     return "\n".join(parts).strip()
 
 
+def pdf_page_count(path: Path) -> int:
+    from pypdf import PdfReader  # imported lazily: parsers are only needed when a file changed
+
+    return len(PdfReader(str(path)).pages)
+
+
+def extract_pdf_pages(path: Path, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Stripped text of pages [start, stop) (0-based)."""
+    from pypdf import PdfReader
+
+    pages = PdfReader(str(path)).pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    return [(pages[i].extract_text() or "").strip() for i in range(start, stop)]
+
+
+def join_pages(pages: Sequence[str]) -> Tuple[str, Tuple[Tuple[int, int], ...]]:
+    """Join page texts with blank lines; returns the text and where each non-empty page starts."""
+    parts: List[str] = []
+    offsets: List[Tuple[int, int]] = []
+    pos = 0
+    for i, text in enumerate(pages):
+        if not text:
+            continue
+        if parts:
+            pos += 2
+        offsets.append((pos, i + 1))
+        parts.append(text)
+        pos += len(text)
+    return "\n\n".join(parts), tuple(offsets)
+
+
 def load_pdf(path: Path) -> str:
-    reader = PdfReader(str(path))
-    parts = []
-    for page in reader.pages:
-        text = page.extract_text() or ""
-        text = text.strip()
-        if text:
-            parts.append(text)
-    return "\n\n".join(parts).strip()
+    return join_pages(extract_pdf_pages(path))[0]
 
 
 def load_any(path: Path) -> LoadedDoc:
     ext = path.suffix.lower()
     if ext == ".pdf":
-        text = load_pdf(path)
+        text, pages = join_pages(extract_pdf_pages(path))
+        return LoadedDoc(source_path=path, text=text, pages=pages)
     elif ext in (".txt", ".md"):
         text = load_text_file(path)
     elif ext == ".docx":
@@ -71,3 +107,164 @@ def load_all(raw_dir: Path, extra_files: Optional[Iterable[Path]] = None) -> Lis
             if p.exists() and p.is_file():
                 docs.append(load_any(p))
     return docs
+
+
+def _load_safe(path: Path) -> LoadedDoc:
+    t0 = time.perf_counter()
+    try:
+        return replace(load_any(path), load_seconds=time.perf_counter() - t0)
+    except Exception as e:
+        return LoadedDoc(source_path=path, text="", error=f"{type(e).__name__}: {e}", load_seconds=time.perf_counter() - t0)
+
+
+def _extract_range(path: Path, start: int, stop: int) -> Tuple[int, List[str], float, Optional[str]]:
+    t0 = time.perf_counter()
+    try:
+        return start, extract_pdf_pages(path, start, stop), time.perf_counter() - t0, None
+    except Exception as e:
+        return start, [], time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+
+
+@dataclass
+class _PdfJob:
+    path: Path
+    doc_hash: str
+    n_pages: int
+    texts: Dict[int, str]
+    ranges: List[Tuple[int, int]] = field(default_factory=list)
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    def add(self, start: int, texts: List[str], seconds: float, error: Optional[str], cache: Optional[PageCache]) -> None:
+        self.seconds += seconds
+        if error:
+            self.error = self.error or error
+            return
+        got = {start + i: t for i, t in enumerate(texts)}
+        self.texts.update(got)
+        if cache is not None:
+            cache.put_pages(self.doc_hash, got)
+
+    def result(self) -> LoadedDoc:
+        if self.error:
+            return LoadedDoc(source_path=self.path, text="", error=self.error, load_seconds=self.seconds)
+        text, pages = join_pages([self.texts.get(i, "") for i in range(self.n_pages)])
+        return LoadedDoc(source_path=self.path, text=text, load_seconds=self.seconds, pages=pages)
+
+
+@dataclass(frozen=True)
+class PdfSplit:
+    """How PDFs are extracted page by page: PDFs with at least `min_pages` pages are split into
+    ranges of `pages_per_task` pages that run on separate workers. With a `cache`, pages
+    already extracted from the same file content (keyed by `hashes`, or hashed here) are reused.
+    """
+
+    min_pages: int = 0
+    pages_per_task: int = 16
+    cache: Optional[PageCache] = None
+    hashes: Mapping[Path, str] = field(default_factory=dict)
+
+
+def _plan_pdf(path: Path, split: PdfSplit, parallel: bool) -> Optional[_PdfJob]:
+    if split.cache is None and not (parallel and split.min_pages > 0):
+        return None
+    try:
+        n = pdf_page_count(path)
+        doc_hash = split.hashes.get(path) or sha256_file(path)
+    except Exception:
+        return None  # the whole-file path reports the error
+    texts = split.cache.get_pages(doc_hash, n) if split.cache is not None else {}
+    job = _PdfJob(path=path, doc_hash=doc_hash, n_pages=n, texts=texts)
+    size = max(1, split.pages_per_task) if parallel and 0 < split.min_pages <= n else max(1, n)
+    start: Optional[int] = None
+    for i in range(n + 1):
+        missing = i < n and i not in texts
+        if missing and start is None:
+            start = i
+        if start is not None and (not missing or i - start == size):
+            job.ranges.append((start, i))
+            start = i if missing else None
+    return job
+
+
+def iter_docs(
+    paths: Iterable[Path],
+    workers: int = 0,
+    max_in_flight: Optional[int] = None,
+    pdf: Optional[PdfSplit] = None,
+) -> Iterator[LoadedDoc]:
+    """Yield loaded documents as they finish extracting (not necessarily in input order).
+
+    PDF/DOCX extraction runs in a pool of `workers` processes with at most `max_in_flight`
+    tasks outstanding, so memory is bounded by the pool rather than the corpus. Large PDFs
+    are split into page ranges across the pool and cached per page (see `PdfSplit`). A file
+    that fails to load is yielded with `error` set instead of aborting the whole run.
+    """
+    split = pdf or PdfSplit()
+    if workers <= 0:
+        for p in paths:
+            job = _plan_pdf(p, split, parallel=False) if p.suffix.lower() == ".pdf" else None
+            if job is None:
+                yield _load_safe(p)
+                continue
+            for start, stop in job.ranges:
+                job.add(*_extract_range(p, start, stop), cache=split.cache)
+            yield job.result()
+        return
+
+    limit = max(1, max_in_flight or workers * 2)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending: Dict[Future, Union[Path, _PdfJob]] = {}
+    outstanding: Dict[int, int] = {}  # id(job) -> ranges not yet extracted
+
+    def _drain(block_until: int) -> Iterator[LoadedDoc]:
+        while len(pending) > block_until:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                owner = pending.pop(fut)
+                if isinstance(owner, _PdfJob):
+                    try:
+                        owner.add(*fut.result(), cache=split.cache)
+                    except Exception as e:  # e.g. the worker crashed (BrokenProcessPool)
+                        owner.add(0, [], 0.0, f"{type(e).__name__}: {e}", cache=None)
+                    outstanding[id(owner)] -= 1
+                    if not outstanding[id(owner)]:
+                        del outstanding[id(owner)]
+                        yield owner.result()
+                    continue
+                try:
+                    yield fut.result()
+                except Exception as e:  # e.g. the worker crashed (BrokenProcessPool)
+                    yield LoadedDoc(source_path=owner, text="", error=f"{type(e).__name__}: {e}")
+
+    try:
+        for p in paths:
+            if p.suffix.lower() not in CPU_HEAVY_EXTS:
+                yield _load_safe(p)
+                continue
+            job = _plan_pdf(p, split, parallel=True) if p.suffix.lower() == ".pdf" else None
+            if job is not None:
+                if not job.ranges:
+                    yield job.result()  # every page came from the cache
+                    continue
+                outstanding[id(job)] = len(job.ranges)
+                for start, stop in job.ranges:
+                    try:
+                        pending[pool.submit(_extract_range, p, start, stop)] = job
+                    except Exception as e:
+                        outstanding[id(job)] -= 1
+                        job.add(start, [], 0.0, f"{type(e).__name__}: {e}", cache=None)
+                    yield from _drain(limit - 1)
+                if outstanding.get(id(job)) == 0:
+                    del outstanding[id(job)]
+                    yield job.result()
+                continue
+            try:
+                pending[pool.submit(_load_safe, p)] = p
+            except Exception as e:
+                yield LoadedDoc(source_path=p, text="", error=f"{type(e).__name__}: {e}")
+                continue
+            yield from _drain(limit - 1)
+        yield from _drain(0)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -10,6 +10,12 @@ def setup_logging(logs_dir: Path, name: str = "kb", level: str = "INFO") -> logg
 
     logger = logging.getLogger(name)
     logger.setLevel(getattr(logging, level.upper(), logging.INFO))
+    if any(
+        isinstance(h, logging.FileHandler) and h.baseFilename == str(log_path.absolute()) for h in logger.handlers
+    ):
+        return logger  # already set up (e.g. by an earlier search in a long-lived process)
+    for h in logger.handlers:
+        h.close()
     logger.handlers.clear()
 
     fmt = logging.Formatter(
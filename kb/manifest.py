@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import hashlib
 import json
-from dataclasses import dataclass
+import sqlite3
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 def sha256_file(path: Path) -> str:
@@ -20,36 +21,148 @@ def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-@dataclass
+def file_stat(path: Path) -> Dict[str, int]:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def manifest_db_path(manifest_path: Path) -> Path:
+    """The SQLite manifest that replaces `manifest_path` (kb.paths.manifest_path, historically JSON)."""
+    return manifest_path.with_suffix(".sqlite3")
+
+
 class Manifest:
-    path: Path
-    data: Dict[str, Any]
+    """Per-document index state (hash, stat, chunk count) plus the index signature.
+
+    Stored in SQLite (WAL) next to kb.paths.manifest_path. `upsert_doc` commits at once, so
+    documents written before a crash are not redone; stat and signature updates are batched
+    until `save()`. A legacy manifest.json is imported on first load and renamed to
+    manifest.json.migrated.
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.path = manifest_db_path(manifest_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not self.path.exists()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                source_path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                num_chunks INTEGER NOT NULL,
+                ingested_at TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+            """
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('created_at', ?)", (now_iso(),))
+        self._conn.commit()
+        if fresh and manifest_path != self.path and manifest_path.is_file():
+            self._import_json(manifest_path)
+
+    def _import_json(self, json_path: Path) -> None:
+        data = json.loads(json_path.read_text(encoding="utf-8"))
+        with self._conn:
+            for source, doc in (data.get("docs") or {}).items():
+                self._put(source, doc["sha256"], int(doc.get("num_chunks", 0)), doc.get("stat"), doc.get("ingested_at"))
+            for key in ("signature", "created_at"):
+                if data.get(key):
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, data[key]))
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+
+    @staticmethod
+    def exists(manifest_path: Path) -> bool:
+        return manifest_db_path(manifest_path).exists() or manifest_path.exists()
+
+    @classmethod
+    def empty(cls, manifest_path: Path) -> "Manifest":
+        m = cls(manifest_path)
+        with m._lock, m._conn:
+            m._conn.execute("DELETE FROM docs")
+            m._conn.execute("DELETE FROM meta WHERE key = 'signature'")
+        return m
 
     @classmethod
     def load(cls, manifest_path: Path) -> "Manifest":
-        if manifest_path.exists():
-            data = json.loads(manifest_path.read_text(encoding="utf-8"))
-        else:
-            data = {"version": 1, "created_at": now_iso(), "docs": {}, "signature": None}
-        return cls(path=manifest_path, data=data)
+        return cls(manifest_path)
 
     def save(self) -> None:
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(json.dumps(self.data, indent=2, sort_keys=True), encoding="utf-8")
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
 
     def get_doc(self, source_path: str) -> Optional[Dict[str, Any]]:
-        return self.data.get("docs", {}).get(source_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, num_chunks, ingested_at, size, mtime_ns, inode FROM docs WHERE source_path = ?",
+                (source_path,),
+            ).fetchone()
+        if row is None:
+            return None
+        sha, num_chunks, ingested_at, size, mtime_ns, inode = row
+        stat = None if size is None else {"size": size, "mtime_ns": mtime_ns, "inode": inode}
+        return {"sha256": sha, "num_chunks": num_chunks, "ingested_at": ingested_at, "stat": stat}
+
+    def docs(self) -> Dict[str, Dict[str, Any]]:
+        return {s: self.get_doc(s) for s in self.sources()}  # type: ignore[misc]
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT source_path FROM docs ORDER BY source_path")]
+
+    def remove_doc(self, source_path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM docs WHERE source_path = ?", (source_path,))
 
     def set_signature(self, signature: str) -> None:
-        self.data["signature"] = signature
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)", (signature,))
 
     def get_signature(self) -> Optional[str]:
-        return self.data.get("signature")
-
-    def upsert_doc(self, source_path: str, sha256: str, num_chunks: int) -> None:
-        self.data.setdefault("docs", {})
-        self.data["docs"][source_path] = {
-            "sha256": sha256,
-            "num_chunks": num_chunks,
-            "ingested_at": now_iso(),
-        }
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        return row[0] if row else None
+
+    def stat_matches(self, source_path: str, stat: Dict[str, int]) -> bool:
+        """True when the recorded (size, mtime_ns, inode) equals `stat`, i.e. the file is unchanged."""
+        doc = self.get_doc(source_path)
+        return bool(doc) and doc.get("stat") == stat
+
+    def update_stat(self, source_path: str, stat: Dict[str, int]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE docs SET size = ?, mtime_ns = ?, inode = ? WHERE source_path = ?",
+                (stat["size"], stat["mtime_ns"], stat["inode"], source_path),
+            )
+
+    def _put(
+        self, source_path: str, sha256: str, num_chunks: int, stat: Optional[Dict[str, int]], ingested_at: Optional[str]
+    ) -> None:
+        st = stat or {}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO docs (source_path, sha256, num_chunks, ingested_at, size, mtime_ns, inode)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source_path, sha256, num_chunks, ingested_at or now_iso(), st.get("size"), st.get("mtime_ns"), st.get("inode")),
+        )
+
+    def upsert_doc(
+        self,
+        source_path: str,
+        sha256: str,
+        num_chunks: int,
+        stat: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Record a finished document and commit, together with any pending stat updates."""
+        with self._lock, self._conn:
+            self._put(source_path, sha256, num_chunks, stat, None)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import cProfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StageProfiler:
+    """cProfile + tracemalloc per stage, for `kb_cli --profile`.
+
+    cProfile only sees the thread it is enabled on and tracemalloc's peak is process-wide,
+    so the numbers are only meaningful when stages run one after another (ingest switches
+    to serial, in-process loading while a profiler is attached).
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._peaks: Dict[str, int] = {}
+        self._started_tracemalloc = False
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        prof = self._profiles.setdefault(name, cProfile.Profile())
+        base = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1] - base
+                self._peaks[name] = max(self._peaks.get(name, 0), peak)
+
+    def dump(self) -> Dict[str, Dict[str, Any]]:
+        """Write `<stage>.prof` files (readable with pstats/snakeviz) and return a summary."""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        out: Dict[str, Dict[str, Any]] = {}
+        for name, prof in self._profiles.items():
+            path = self.out_dir / f"{name}.prof"
+            prof.dump_stats(str(path))
+            out[name] = {"profile": str(path), "tracemalloc_peak_bytes": self._peaks.get(name, 0)}
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return out
+
+
+class Metrics:
+    """Stage timers and named counters.
+
+    A run (one ingest or search) records into its own `Metrics`, which forwards every
+    observation to `parent` -- normally the process-wide `REGISTRY` exposed on /metrics.
+    """
+
+    def __init__(self, parent: Optional["Metrics"] = None, profiler: Optional[StageProfiler] = None):
+        self.parent = parent
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        self._stage_seconds: Dict[str, float] = {}
+        self._stage_calls: Dict[str, int] = {}
+        self._counters: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + seconds
+            self._stage_calls[stage] = self._stage_calls.get(stage, 0) + 1
+        if self.parent is not None:
+            self.parent.observe(stage, seconds)
+
+    def inc(self, name: str, n: float = 1) -> None:
+        if not n:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        if self.parent is not None:
+            self.parent.inc(name, n)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        with self.profile(stage):
+            t0 = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(stage, time.perf_counter() - t0)
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        if self.profiler is None:
+            yield
+            return
+        with self.profiler.stage(stage):
+            yield
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"calls": self._stage_calls[name], "seconds": round(secs, 4)}
+                    for name, secs in sorted(self._stage_seconds.items())
+                },
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def render_prometheus(self, prefix: str = "kb") -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        snap = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Wall time spent in each pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        for name, st in snap["stages"].items():
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {st["seconds"]}')
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Number of times each pipeline stage ran.",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        for name, st in snap["stages"].items():
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {st["calls"]}')
+        for name, value in snap["counters"].items():
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {int(value) if float(value).is_integer() else value}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Metrics()
+
+
+def counter_delta(after: Dict[str, float], before: Dict[str, float]) -> Dict[str, float]:
+    return {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict
+
+from kb.config import AppConfig
+
+
+def append_note(cfg: AppConfig, text: str) -> Dict[str, Any]:
+    notes_path = cfg.kb.paths.notes_file
+    notes_path.parent.mkdir(parents=True, exist_ok=True)
+    if not notes_path.exists():
+        notes_path.write_text("# Notes\n", encoding="utf-8")
+
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry = f"\n\n## {ts}\n\n{text.strip()}\n"
+    with notes_path.open("a", encoding="utf-8") as f:
+        f.write(entry)
+
+    return {
+        "notes_file": str(notes_path),
+        "appended_chars": len(entry),
+        "ingested": False,
+    }
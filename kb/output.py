@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from kb.lexical import tokenize
+
+# Shapes search results for callers that pay per byte, e.g. agent tool calls:
+# field selection, query-centred snippets with highlight offsets, a total character
+# budget, and compact JSON / NDJSON serialization.
+
+RESULT_FIELDS = ("score", "source", "chunk_id", "text", "metadata", "snippet")
+DEFAULT_FIELDS = ("score", "source", "chunk_id", "text", "metadata")
+DEFAULT_SNIPPET_CHARS = 240
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def parse_fields(fields: Optional[Sequence[str] | str]) -> Optional[List[str]]:
+    """`fields` as given on the command line ("score,source") or in a request body (a list)."""
+    if fields is None:
+        return None
+    names = [f.strip() for f in (fields.split(",") if isinstance(fields, str) else fields) if f.strip()]
+    unknown = [f for f in names if f.split(".", 1)[0] not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown result field(s) {unknown}; choose from {', '.join(RESULT_FIELDS)} or metadata.<key>.")
+    return names
+
+
+def _word_bounds(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Shrink text[start:end] so it neither starts nor ends in the middle of a word."""
+    if 0 < start < end and not text[start - 1].isspace():
+        m = re.search(r"\s", text[start:end])
+        if m:
+            start += m.end()
+    if start < end < len(text) and not text[end].isspace():
+        cut = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+        if cut > start:
+            end = cut
+    return start, end
+
+
+def best_snippet(text: str, query: str, chars: int) -> Tuple[str, int, List[List[int]]]:
+    """A window of about `chars` characters around the sentence sharing most terms with `query`.
+
+    Returns (snippet, offset of the snippet in `text`, [start, end] offsets of query terms
+    within the snippet). The window never cuts a word in half.
+    """
+    terms = set(tokenize(query))
+    best, best_score = (0, min(len(text), chars)), -1
+    for m in _SENTENCE_RE.finditer(text):
+        score = len(terms & set(tokenize(m.group())))
+        if score > best_score:
+            best, best_score = (m.start(), m.end()), score
+    s_start, s_end = best
+    if s_end - s_start > chars:
+        # A long sentence: start a little before its first query term.
+        hits = [m.start() for m in _WORD_RE.finditer(text, s_start, s_end) if m.group().lower() in terms]
+        focus = hits[0] if hits else s_start
+        start = max(s_start, min(focus - chars // 4, s_end - chars))
+    else:
+        start = max(0, s_start - (chars - (s_end - s_start)) // 2)
+        start = max(0, min(start, len(text) - chars))
+    end = min(len(text), start + chars)
+    start, end = _word_bounds(text, start, end)
+    snippet = text[start:end]
+    lead = len(snippet) - len(snippet.lstrip())
+    snippet = snippet.strip()
+    start += lead
+    highlights = [[m.start(), m.end()] for m in _WORD_RE.finditer(snippet) if m.group().lower() in terms]
+    return snippet, start, highlights
+
+
+def _pick(hit: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for f in fields:
+        if f.startswith("metadata."):
+            key = f.split(".", 1)[1]
+            meta = hit.get("metadata") or {}
+            if key in meta:
+                out.setdefault("metadata", {})[key] = meta[key]
+        elif f in hit:
+            out[f] = hit[f]
+    return out
+
+
+def iter_shaped(
+    results: List[Dict[str, Any]],
+    query: str,
+    fields: Optional[Sequence[str]] = None,
+    snippet_chars: Optional[int] = None,
+    max_chars: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """shape_results one hit at a time, so a stream can send each hit as soon as it is shaped."""
+    fields = list(fields or (DEFAULT_FIELDS if snippet_chars is None else ("score", "source", "chunk_id", "snippet")))
+    if snippet_chars is not None and "snippet" not in fields:
+        fields.append("snippet")
+    want_text = "text" in fields or "snippet" in fields
+    budget = max_chars
+    for i, hit in enumerate(results):
+        shaped = _pick(hit, [f for f in fields if f not in ("text", "snippet")])
+        if want_text:
+            share = None if budget is None else max(0, budget // (len(results) - i))
+            text = hit.get("text") or ""
+            if "snippet" in fields:
+                chars = snippet_chars or DEFAULT_SNIPPET_CHARS
+                if share is not None:
+                    chars = min(chars, share)
+                snippet, offset, highlights = best_snippet(text, query, chars) if chars > 0 else ("", 0, [])
+                shaped.update(snippet=snippet, snippet_start=offset, highlights=highlights)
+                used = len(snippet)
+            else:
+                used = len(text) if share is None else min(len(text), share)
+                if used < len(text):
+                    used = _word_bounds(text, 0, used)[1]
+                    shaped["truncated"] = True
+                shaped["text"] = text[:used]
+            if budget is not None:
+                budget -= used
+        yield shaped
+
+
+def shape_results(
+    results: List[Dict[str, Any]],
+    query: str,
+    fields: Optional[Sequence[str]] = None,
+    snippet_chars: Optional[int] = None,
+    max_chars: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Reduce search hits (the dicts in a search response's `results`) to what the caller asked for.
+
+    With `snippet_chars`, hits carry `snippet`, `snippet_start` and `highlights` instead of
+    the full `text`. `max_chars` caps the total length of text/snippets over all hits:
+    each hit gets an equal share of what is left, so space a short hit does not use goes
+    to the hits after it; cut hits are marked `truncated`.
+    """
+    return list(iter_shaped(results, query, fields, snippet_chars, max_chars))
+
+
+def shape_response(
+    res: Dict[str, Any],
+    fields: Optional[Sequence[str]] = None,
+    snippet_chars: Optional[int] = None,
+    max_chars: Optional[int] = None,
+    metrics: bool = True,
+) -> Dict[str, Any]:
+    """Apply shape_results to a search or search_batch response (max_chars applies per query)."""
+    out = dict(res)
+    if not metrics:
+        out.pop("metrics", None)
+        out.pop("cache", None)
+    if "query" in res:
+        out["results"] = shape_results(res["results"], res["query"], fields, snippet_chars, max_chars)
+    else:
+        out["results"] = [
+            {**r, "results": shape_results(r["results"], r["query"], fields, snippet_chars, max_chars)}
+            for r in res["results"]
+        ]
+    return out
+
+
+def snippet_chars_of(value: Any) -> Optional[int]:
+    """A request's `snippet` option: true for the default width, a number of characters, or off."""
+    if value is None or value is False:
+        return None
+    if value is True:
+        return DEFAULT_SNIPPET_CHARS
+    chars = int(value)
+    if chars <= 0:
+        raise ValueError("snippet must be a positive number of characters.")
+    return chars
+
+
+Shaping = Tuple[Optional[List[str]], Optional[int], Optional[int]]
+
+
+def _shaping(fields: Optional[Sequence[str] | str], snippet: Any, max_chars: Optional[int]) -> Optional[Shaping]:
+    """Validated (fields, snippet_chars, max_chars) of a CLI call or request body; None: leave hits as they are."""
+    if fields is None and snippet in (None, False) and max_chars is None:
+        return None
+    return parse_fields(fields), snippet_chars_of(snippet), None if max_chars is None else int(max_chars)
+
+
+def apply_options(
+    res: Dict[str, Any],
+    fields: Optional[Sequence[str] | str] = None,
+    snippet: Any = None,
+    max_chars: Optional[int] = None,
+    metrics: bool = True,
+) -> Dict[str, Any]:
+    """shape_response for the options of a CLI call or request body; no options: `res` as is."""
+    shaping = _shaping(fields, snippet, max_chars)
+    if shaping is None and metrics:
+        return res
+    return shape_response(res, *(shaping or (None, None, None)), metrics=metrics)
+
+
+def dumps_compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_ndjson(
+    res: Dict[str, Any],
+    fields: Optional[Sequence[str] | str] = None,
+    snippet: Any = None,
+    max_chars: Optional[int] = None,
+    metrics: bool = True,
+) -> Iterator[str]:
+    """A search response as NDJSON lines: one per hit (with its rank), then one with the rest.
+
+    A search_batch response gets one line per query (its index, text and hits) instead.
+    The options are those of apply_options; they are checked before the first line, and
+    each hit is shaped only when its line is due, so a reader can use the first hits
+    while later ones are still being cut down and written.
+    """
+    shaping = _shaping(fields, snippet, max_chars)
+    rest = {k: v for k, v in res.items() if k != "results" and (metrics or k not in ("metrics", "cache"))}
+
+    def lines() -> Iterator[str]:
+        if "query" in res:
+            hits = res["results"] if shaping is None else iter_shaped(res["results"], res["query"], *shaping)
+            for rank, hit in enumerate(hits, start=1):
+                yield dumps_compact({"rank": rank, **hit}) + "\n"
+        else:
+            for qi, group in enumerate(res["results"]):
+                if shaping is not None:
+                    group = {**group, "results": shape_results(group["results"], group["query"], *shaping)}
+                yield dumps_compact({"query_index": qi, **group}) + "\n"
+        yield dumps_compact({"done": True, **rest}) + "\n"
+
+    return lines()
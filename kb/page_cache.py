@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Collection, Dict, Mapping
+
+
+class PageCache:
+    """Extracted PDF page text, keyed by (file sha256, page index).
+
+    Lets an interrupted or repeated extraction of a large PDF (a rebuild, a crash halfway
+    through a book) pick up where it stopped instead of parsing every page again.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " doc_hash TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " PRIMARY KEY (doc_hash, page)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_pages(self, doc_hash: str, n_pages: int) -> Dict[int, str]:
+        with self._lock:
+            found = dict(self._conn.execute("SELECT page, text FROM pages WHERE doc_hash = ?", (doc_hash,)))
+        found = {p: t for p, t in found.items() if p < n_pages}
+        self.hits += len(found)
+        self.misses += n_pages - len(found)
+        return found
+
+    def put_pages(self, doc_hash: str, pages: Mapping[int, str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (doc_hash, page, text) VALUES (?, ?, ?)",
+                [(doc_hash, p, t) for p, t in pages.items()],
+            )
+
+    def retain(self, doc_hashes: Collection[str]) -> int:
+        """Drop pages of files that are no longer indexed; returns the number of pages removed."""
+        keep = set(doc_hashes)
+        with self._lock, self._conn:
+            stale = [h for (h,) in self._conn.execute("SELECT DISTINCT doc_hash FROM pages") if h not in keep]
+            removed = 0
+            for h in stale:
+                removed += self._conn.execute("DELETE FROM pages WHERE doc_hash = ?", (h,)).rowcount
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
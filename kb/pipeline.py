@@ -2,16 +2,28 @@ from __future__ import annotations
 
 import json
 import shutil
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-from kb.chunker import chunk_text
+from kb import generations
+from kb.chunker import Chunk, chunk_text, chunk_text_cdc, content_chunk_ids
 from kb.config import AppConfig
+from kb.dedup import DedupIndex
+from kb.embed_cache import EmbeddingCache
 from kb.embedder import Embedder, EmbedderSpec
-from kb.loaders import LoadedDoc, load_all
+from kb.ingest_engine import Stage, StagedPipeline, StageStats
+from kb.lexical import LexicalIndex, reciprocal_rank_fusion
+from kb.loaders import SUPPORTED_EXTS, LoadedDoc, PdfSplit, iter_docs, list_source_files
+from kb.page_cache import PageCache
 from kb.logging_setup import setup_logging
-from kb.manifest import Manifest, sha256_file, now_iso
-from kb.vectordb import VectorDB
+from kb.metrics import REGISTRY, Metrics, counter_delta
+from kb.manifest import Manifest, file_stat, now_iso, sha256_file
+from kb.query_cache import ResultCache
+from kb.reliability import RetryPolicy, get_breaker
+from kb.vectordb import SearchResult, VectorStore, open_vector_store
 
 
 def compute_signature(cfg: AppConfig) -> str:
@@ -22,9 +34,303 @@ def compute_signature(cfg: AppConfig) -> str:
         "local_embed_model": cfg.kb.local_embeddings.model,
         "openai_embed_model": cfg.kb.openai_embeddings.model,
     }
+    vs = cfg.kb.vector_store
+    if vs.backend != "chroma":
+        # Only non-default backends are recorded, so existing Chroma indexes keep their signature.
+        payload["vector_store"] = f"{vs.backend}:{vs.quantization}"
+    ch = cfg.kb.chunking
+    if ch.strategy != "fixed":
+        payload["chunking"] = f"{ch.strategy}:{ch.min_size}:{ch.max_size}"
+    dd = cfg.kb.dedup
+    if dd.enabled:
+        payload["dedup"] = f"simhash:{dd.max_distance}:{dd.min_tokens}"
     return json.dumps(payload, sort_keys=True)
 
 
+def embedder_name_for(cfg: AppConfig) -> str:
+    if cfg.mode == "openai":
+        emb_cfg = cfg.kb.openai_embeddings
+        return f"{emb_cfg.provider}:{emb_cfg.model}"
+    return f"ollama:{cfg.kb.local_embeddings.model}"
+
+
+def _embedder(cfg: AppConfig, spec: EmbedderSpec) -> Embedder:
+    policy = RetryPolicy(cfg.retries, cfg.retry_backoff_seconds, cfg.retry_max_backoff_seconds)
+    cb = cfg.circuit_breaker
+    breaker = get_breaker(f"{spec.provider}:{spec.base_url or ''}", cb.failure_threshold, cb.reset_seconds)
+    return Embedder(spec, retries=cfg.retries, policy=policy, breaker=breaker)
+
+
+def build_embedder(cfg: AppConfig) -> Tuple[Embedder, str]:
+    """Create the embedder for the active mode and return it with its display name."""
+    if cfg.mode == "openai":
+        emb_cfg = cfg.kb.openai_embeddings
+        spec = EmbedderSpec(
+            provider=emb_cfg.provider,
+            model=emb_cfg.model,
+            timeout_seconds=emb_cfg.timeout_seconds,
+            batch_size=emb_cfg.batch_size,
+            batch_max_tokens=emb_cfg.batch_max_tokens,
+            rate_limit_rpm=emb_cfg.rate_limit_rpm,
+            rate_limit_tpm=emb_cfg.rate_limit_tpm,
+            pool_size=emb_cfg.pool_size,
+        )
+        return _embedder(cfg, spec), embedder_name_for(cfg)
+
+    emb_cfg = cfg.kb.local_embeddings
+    spec = EmbedderSpec(
+        provider="ollama",
+        model=emb_cfg.model,
+        base_url=emb_cfg.base_url,
+        timeout_seconds=emb_cfg.timeout_seconds,
+        batch_size=emb_cfg.batch_size,
+        batch_max_tokens=emb_cfg.batch_max_tokens,
+        rate_limit_rpm=emb_cfg.rate_limit_rpm,
+        rate_limit_tpm=emb_cfg.rate_limit_tpm,
+        pool_size=emb_cfg.pool_size,
+    )
+    return _embedder(cfg, spec), embedder_name_for(cfg)
+
+
+def open_embed_cache(cfg: AppConfig) -> Optional[EmbeddingCache]:
+    if not cfg.kb.embed_cache.enabled:
+        return None
+    return EmbeddingCache(cfg.kb.paths.embed_cache_path, max_entries=cfg.kb.embed_cache.max_entries)
+
+
+def embed_with_cache(
+    embedder: Embedder,
+    embedder_name: str,
+    cache: Optional[EmbeddingCache],
+    texts: List[str],
+    skip_failed: bool = False,
+) -> List[Optional[List[float]]]:
+    """Embed texts, serving repeats from the cache and only sending misses to the provider.
+
+    With `skip_failed`, inputs the provider rejects are None (and not cached) instead of raising.
+    """
+    if cache is None:
+        return embedder.embed_many(texts, skip_failed=skip_failed)
+
+    vectors = cache.get_many(embedder_name, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        fresh = embedder.embed_many([texts[i] for i in missing], skip_failed=skip_failed)
+        done = [(texts[i], v) for i, v in zip(missing, fresh) if v is not None]
+        if done:
+            cache.put_many(embedder_name, [t for t, _ in done], [v for _, v in done])
+        for i, v in zip(missing, fresh):
+            vectors[i] = v
+    return vectors
+
+
+class DocChange(NamedTuple):
+    path: Path
+    rel_source: str
+    sha256: str
+    stat: Dict[str, int]
+
+
+def _rel_source(path: Path) -> str:
+    return str(path.relative_to(Path.cwd()))
+
+
+def _is_source(cfg: AppConfig, path: Path) -> bool:
+    raw_dir = cfg.kb.paths.raw_dir
+    return path == cfg.kb.paths.notes_file or (
+        path.suffix.lower() in SUPPORTED_EXTS and raw_dir in path.parents
+    )
+
+
+def source_files(cfg: AppConfig, paths: Optional[Iterable[Path]] = None) -> List[Path]:
+    """Existing source files: all of them, or those at/under `paths` (files or directories)."""
+    if paths is None:
+        files = list_source_files(cfg.kb.paths.raw_dir)
+        if cfg.kb.paths.notes_file.is_file():
+            files.append(cfg.kb.paths.notes_file)
+        return files
+    found: Dict[Path, None] = {}
+    for p in paths:
+        p = Path(p).absolute()
+        if p.is_dir():
+            found.update(dict.fromkeys(f for f in list_source_files(p) if _is_source(cfg, f)))
+        elif p.is_file() and _is_source(cfg, p):
+            found[p] = None
+    return list(found)
+
+
+def plan_removals(cfg: AppConfig, manifest: Manifest, paths: Optional[Iterable[Path]] = None) -> List[str]:
+    """Indexed sources whose file is gone: any of them, or those at/under the missing `paths`."""
+    indexed = manifest.sources()
+    if paths is None:
+        if not cfg.kb.paths.raw_dir.is_dir():
+            return []  # an unmounted or misconfigured raw_dir must not wipe the index
+        present = {_rel_source(f) for f in source_files(cfg)}
+        return [s for s in indexed if s not in present]
+    gone: Dict[str, None] = {}
+    for p in paths:
+        p = Path(p).absolute()
+        if p.exists():
+            continue
+        rel = _rel_source(p)
+        gone.update(dict.fromkeys(s for s in indexed if s == rel or s.startswith(rel + "/")))
+    return list(gone)
+
+
+def plan_changes(
+    cfg: AppConfig, manifest: Manifest, paths: Optional[Iterable[Path]] = None
+) -> Tuple[List[DocChange], int]:
+    """Find new/changed source files without parsing them.
+
+    A file whose (size, mtime_ns, inode) matches the manifest is skipped outright; only
+    files whose stat changed are hashed, and only a changed hash marks them for loading.
+    `paths` limits the check to those files/directories instead of the whole tree.
+    """
+    changes: List[DocChange] = []
+    skipped = 0
+    for path in source_files(cfg, paths):
+        rel_source = _rel_source(path)
+        stat = file_stat(path)
+        if manifest.stat_matches(rel_source, stat):
+            skipped += 1
+            continue
+
+        doc_hash = sha256_file(path)
+        prev = manifest.get_doc(rel_source)
+        if prev and prev.get("sha256") == doc_hash:
+            manifest.update_stat(rel_source, stat)
+            skipped += 1
+            continue
+
+        changes.append(DocChange(path=path, rel_source=rel_source, sha256=doc_hash, stat=stat))
+    return changes, skipped
+
+
+@dataclass
+class _DocJob:
+    change: DocChange
+    error: Optional[str] = None
+    chunks: List[Chunk] = field(default_factory=list)
+    page_spans: List[Tuple[int, int]] = field(default_factory=list)
+    ids: List[str] = field(default_factory=list)
+    # Ids the vector DB already holds for this source; chunks keeping their id are not re-embedded.
+    stored: Set[str] = field(default_factory=set)
+    # Per chunk: the id of the stored chunk it near-duplicates (not embedded or stored), or None.
+    duplicate_of: List[Optional[str]] = field(default_factory=list)
+    embeddings: Optional[List[Optional[List[float]]]] = None  # of to_embed(), in order; None: rejected
+
+    def to_embed(self) -> List[int]:
+        return [
+            i for i, (cid, dup) in enumerate(zip(self.ids, self.duplicate_of)) if dup is None and cid not in self.stored
+        ]
+
+
+def split_chunks(cfg: AppConfig, text: str) -> List[Chunk]:
+    ch = cfg.kb.chunking
+    if ch.strategy == "content":
+        return chunk_text_cdc(text, ch.chunk_size, ch.min_size, ch.max_size)
+    return chunk_text(text, ch.chunk_size, ch.chunk_overlap)
+
+
+def chunk_ids(cfg: AppConfig, change: DocChange, chunks: List[Chunk]) -> List[str]:
+    """Content chunking ids chunks by their text; fixed chunking by document hash and position."""
+    if cfg.kb.chunking.strategy == "content":
+        return content_chunk_ids(change.rel_source, [c.text for c in chunks])
+    return [f"{change.sha256}:{c.chunk_index}" for c in chunks]
+
+
+def page_spans(doc: LoadedDoc, chunks: List[Chunk]) -> List[Tuple[int, int]]:
+    """(first page, last page) of each chunk of a paged document (PDF); empty otherwise."""
+    if not doc.pages:
+        return []
+    starts = [off for off, _ in doc.pages]
+    shift = len(doc.text) - len(doc.text.lstrip())  # chunk offsets are into the stripped text
+
+    def page_at(pos: int) -> int:
+        return doc.pages[max(0, bisect_right(starts, pos) - 1)][1]
+
+    return [(page_at(c.start + shift), page_at(c.start + shift + len(c.text) - 1)) for c in chunks]
+
+
+def _run_serial(docs: Iterable[LoadedDoc], steps: List[Tuple[str, Callable[[Any], Any]]]) -> Dict[str, Dict[str, Any]]:
+    stats = {"load": StageStats("load"), **{name: StageStats(name) for name, _ in steps}}
+    t_start = time.perf_counter()
+    it = iter(docs)
+    while True:
+        t0 = time.perf_counter()
+        item = next(it, None)
+        if item is None:
+            break
+        stats["load"].record(time.perf_counter() - t0)
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            item = fn(item)
+            stats[name].record(time.perf_counter() - t0)
+    wall = time.perf_counter() - t_start
+    return {name: st.as_dict(wall) for name, st in stats.items()}
+
+
+def _profiled(stage: str, items: Iterable[Any], metrics: Metrics) -> Iterator[Any]:
+    # Profile the work a lazy iterator does to produce each item (e.g. in-process loading).
+    it = iter(items)
+    while True:
+        with metrics.profile(stage):
+            item = next(it, None)
+        if item is None:
+            return
+        yield item
+
+
+def _backfill_lexical(vdb: VectorStore, lexical: LexicalIndex) -> None:
+    """Populate an empty lexical index from chunks already stored in the vector DB."""
+    by_source: Dict[str, Tuple[List[str], List[str], List[Dict[str, Any]]]] = {}
+    for ids, docs, metas in vdb.iter_all():
+        for cid, doc, meta in zip(ids, docs, metas):
+            entry = by_source.setdefault(str(meta.get("source_path", "")), ([], [], []))
+            entry[0].append(cid)
+            entry[1].append(doc or "")
+            entry[2].append(meta)
+    for source, (ids, docs, metas) in by_source.items():
+        lexical.replace_source(source, ids, docs, metas)
+
+
+def open_dedup(cfg: AppConfig) -> Optional[DedupIndex]:
+    dd = cfg.kb.dedup
+    if not dd.enabled:
+        return None
+    return DedupIndex(cfg.kb.paths.dedup_path, max_distance=dd.max_distance, min_tokens=dd.min_tokens)
+
+
+def _promote_orphans(
+    dedup: DedupIndex,
+    vdb: VectorStore,
+    lexical: LexicalIndex,
+    embed: Callable[[List[str]], List[Optional[List[float]]]],
+) -> int:
+    """Store one duplicate of each chunk that was replaced or deleted, so its copies stay searchable."""
+    groups: Dict[str, List[Tuple[str, str, Dict[str, Any]]]] = {}
+    for cid, old, text, meta in dedup.orphans():
+        groups.setdefault(old, []).append((cid, text, meta))
+    if not groups:
+        return 0
+    vectors = embed([group[0][1] for group in groups.values()])
+    # A chunk the provider rejected stays an orphan and is tried again next ingest.
+    kept = [(group, v) for group, v in zip(groups.values(), vectors) if v is not None]
+    if not kept:
+        return 0
+    heads = [group[0] for group, _ in kept]
+    vdb.upsert(
+        ids=[cid for cid, _, _ in heads],
+        documents=[text for _, text, _ in heads],
+        embeddings=[v for _, v in kept],
+        metadatas=[meta for _, _, meta in heads],
+    )
+    for (cid, text, meta), (group, _) in zip(heads, kept):
+        lexical.add_chunks(str(meta["source_path"]), [cid], [text], [meta])
+        dedup.promote(cid, [other for other, _, _ in group[1:]])
+    return len(heads)
+
+
 def _write_processed(processed_dir: Path, doc: LoadedDoc) -> Path:
     processed_dir.mkdir(parents=True, exist_ok=True)
     out = processed_dir / (doc.source_path.stem + ".txt")
@@ -32,8 +338,54 @@ def _write_processed(processed_dir: Path, doc: LoadedDoc) -> Path:
     return out
 
 
-def ingest(cfg: AppConfig, rebuild: bool = False) -> Dict[str, Any]:
+def ingest(
+    cfg: AppConfig,
+    rebuild: bool = False,
+    embedder: Optional[Embedder] = None,
+    vdb: Optional[VectorStore] = None,
+    serial: Optional[bool] = None,
+    metrics: Optional[Metrics] = None,
+    resume: bool = False,
+    paths: Optional[Iterable[Path]] = None,
+) -> Dict[str, Any]:
+    """Incrementally index new/changed documents.
+
+    By default extraction, chunking, embedding and vector DB writes run as overlapping
+    stages (see kb.ingest_engine). `serial=True` processes one document at a time,
+    which is easier to debug; both paths produce the same result counts. Stage timings
+    and counters are recorded into `metrics` (a fresh child of `REGISTRY` by default);
+    a metrics object with a profiler attached forces serial, in-process loading.
+
+    With kb.dedup enabled, chunks that near-duplicate an already stored chunk are not
+    embedded or stored; their locations are recorded against that chunk (see kb.dedup)
+    and reported by search.
+
+    An incremental ingest updates the live index generation in place. `rebuild=True`
+    builds a new generation next to it (searches keep using the live one, and `vdb`
+    is not touched), then makes it live and prunes old ones (see kb.generations).
+
+    The manifest commits each document as it is written, so an interrupted run redoes
+    only unfinished documents. `resume=True` continues an interrupted rebuild (the
+    newest incomplete generation) instead of starting over; without one it is a normal
+    incremental ingest.
+
+    `paths` restricts an incremental ingest to those files/directories (e.g. from a file
+    watcher) instead of scanning kb.paths.raw_dir. Indexed files that no longer exist are
+    removed from the vector DB, lexical index and manifest.
+    """
     logger = setup_logging(cfg.kb.paths.logs_dir, name="kb")
+    run = metrics if metrics is not None else Metrics(parent=REGISTRY)
+    base_cfg = cfg
+    resumed = generations.resumable(cfg) if resume else None
+    if resumed:
+        rebuild = True
+        cfg = generations.with_generation(cfg, resumed)
+        vdb = None
+    elif rebuild:
+        cfg = generations.new_generation(cfg)
+        vdb = None  # an injected store belongs to the live generation
+    else:
+        cfg = generations.resolve(cfg)
 
     cfg.kb.paths.notes_file.parent.mkdir(parents=True, exist_ok=True)
     if not cfg.kb.paths.notes_file.exists():
@@ -43,76 +395,145 @@ def ingest(cfg: AppConfig, rebuild: bool = False) -> Dict[str, Any]:
     sig = compute_signature(cfg)
     prev_sig = manifest.get_signature()
 
-    vdb = VectorDB(cfg.kb.paths.chroma_dir, collection_name="kb_store")
+    own_vdb = vdb is None
+    if vdb is None:
+        vdb = open_vector_store(cfg)
 
-    if rebuild:
-        logger.warning("Rebuild requested: resetting vector DB and processed cache.")
-        vdb.reset()
+    lexical = open_lexical(cfg)
+    dedup = open_dedup(cfg)
+    if not rebuild and lexical.count() == 0 and vdb.count() > 0:
+        _backfill_lexical(vdb, lexical)
+        logger.info("Built lexical index from %d existing chunks.", lexical.count())
+
+    if resumed and prev_sig in (None, sig):
+        logger.warning("Resuming rebuild of generation %s.", resumed)
+        prev_sig = None
+    elif rebuild:
+        logger.warning("Rebuild requested: building generation %s.", cfg.kb.paths.generation)
+        if resumed:
+            # Interrupted under a different config: its partial contents cannot be reused.
+            vdb.reset()
+            lexical.reset()
+            if dedup is not None:
+                dedup.reset()
         if cfg.kb.paths.processed_dir.exists():
             shutil.rmtree(cfg.kb.paths.processed_dir, ignore_errors=True)
-        manifest = Manifest.load(cfg.kb.paths.manifest_path)
+        manifest.close()
+        manifest = Manifest.empty(cfg.kb.paths.manifest_path)
         prev_sig = None
 
     if prev_sig and prev_sig != sig and not rebuild:
         raise RuntimeError(
-            "KB config changed since last index build (chunking or embedding model).\n"
-            "Run: make kb-rebuild\n"
+            "KB config changed since last index build (chunking, embedding model, vector store or dedup).\n"
+            "Run: make kb-rebuild (or, if only kb.vector_store changed: python scripts/kb_cli.py migrate-store)\n"
             f"Old signature: {prev_sig}\nNew signature: {sig}"
         )
 
     manifest.set_signature(sig)
 
-    docs = load_all(cfg.kb.paths.raw_dir, extra_files=[cfg.kb.paths.notes_file])
-
-    if cfg.mode == "openai":
-        emb_cfg = cfg.kb.openai_embeddings
-        embedder = Embedder(
-            EmbedderSpec(
-                provider=emb_cfg.provider,
-                model=emb_cfg.model,
-                timeout_seconds=emb_cfg.timeout_seconds,
-            ),
-            retries=cfg.retries,
-        )
-        embedder_name = f"{emb_cfg.provider}:{emb_cfg.model}"
-    else:
-        embedder = Embedder(
-            EmbedderSpec(
-                provider="ollama",
-                model=cfg.kb.local_embeddings.model,
-                base_url=cfg.kb.local_embeddings.base_url,
-                timeout_seconds=cfg.kb.local_embeddings.timeout_seconds,
-            ),
-            retries=cfg.retries,
-        )
-        embedder_name = f"ollama:{cfg.kb.local_embeddings.model}"
-
-    added_chunks = 0
-    updated_docs = 0
-    skipped_docs = 0
-
-    for doc in docs:
-        _write_processed(cfg.kb.paths.processed_dir, doc)
-
-        rel_source = str(doc.source_path.relative_to(Path.cwd()))
-        doc_hash = sha256_file(doc.source_path)
-
-        prev = manifest.get_doc(rel_source)
-        if prev and prev.get("sha256") == doc_hash:
-            skipped_docs += 1
-            continue
-
-        vdb.delete_where({"source_path": rel_source})
-
-        chunks = chunk_text(doc.text, cfg.kb.chunking.chunk_size, cfg.kb.chunking.chunk_overlap)
-        if not chunks:
+    scope = None if rebuild or paths is None else list(paths)
+    changes, skipped_docs = plan_changes(cfg, manifest, scope)
+    manifest.save()  # the signature goes in before any document does
+
+    removed_docs = plan_removals(cfg, manifest, scope)
+    for source in removed_docs:
+        with run.time("upsert"):
+            vdb.delete_where({"source_path": source})
+            lexical.delete_source(source)
+            if dedup is not None:
+                dedup.drop_source(source)
+            manifest.remove_doc(source)
+        generations.bump_version(cfg)
+        logger.info("Removed %s (file deleted).", source)
+
+    embedder_name = embedder_name_for(cfg)
+    cache = None
+    throttled_before = 0.0
+    embed_before: Optional[Dict[str, float]] = None
+
+    def start_embedding() -> None:
+        nonlocal embedder, cache, throttled_before, embed_before
+        if embed_before is not None:
+            return
+        if embedder is None:
+            embedder, _ = build_embedder(cfg)
+        cache = open_embed_cache(cfg)
+        throttled_before = embedder.limiter.throttled_seconds
+        embed_before = embedder.metrics.counters()
+
+    if changes:
+        start_embedding()
+
+    counts = {"added_chunks": 0, "reused_chunks": 0, "updated_docs": 0, "duplicate_chunks": 0}
+    failed_docs: List[str] = []
+    by_path = {c.path: c for c in changes}
+
+    # Stage 2: chunk (and persist the extracted text). It also reads the ids already stored
+    # for the document and its near-duplicates, which decide what the embed stage sends, so
+    # it reads the vector store and dedup index while the write stage updates them; both
+    # serialize their calls with an internal lock. Neither answer can change meanwhile: the
+    # writer only touches other documents, and dedup sees this run's earlier assignments.
+    def prepare(doc: LoadedDoc) -> _DocJob:
+        job = _DocJob(change=by_path[doc.source_path], error=doc.error)
+        run.observe("load", doc.load_seconds)
+        run.inc("docs_loaded")
+        run.inc("bytes_loaded", job.change.stat.get("size", 0))
+        if not doc.error:
+            with run.time("chunk"):
+                _write_processed(cfg.kb.paths.processed_dir, doc)
+                job.chunks = split_chunks(cfg, doc.text)
+                job.page_spans = page_spans(doc, job.chunks)
+                job.ids = chunk_ids(cfg, job.change, job.chunks)
+                job.stored = set(vdb.source_ids(job.change.rel_source))
+            if dedup is not None:
+                with run.time("dedup"):
+                    job.duplicate_of = dedup.assign(job.change.rel_source, job.ids, [c.text for c in job.chunks])
+            else:
+                job.duplicate_of = [None] * len(job.chunks)
+            run.inc("chunks", len(job.chunks))
+        return job
+
+    # Stage 3: embed (several documents in flight at once when pipelined).
+    def embed(job: _DocJob) -> _DocJob:
+        todo = job.to_embed()
+        if todo:
+            with run.time("embed"):
+                job.embeddings = embed_with_cache(
+                    embedder, embedder_name, cache, [job.chunks[i].text for i in todo], skip_failed=True
+                )
+        return job
+
+    # Stage 4: the only stage that writes the vector store, lexical index, dedup index and manifest.
+    def write(job: _DocJob) -> None:
+        change = job.change
+        rel_source = change.rel_source
+        doc_hash = change.sha256
+        if job.error:
+            # Leave the manifest untouched so the file is retried on the next ingest.
+            logger.error("Failed to load %s: %s", rel_source, job.error)
+            failed_docs.append(rel_source)
+            return
+        if job.embeddings is not None and any(v is None for v in job.embeddings):
+            # Its other chunks are in the embedding cache, so the retry next ingest is cheap.
+            rejected = sum(v is None for v in job.embeddings)
+            logger.error("Embedding provider rejected %d chunk(s) of %s; not indexed this run.", rejected, rel_source)
+            failed_docs.append(rel_source)
+            return
+
+        if not job.chunks:
+            with run.time("upsert"):
+                vdb.delete_where({"source_path": rel_source})
+                lexical.delete_source(rel_source)
+                if dedup is not None:
+                    dedup.drop_source(rel_source)
+                # Record it anyway so an unchanged text-less file is not re-parsed on every run.
+                manifest.upsert_doc(rel_source, doc_hash, 0, stat=change.stat)
+            generations.bump_version(cfg)
             logger.warning("No text extracted from %s (skipping).", rel_source)
-            continue
-
-        texts = [c.text for c in chunks]
-        embeddings = embedder.embed_many(texts)
+            return
 
-        ids = [f"{doc_hash}:{c.chunk_index}" for c in chunks]
+        chunks = job.chunks
+        ids = job.ids
         metadatas = [
             {
                 "source_path": rel_source,
@@ -123,73 +544,427 @@ def ingest(cfg: AppConfig, rebuild: bool = False) -> Dict[str, Any]:
             }
             for c in chunks
         ]
+        for meta, (first, last) in zip(metadatas, job.page_spans):
+            meta["page_start"] = first
+            meta["page_end"] = last
+
+        keep = [i for i, dup in enumerate(job.duplicate_of) if dup is None]
+        kept_ids = [ids[i] for i in keep]
+        kept_texts = [chunks[i].text for i in keep]
+        kept_metas = [metadatas[i] for i in keep]
+        duplicates = [
+            (ids[i], dup, chunks[i].text, metadatas[i]) for i, dup in enumerate(job.duplicate_of) if dup is not None
+        ]
+        fresh = job.to_embed()
+        reused = [i for i in keep if ids[i] in job.stored]
+        stale = sorted(job.stored.difference(kept_ids))
+        with run.time("upsert"):
+            # Only chunks whose id changed are removed and added; the others get fresh metadata.
+            vdb.delete_ids(stale)
+            if fresh:
+                vdb.upsert(
+                    ids=[ids[i] for i in fresh],
+                    documents=[chunks[i].text for i in fresh],
+                    embeddings=job.embeddings,
+                    metadatas=[metadatas[i] for i in fresh],
+                )
+            vdb.update_metadata([ids[i] for i in reused], [metadatas[i] for i in reused])
+            lexical.replace_source(rel_source, kept_ids, kept_texts, kept_metas)
+            if dedup is not None:
+                dedup.replace_source(rel_source, kept_ids, kept_texts, duplicates)
+            manifest.upsert_doc(rel_source, doc_hash, len(chunks), stat=change.stat)
+        generations.bump_version(cfg)  # cached search results of the old contents are now stale
+        counts["updated_docs"] += 1
+        counts["added_chunks"] += len(fresh)
+        counts["reused_chunks"] += len(reused)
+        counts["duplicate_chunks"] += len(duplicates)
+        logger.info(
+            "Indexed %s (%d chunks: %d new, %d unchanged, %d removed, %d near-duplicates).",
+            rel_source, len(chunks), len(fresh), len(reused), len(stale), len(duplicates),
+        )
 
-        vdb.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
-        manifest.upsert_doc(rel_source, doc_hash, len(chunks))
-        updated_docs += 1
-        added_chunks += len(chunks)
-        logger.info("Indexed %s (%d chunks).", rel_source, len(chunks))
-
-    manifest.save()
+    # Stage 1: extraction in worker processes, yielded as files finish.
+    profiling = run.profiler is not None
+    ingest_cfg = cfg.kb.ingest
+    page_cache = None
+    if ingest_cfg.page_cache and any(c.path.suffix.lower() == ".pdf" for c in changes):
+        page_cache = PageCache(cfg.kb.paths.page_cache_path)
+    docs: Iterable[LoadedDoc] = iter_docs(
+        [c.path for c in changes],
+        workers=0 if profiling else ingest_cfg.workers,
+        max_in_flight=ingest_cfg.max_in_flight,
+        pdf=PdfSplit(
+            min_pages=ingest_cfg.pdf_split_pages,
+            pages_per_task=ingest_cfg.pdf_pages_per_task,
+            cache=page_cache,
+            hashes={c.path: c.sha256 for c in changes},
+        ),
+    )
+    if profiling:
+        docs = _profiled("load", docs, run)
+    pipelined = (ingest_cfg.pipelined if serial is None else not serial) and not profiling
+    if pipelined and changes:
+        engine = StagedPipeline(
+            "load",
+            [
+                Stage("chunk", prepare),
+                Stage("embed", embed, workers=ingest_cfg.embed_concurrency),
+                Stage("write", write),
+            ],
+            queue_size=ingest_cfg.queue_size,
+        )
+        stages = engine.run(docs)
+    else:
+        stages = _run_serial(docs, [("chunk", prepare), ("embed", embed), ("write", write)])
+
+    promoted = 0
+    total_duplicates = 0
+    if dedup is not None:
+        if dedup.orphans():
+            start_embedding()
+            with run.time("upsert"):
+                promoted = _promote_orphans(
+                    dedup, vdb, lexical, lambda texts: embed_with_cache(embedder, embedder_name, cache, texts, skip_failed=True)
+                )
+            generations.bump_version(cfg)
+            logger.info("Stored %d near-duplicate chunk(s) whose original was replaced or removed.", promoted)
+        total_duplicates = dedup.count_duplicates()
+        dedup.close()
+        run.inc("dedup_duplicates", counts["duplicate_chunks"])
+        run.inc("dedup_promoted", promoted)
+
+    if page_cache is not None:
+        if scope is None and not failed_docs:
+            # Pages of files that were replaced or deleted will not be asked for again.
+            page_cache.retain({d["sha256"] for d in manifest.docs().values()})
+        page_cache.close()
+        run.inc("page_cache_hits", page_cache.hits)
+        run.inc("page_cache_misses", page_cache.misses)
+    manifest.close()
+    lexical.close()
+    total_chunks = vdb.count()
+    if own_vdb:
+        vdb.close()
+    if cache is not None:
+        cache.close()
+        run.inc("embed_cache_hits", cache.hits)
+        run.inc("embed_cache_misses", cache.misses)
+    if embed_before is not None:
+        for name, n in counter_delta(embedder.metrics.counters(), embed_before).items():
+            run.inc(name, n)
+    if rebuild:
+        name = cfg.kb.paths.generation
+        generations.mark_complete(cfg, signature=sig, total_chunks=total_chunks, failed_docs=len(failed_docs))
+        generations.activate(base_cfg, name)
+        pruned = generations.prune(base_cfg, keep=cfg.kb.snapshots.keep)
+        logger.info("Generation %s is live; pruned %s.", name, pruned or "nothing")
 
     result = {
         "mode": cfg.mode,
         "embedder": embedder_name,
-        "added_chunks": added_chunks,
-        "updated_docs": updated_docs,
+        "added_chunks": counts["added_chunks"],
+        "reused_chunks": counts["reused_chunks"],
+        "updated_docs": counts["updated_docs"],
         "skipped_docs": skipped_docs,
-        "total_chunks": vdb.count(),
-        "manifest_path": str(cfg.kb.paths.manifest_path),
+        "removed_docs": removed_docs,
+        "failed_docs": failed_docs,
+        "total_chunks": total_chunks,
+        "cache_hits": cache.hits if cache is not None else 0,
+        "cache_misses": cache.misses if cache is not None else 0,
+        "duplicate_chunks": counts["duplicate_chunks"],
+        "promoted_chunks": promoted,
+        "total_duplicates": total_duplicates,
+        "throttled_seconds": (
+            round(embedder.limiter.throttled_seconds - throttled_before, 3) if embed_before is not None else 0.0
+        ),
+        "manifest_path": str(manifest.path),
         "chroma_dir": str(cfg.kb.paths.chroma_dir),
+        "generation": cfg.kb.paths.generation,
+        "resumed": bool(resumed),
+        "pipelined": pipelined,
+        "stages": stages,
+        "metrics": run.snapshot(),
     }
     logger.info("Ingest done: %s", result)
     return result
 
 
-def search(cfg: AppConfig, query: str, top_k: int) -> Dict[str, Any]:
+def open_lexical(cfg: AppConfig) -> LexicalIndex:
+    return LexicalIndex(cfg.kb.paths.lexical_path)
+
+
+def migrate_store(cfg: AppConfig, source_backend: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """Copy every chunk (text, metadata and stored embedding) from `source_backend` into the
+    configured vector store, then stamp the manifest so ingest accepts the new backend.
+
+    No embedding provider is called. The target store is reset first; the source is left as is.
+    """
+    logger = setup_logging(cfg.kb.paths.logs_dir, name="kb")
+    cfg = generations.resolve(cfg)
+    target_backend = cfg.kb.vector_store.backend
+    if source_backend == target_backend:
+        raise ValueError(
+            f"kb.vector_store.backend is already {target_backend!r}; set it to the backend to migrate to first."
+        )
+
+    t0 = time.perf_counter()
+    source = open_vector_store(cfg, backend=source_backend)
+    target = open_vector_store(cfg)
+    target.reset()
+    copied = 0
+    for ids, docs, metas, embs in source.iter_vectors(batch_size=batch_size):
+        target.upsert(ids=ids, documents=docs, embeddings=embs, metadatas=metas)
+        copied += len(ids)
+    total = target.count()
+    source.close()
+    target.close()
+    generations.bump_version(cfg)
+
+    if Manifest.exists(cfg.kb.paths.manifest_path):
+        manifest = Manifest.load(cfg.kb.paths.manifest_path)
+        if manifest.get_signature():
+            manifest.set_signature(compute_signature(cfg))
+        manifest.close()
+
+    result = {
+        "source": source_backend,
+        "target": target_backend,
+        "copied_chunks": copied,
+        "total_chunks": total,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    logger.info("Vector store migrated: %s", result)
+    return result
+
+
+def _rank(
+    cfg: AppConfig,
+    queries: List[str],
+    top_k: int,
+    mode: str,
+    embedder: Optional[Embedder],
+    vdb: Optional[VectorStore],
+    lexical: Optional[LexicalIndex],
+    run: Metrics,
+    vector_cache: Optional[EmbeddingCache] = None,
+) -> List[List[SearchResult]]:
+    """Rank every query; vectors come from one batched embed call and one vector DB query."""
+    # Hybrid fusion looks deeper than top_k in each ranking so agreement can surface.
+    depth = top_k if mode != "hybrid" else max(top_k * 4, 20)
+    rankings: List[List[List[SearchResult]]] = []
+
+    if mode in ("lexical", "hybrid"):
+        own_lexical = lexical is None
+        if own_lexical:
+            lexical = open_lexical(cfg)
+        with run.time("query"):
+            rankings.append([lexical.search(q, top_k=depth) for q in queries])
+        if own_lexical:
+            lexical.close()
+
+    if mode in ("vector", "hybrid"):
+        if embedder is None:
+            embedder, _ = build_embedder(cfg)
+        own_vdb = vdb is None
+        if vdb is None:
+            vdb = open_vector_store(cfg)
+        embed_before = embedder.metrics.counters()
+        with run.time("embed"):
+            vectors = embed_with_cache(embedder, embedder_name_for(cfg), vector_cache, queries)
+        for name, n in counter_delta(embedder.metrics.counters(), embed_before).items():
+            run.inc(name, n)
+        with run.time("query"):
+            rankings.append(vdb.query_many(vectors, top_k=depth))
+        if own_vdb:
+            vdb.close()
+
+    if mode == "hybrid":
+        return [
+            reciprocal_rank_fusion(per_query, top_k=top_k, k=cfg.kb.retrieval.rrf_k)
+            for per_query in zip(*rankings)
+        ]
+    return rankings[0]
+
+
+def _check_mode(cfg: AppConfig, mode: Optional[str]) -> str:
+    mode = mode or cfg.kb.retrieval.mode
+    if mode not in ("vector", "lexical", "hybrid"):
+        raise ValueError("mode must be 'vector', 'lexical' or 'hybrid'.")
+    return mode
+
+
+_LOCATION_KEYS = ("source_path", "chunk_index", "page_start", "page_end")
+
+
+def _duplicate_locations(cfg: AppConfig, ranked: List[List[SearchResult]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Where else the text of each result occurs (kb.dedup), keyed by chunk id."""
+    if not cfg.kb.dedup.enabled or not cfg.kb.paths.dedup_path.exists():
+        return {}
+    dedup = open_dedup(cfg)
+    try:
+        found = dedup.locations([r.chunk_id for results in ranked for r in results])
+    finally:
+        dedup.close()
+    return {cid: [{k: m[k] for k in _LOCATION_KEYS if k in m} for m in metas] for cid, metas in found.items()}
+
+
+def _result_dicts(
+    results: List[SearchResult], duplicates: Optional[Dict[str, List[Dict[str, Any]]]] = None
+) -> List[Dict[str, Any]]:
+    out = []
+    for r in results:
+        meta = r.metadata
+        if duplicates and r.chunk_id in duplicates:
+            meta = {**meta, "duplicates": duplicates[r.chunk_id]}
+        out.append({"score": r.score, "source": r.source, "chunk_id": r.chunk_id, "text": r.text, "metadata": meta})
+    return out
+
+
+def _cache_stats(cache: Any, hits: int, misses: int) -> Dict[str, Any]:
+    if cache is None:
+        return {"enabled": False}
+    total = cache.hits + cache.misses
+    return {
+        "enabled": True,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(cache.hits / total, 4) if total else 0.0,  # over the cache's lifetime
+    }
+
+
+def _search_cached(
+    cfg: AppConfig,
+    queries: List[str],
+    top_k: int,
+    mode: str,
+    embedder: Optional[Embedder],
+    vdb: Optional[VectorStore],
+    lexical: Optional[LexicalIndex],
+    run: Metrics,
+    vector_cache: Optional[EmbeddingCache],
+    result_cache: Optional[ResultCache],
+) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+    """Result dicts per query, served from `result_cache` where possible, plus cache stats.
+
+    Results are keyed by the index version read before ranking, so an ingest that lands
+    meanwhile can only make a cached entry newer than its key, never older.
+    """
+    own_vectors = vector_cache is None and mode != "lexical" and cfg.kb.search_cache.query_vectors
+    if own_vectors:
+        vector_cache = open_embed_cache(cfg)
+    version = generations.index_version(cfg) if result_cache is not None else ""
+    keys = [(version, mode, top_k, " ".join(q.split())) for q in queries]
+    out: List[Optional[List[Dict[str, Any]]]] = [
+        result_cache.get(k) if result_cache is not None else None for k in keys
+    ]
+    todo = [i for i, r in enumerate(out) if r is None]
+    v_hits, v_misses = (vector_cache.hits, vector_cache.misses) if vector_cache is not None else (0, 0)
+    try:
+        if todo:
+            ranked = _rank(cfg, [queries[i] for i in todo], top_k, mode, embedder, vdb, lexical, run, vector_cache)
+            duplicates = _duplicate_locations(cfg, ranked)
+            for i, results in zip(todo, ranked):
+                out[i] = _result_dicts(results, duplicates)
+                if result_cache is not None:
+                    result_cache.put(keys[i], out[i])
+    finally:
+        if own_vectors and vector_cache is not None:
+            vector_cache.close()
+
+    if vector_cache is not None:
+        v_hits, v_misses = vector_cache.hits - v_hits, vector_cache.misses - v_misses
+    if mode == "lexical":
+        vector_cache = None
+    run.inc("result_cache_hits", len(queries) - len(todo) if result_cache is not None else 0)
+    run.inc("result_cache_misses", len(todo) if result_cache is not None else 0)
+    run.inc("query_vector_cache_hits", v_hits)
+    run.inc("query_vector_cache_misses", v_misses)
+    stats = {
+        "results": _cache_stats(result_cache, len(queries) - len(todo), len(todo)),
+        "query_vectors": _cache_stats(vector_cache, v_hits, v_misses),
+    }
+    return [list(r or []) for r in out], stats
+
+
+def search(
+    cfg: AppConfig,
+    query: str,
+    top_k: int,
+    mode: Optional[str] = None,
+    embedder: Optional[Embedder] = None,
+    vdb: Optional[VectorStore] = None,
+    lexical: Optional[LexicalIndex] = None,
+    metrics: Optional[Metrics] = None,
+    vector_cache: Optional[EmbeddingCache] = None,
+    result_cache: Optional[ResultCache] = None,
+) -> Dict[str, Any]:
+    """Search the KB.
+
+    `mode` is "vector" (embedding similarity), "lexical" (local BM25, no provider call)
+    or "hybrid" (both rankings fused with reciprocal rank fusion); it defaults to
+    kb.retrieval.mode.
+
+    Query vectors are looked up in the embedding cache (`vector_cache`, else the on-disk
+    kb.embed_cache) before calling the provider. Long-running callers pass a `result_cache`
+    to serve repeated queries without ranking again (see kb.service.KBService).
+    """
     logger = setup_logging(cfg.kb.paths.logs_dir, name="kb")
+    run = metrics if metrics is not None else Metrics(parent=REGISTRY)
     q = (query or "").strip()
     if not q:
         raise ValueError("Query must be non-empty.")
+    mode = _check_mode(cfg, mode)
+    cfg = generations.resolve(cfg)
 
-    if cfg.mode == "openai":
-        emb_cfg = cfg.kb.openai_embeddings
-        embedder = Embedder(
-            EmbedderSpec(
-                provider=emb_cfg.provider,
-                model=emb_cfg.model,
-                timeout_seconds=emb_cfg.timeout_seconds,
-            ),
-            retries=cfg.retries,
-        )
-    else:
-        embedder = Embedder(
-            EmbedderSpec(
-                provider="ollama",
-                model=cfg.kb.local_embeddings.model,
-                base_url=cfg.kb.local_embeddings.base_url,
-                timeout_seconds=cfg.kb.local_embeddings.timeout_seconds,
-            ),
-            retries=cfg.retries,
-        )
+    ranked, cache_stats = _search_cached(cfg, [q], top_k, mode, embedder, vdb, lexical, run, vector_cache, result_cache)
+    results = ranked[0]
+    out = {
+        "query": q,
+        "top_k": top_k,
+        "mode": mode,
+        "results": results,
+        "cache": cache_stats,
+        "metrics": run.snapshot(),
+    }
+    stage_ms = {name: round(st["seconds"] * 1000, 1) for name, st in out["metrics"]["stages"].items()}
+    logger.info("Search query=%r top_k=%d mode=%s results=%d ms=%s", q, top_k, mode, len(results), stage_ms)
+    return out
 
-    vdb = VectorDB(cfg.kb.paths.chroma_dir, collection_name="kb_store")
-    qe = embedder.embed_one(q)
-    results = vdb.query(qe, top_k=top_k)
 
+def search_batch(
+    cfg: AppConfig,
+    queries: List[str],
+    top_k: int,
+    mode: Optional[str] = None,
+    embedder: Optional[Embedder] = None,
+    vdb: Optional[VectorStore] = None,
+    lexical: Optional[LexicalIndex] = None,
+    metrics: Optional[Metrics] = None,
+    vector_cache: Optional[EmbeddingCache] = None,
+    result_cache: Optional[ResultCache] = None,
+) -> Dict[str, Any]:
+    """Search for several queries at once; `results[i]` answers `queries[i]`.
+
+    Vector and hybrid modes embed all queries through the batched provider path and send
+    them to the vector DB in a single query, so N queries cost a few requests, not N.
+    """
+    logger = setup_logging(cfg.kb.paths.logs_dir, name="kb")
+    run = metrics if metrics is not None else Metrics(parent=REGISTRY)
+    qs = [(q or "").strip() for q in queries]
+    empty = [i for i, q in enumerate(qs) if not q]
+    if empty:
+        raise ValueError(f"Query must be non-empty (index {empty[0]}).")
+    mode = _check_mode(cfg, mode)
+    cfg = generations.resolve(cfg)
+
+    ranked, cache_stats = _search_cached(cfg, qs, top_k, mode, embedder, vdb, lexical, run, vector_cache, result_cache)
     out = {
-        "query": q,
         "top_k": top_k,
-        "results": [
-            {
-                "score": r.score,
-                "source": r.source,
-                "chunk_id": r.chunk_id,
-                "text": r.text,
-                "metadata": r.metadata,
-            }
-            for r in results
-        ],
+        "mode": mode,
+        "results": [{"query": q, "results": r} for q, r in zip(qs, ranked)],
+        "cache": cache_stats,
+        "metrics": run.snapshot(),
     }
-    logger.info("Search query=%r top_k=%d results=%d", q, top_k, len(results))
+    stage_ms = {name: round(st["seconds"] * 1000, 1) for name, st in out["metrics"]["stages"].items()}
+    logger.info("Search batch queries=%d top_k=%d mode=%s ms=%s", len(qs), top_k, mode, stage_ms)
     return out
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+
+class _Bucket:
+    """Token bucket that may go into debt: callers reserve first, then sleep off the debt."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter shared by threads and asyncio tasks.
+
+    `acquire()` blocks (or `acquire_async()` awaits) until the call fits in both budgets.
+    `penalize()` pauses every caller, e.g. for a provider's `Retry-After`.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None and tokens > 0:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            if wait > 0:
+                self.throttled_seconds += wait
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def penalize(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + max(0.0, seconds))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as delay-seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters: Dict[Tuple[str, Optional[float], Optional[float]], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(key: str, rpm: Optional[float], tpm: Optional[float]) -> RateLimiter:
+    """Return the process-wide limiter for `key`, so every embedder for a provider shares one quota."""
+    with _limiters_lock:
+        lim = _limiters.get((key, rpm, tpm))
+        if lim is None:
+            lim = _limiters[(key, rpm, tpm)] = RateLimiter(rpm=rpm, tpm=tpm)
+        return lim
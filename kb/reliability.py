@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+import requests
+
+from kb.ratelimit import parse_retry_after
+
+T = TypeVar("T")
+
+# 408 Request Timeout, 429 Too Many Requests and 5xx mean "try again later";
+# any other 4xx will fail the same way however often it is sent.
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+# What providers answer for an input they will not embed (too long, empty, malformed):
+# only these are worth retrying with the batch split up.
+REJECTED_INPUT_STATUS = frozenset({400, 413, 422})
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)  # openai.APIStatusError
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)  # requests.HTTPError
+    return status if isinstance(status, int) else None
+
+
+def _is_transient(exc: BaseException) -> bool:
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError)):
+        return True
+    # Only check openai's exceptions when it is already imported: it is slow to import.
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for timeouts, dropped connections, 408/429 and 5xx, also when wrapped (`raise ... from`).
+
+    Everything else is fatal: bad input, a missing API key, other 4xx answers.
+    """
+    seen = 0
+    e: Optional[BaseException] = exc
+    while e is not None and seen < 8:
+        if isinstance(e, CircuitOpenError):
+            return False
+        if _is_transient(e):
+            return True
+        e, seen = e.__cause__, seen + 1
+    return False
+
+
+def is_rejected_input(exc: BaseException) -> bool:
+    """True if the provider answered 400/413/422, also when wrapped (`raise ... from`).
+
+    Auth and config failures (401/403, a missing model or key) are not: splitting the
+    batch cannot fix them.
+    """
+    seen = 0
+    e: Optional[BaseException] = exc
+    while e is not None and seen < 8:
+        if _status(e) in REJECTED_INPUT_STATUS:
+            return True
+        e, seen = e.__cause__, seen + 1
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait (Retry-After header), if any."""
+    e: Optional[BaseException] = exc
+    while e is not None:
+        headers = getattr(getattr(e, "response", None), "headers", None)
+        if headers is not None:
+            return parse_retry_after(headers.get("Retry-After"))
+        e = e.__cause__
+    return None
+
+
+class CircuitBreaker:
+    """Stops calling a provider after `failure_threshold` transient failures in a row.
+
+    While open, calls fail fast with CircuitOpenError. After `reset_seconds` one trial
+    call is let through (half-open): its success closes the breaker, its failure opens
+    it for another `reset_seconds`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def before_call(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True  # this caller is the trial call
+                return
+        raise CircuitOpenError(
+            f"Embedding provider {self.name} is unavailable ({self.failures} failures in a row); "
+            f"not calling it for another {max(0.0, remaining):.0f}s."
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.failure_threshold > 0 and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """End a trial call that failed for a reason unrelated to the provider's health."""
+        with self._lock:
+            self._probing = False
+
+
+_breakers: Dict[Tuple[str, int, float], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key: str, failure_threshold: int, reset_seconds: float) -> CircuitBreaker:
+    """Return the process-wide breaker for `key`, so searches and ingests share one view of a provider."""
+    with _breakers_lock:
+        b = _breakers.get((key, failure_threshold, reset_seconds))
+        if b is None:
+            b = _breakers[(key, failure_threshold, reset_seconds)] = CircuitBreaker(key, failure_threshold, reset_seconds)
+        return b
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Up to `retries` more attempts for retryable errors, with jittered exponential backoff.
+
+    The n-th retry waits a random time between half and all of
+    min(backoff_seconds * 2**n, max_backoff_seconds). A Retry-After from the provider
+    replaces that wait; one longer than max_backoff_seconds ends the retries instead.
+    """
+
+    retries: int = 3
+    backoff_seconds: float = 1.5
+    max_backoff_seconds: float = 30.0
+
+    def delay(self, attempt: int, exc: BaseException) -> Optional[float]:
+        """Seconds to wait before retry number `attempt` (0-based), or None to give up."""
+        if attempt >= self.retries or not is_retryable(exc):
+            return None
+        asked = retry_after(exc)
+        if asked is not None:
+            return asked if asked <= self.max_backoff_seconds else None
+        cap = min(self.backoff_seconds * (2**attempt), self.max_backoff_seconds)
+        return random.uniform(cap / 2, cap)
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        breaker: Optional[CircuitBreaker] = None,
+        on_retry: Optional[Callable[[BaseException, float], None]] = None,
+    ) -> T:
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                out = fn()
+            except Exception as e:
+                transient = is_retryable(e)
+                if breaker is not None:
+                    status = _status(e)
+                    # Rate limiting is the provider working as intended, not an outage.
+                    if transient and status != 429:
+                        breaker.record_failure()
+                    elif status is not None:
+                        breaker.record_success()  # it answered, so it is up
+                    else:
+                        breaker.release()
+                wait = self.delay(attempt, e)
+                if wait is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(e, wait)
+                time.sleep(wait)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return out
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from kb.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+from kb.output import apply_options, iter_ndjson
+from kb.reliability import CircuitOpenError
+from kb.service import KBService
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "kb-daemon/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse one connection
+    service: KBService
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.getLogger("kb").debug("daemon: " + format, *args)
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        self._send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_ndjson(self, lines: Iterable[str]) -> None:
+        # Chunked, so the client can parse the first lines while later ones are still written.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data = line.encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_json(self) -> Dict[str, Any]:
+        n = int(self.headers.get("Content-Length") or 0)
+        if n <= 0:
+            return {}
+        data = json.loads(self.rfile.read(n).decode("utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return data
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, {"ok": True})
+        elif self.path == "/metrics":
+            self._send_bytes(200, REGISTRY.render_prometheus().encode("utf-8"), PROMETHEUS_CONTENT_TYPE)
+        else:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        routes: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            "/search": lambda b: self.service.search(b.get("query", ""), b.get("top_k"), b.get("mode")),
+            "/search-batch": lambda b: self.service.search_batch(b.get("queries") or [], b.get("top_k"), b.get("mode")),
+            "/add-note": lambda b: self.service.add_note(b.get("text", ""), ingest=bool(b.get("ingest"))),
+            "/ingest": lambda b: self.service.ingest(rebuild=bool(b.get("rebuild")), wait=bool(b.get("wait", True))),
+            "/ingest-status": lambda b: self.service.coordinator.status(b.get("seq")),
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+            return
+        try:
+            body = self._read_json()
+            out = route(body)
+            if not self.path.startswith("/search"):
+                self._send(200, out)
+            elif body.get("stream"):
+                # Hits are shaped as they are written (bad options raise before the first line).
+                self._send_ndjson(iter_ndjson(out, *_options(body)))
+            else:
+                self._send(200, apply_options(out, *_options(body)))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except CircuitOpenError as e:
+            self._send(503, {"error": str(e)})
+        except Exception as e:
+            logging.getLogger("kb").exception("daemon request %s failed", self.path)
+            self._send(500, {"error": str(e)})
+
+
+def _options(body: Dict[str, Any]) -> Tuple[Any, Any, Any, bool]:
+    return body.get("fields"), body.get("snippet"), body.get("max_chars"), body.get("metrics") is not False
+
+
+def make_server(service: KBService, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type("KBHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(service: KBService, host: str, port: int) -> None:
+    server = make_server(service, host, port)
+    logging.getLogger("kb").info("KB daemon listening on http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from kb import generations
+from kb.config import AppConfig
+from kb.coordinator import IngestCoordinator
+from kb.embed_cache import EmbeddingCache
+from kb.embedder import Embedder
+from kb.notes import append_note
+from kb.lexical import LexicalIndex
+from kb.pipeline import build_embedder, ingest, open_embed_cache, open_lexical, search, search_batch
+from kb.query_cache import ResultCache
+from kb.vectordb import VectorStore, open_vector_store
+
+
+class KBService:
+    """Keeps the config, embedder and vector DB warm for repeated requests in one process.
+
+    The vector DB and lexical index belong to the live index generation; when a rebuild
+    (here or in another process) switches generations, they are reopened on the next request.
+    Repeated queries are answered from an in-memory result cache keyed by the index version,
+    and query vectors are kept in the on-disk embedding cache (kb.search_cache).
+    """
+
+    def __init__(self, cfg: AppConfig):
+        self.cfg = cfg
+        self._index_cfg = generations.resolve(cfg)
+        self._embedder: Optional[Embedder] = None
+        self._vdb: Optional[VectorStore] = None
+        self._lexical: Optional[LexicalIndex] = None
+        self._vector_cache: Optional[EmbeddingCache] = None
+        sc = cfg.kb.search_cache
+        self.results = ResultCache(sc.max_entries, sc.ttl_seconds) if sc.results else None
+        self._init_lock = threading.Lock()
+        self.coordinator = IngestCoordinator(cfg)
+
+    @property
+    def embedder(self) -> Embedder:
+        with self._init_lock:
+            if self._embedder is None:
+                self._embedder, _ = build_embedder(self.cfg)
+            return self._embedder
+
+    def _sync_generation(self) -> AppConfig:
+        cfg = generations.resolve(self.cfg)
+        with self._init_lock:
+            if cfg.kb.paths.generation != self._index_cfg.kb.paths.generation:
+                # Drop rather than close: searches already running keep their handles.
+                self._index_cfg = cfg
+                self._vdb = None
+                self._lexical = None
+            return self._index_cfg
+
+    @property
+    def vdb(self) -> VectorStore:
+        self._sync_generation()
+        with self._init_lock:
+            if self._vdb is None:
+                self._vdb = open_vector_store(self._index_cfg)
+            return self._vdb
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        self._sync_generation()
+        with self._init_lock:
+            if self._lexical is None:
+                self._lexical = open_lexical(self._index_cfg)
+            return self._lexical
+
+    @property
+    def vector_cache(self) -> Optional[EmbeddingCache]:
+        if not self.cfg.kb.search_cache.query_vectors:
+            return None
+        with self._init_lock:
+            if self._vector_cache is None:
+                self._vector_cache = open_embed_cache(self.cfg)
+            return self._vector_cache
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self._sync_generation().kb.paths.generation
+
+    def warm_up(self) -> None:
+        _ = self.embedder, self.vdb, self.lexical
+
+    def search(self, query: str, top_k: Optional[int] = None, mode: Optional[str] = None) -> Dict[str, Any]:
+        k = int(top_k or self.cfg.kb.retrieval.top_k_default)
+        mode = mode or self.cfg.kb.retrieval.mode
+        return search(
+            self._sync_generation(),
+            query=query,
+            top_k=k,
+            mode=mode,
+            embedder=self.embedder if mode != "lexical" else None,
+            vdb=self.vdb if mode != "lexical" else None,
+            lexical=self.lexical,
+            vector_cache=self.vector_cache if mode != "lexical" else None,
+            result_cache=self.results,
+        )
+
+    def search_batch(self, queries: List[str], top_k: Optional[int] = None, mode: Optional[str] = None) -> Dict[str, Any]:
+        if not isinstance(queries, list):
+            raise ValueError("queries must be a list of strings.")
+        k = int(top_k or self.cfg.kb.retrieval.top_k_default)
+        mode = mode or self.cfg.kb.retrieval.mode
+        return search_batch(
+            self._sync_generation(),
+            queries=[str(q) for q in queries],
+            top_k=k,
+            mode=mode,
+            embedder=self.embedder if mode != "lexical" else None,
+            vdb=self.vdb if mode != "lexical" else None,
+            lexical=self.lexical,
+            vector_cache=self.vector_cache if mode != "lexical" else None,
+            result_cache=self.results,
+        )
+
+    def _run_ingest(self, rebuild: bool, resume: bool, paths: Optional[List[Path]]) -> Dict[str, Any]:
+        return ingest(
+            self.cfg, rebuild=rebuild, resume=resume, embedder=self.embedder, vdb=None if rebuild else self.vdb, paths=paths
+        )
+
+    def ingest(self, rebuild: bool = False, paths: Optional[Iterable[Path]] = None, wait: bool = True) -> Dict[str, Any]:
+        # Ingests are serialized across threads and processes (kb.coordinator); requests made
+        # while one runs share its follow-up run. Searches keep using the live generation meanwhile.
+        out = self.coordinator.ingest(self._run_ingest, paths=paths, rebuild=rebuild, wait=wait)
+        self._sync_generation()
+        return out
+
+    def add_note(self, text: str, ingest: bool = False) -> Dict[str, Any]:
+        if not (text or "").strip():
+            raise ValueError("Note text must be non-empty.")
+        out = append_note(self.cfg, text)
+        if ingest:
+            self.ingest(rebuild=False)
+            out["ingested"] = True
+        return out
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Protocol, Tuple
 
-import chromadb
+if TYPE_CHECKING:
+    from kb.config import AppConfig
 
 
 @dataclass(frozen=True)
@@ -16,9 +18,63 @@ class SearchResult:
     metadata: Dict[str, Any]
 
 
+class VectorStore(Protocol):
+    """What the pipeline needs from a vector backend (Chroma `VectorDB` or `kb.flatindex.FlatIndex`)."""
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> None: ...
+
+    def delete_where(self, where: Dict[str, Any]) -> None: ...
+
+    def delete_ids(self, ids: List[str]) -> None: ...
+
+    def source_ids(self, source_path: str) -> List[str]: ...
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None: ...
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]: ...
+
+    def iter_vectors(
+        self, batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[List[float]]]]: ...
+
+    def count(self) -> int: ...
+
+    def reset(self) -> None: ...
+
+    def query(self, query_embedding: List[float], top_k: int = 5) -> List[SearchResult]: ...
+
+    def query_many(self, query_embeddings: List[List[float]], top_k: int = 5) -> List[List[SearchResult]]: ...
+
+    def close(self) -> None: ...
+
+
+def open_vector_store(cfg: "AppConfig", backend: Optional[str] = None) -> VectorStore:
+    """Open the configured vector backend (or `backend`, e.g. the source of a migration)."""
+    vs = cfg.kb.vector_store
+    backend = backend or vs.backend
+    if backend == "flat":
+        from kb.flatindex import FlatIndex
+
+        return FlatIndex(cfg.kb.paths.flat_dir, quantization=vs.quantization)
+    if backend == "chroma":
+        return VectorDB(cfg.kb.paths.chroma_dir, collection_name="kb_store")
+    raise ValueError(f"Unknown vector store backend: {backend!r}")
+
+
 class VectorDB:
     def __init__(self, chroma_dir: Path, collection_name: str = "kb_store"):
+        import chromadb  # heavy; keep `from kb.vectordb import SearchResult` cheap
+
         chroma_dir.mkdir(parents=True, exist_ok=True)
+        # Ingest looks up a document's stored ids in the chunk stage while the write stage
+        # updates the collection from another thread; the lock keeps those calls apart.
+        self._lock = threading.Lock()
         self.client = chromadb.PersistentClient(path=str(chroma_dir))
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
@@ -32,44 +88,108 @@ class VectorDB:
         embeddings: List[List[float]],
         metadatas: List[Dict[str, Any]],
     ) -> None:
-        self.collection.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        with self._lock:
+            self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
 
     def delete_where(self, where: Dict[str, Any]) -> None:
-        self.collection.delete(where=where)
+        with self._lock:
+            self.collection.delete(where=where)
+
+    def delete_ids(self, ids: List[str]) -> None:
+        if ids:
+            with self._lock:
+                self.collection.delete(ids=ids)
+
+    def source_ids(self, source_path: str) -> List[str]:
+        with self._lock:
+            return list(self.collection.get(where={"source_path": source_path}, include=[]).get("ids") or [])
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of stored chunks; their documents and embeddings stay as they are."""
+        if ids:
+            with self._lock:
+                self.collection.update(ids=ids, metadatas=metadatas)
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """Yield (ids, documents, metadatas) pages covering the whole collection."""
+        offset = 0
+        while True:
+            res = self.collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = res.get("ids") or []
+            if not ids:
+                return
+            yield ids, list(res.get("documents") or []), [dict(m or {}) for m in (res.get("metadatas") or [])]
+            offset += len(ids)
+
+    def iter_vectors(
+        self, batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[List[float]]]]:
+        """Like iter_all, plus the stored embeddings (used to migrate to another backend)."""
+        offset = 0
+        while True:
+            res = self.collection.get(
+                include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset
+            )
+            ids = res.get("ids") or []
+            if not ids:
+                return
+            embs = res.get("embeddings")
+            yield (
+                ids,
+                list(res.get("documents") or []),
+                [dict(m or {}) for m in (res.get("metadatas") or [])],
+                [list(map(float, e)) for e in (embs if embs is not None else [])],
+            )
+            offset += len(ids)
 
     def count(self) -> int:
         return self.collection.count()
 
+    def close(self) -> None:
+        # PersistentClient has no explicit close; the collection is flushed on every write.
+        pass
+
     def reset(self) -> None:
-        name = self.collection.name
-        self.client.delete_collection(name=name)
-        self.collection = self.client.get_or_create_collection(
-            name=name,
-            metadata={"hnsw:space": "cosine"},
-        )
+        with self._lock:
+            name = self.collection.name
+            self.client.delete_collection(name=name)
+            self.collection = self.client.get_or_create_collection(
+                name=name,
+                metadata={"hnsw:space": "cosine"},
+            )
 
     def query(self, query_embedding: List[float], top_k: int = 5) -> List[SearchResult]:
+        return self.query_many([query_embedding], top_k=top_k)[0]
+
+    def query_many(self, query_embeddings: List[List[float]], top_k: int = 5) -> List[List[SearchResult]]:
+        """Run several queries in one collection.query call; results come back in input order."""
+        if not query_embeddings:
+            return []
         res = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=top_k,
             include=["documents", "metadatas", "distances"],
         )
 
-        docs = (res.get("documents") or [[]])[0]
-        metas = (res.get("metadatas") or [[]])[0]
-        dists = (res.get("distances") or [[]])[0]
-        ids = (res.get("ids") or [[]])[0]
-
-        out: List[SearchResult] = []
-        for doc, meta, dist, cid in zip(docs, metas, dists, ids):
-            score = 1.0 - float(dist)  # cosine distance -> similarity-ish
-            out.append(
-                SearchResult(
-                    score=score,
-                    text=doc,
-                    source=str(meta.get("source_path", "")),
-                    chunk_id=str(cid),
-                    metadata=dict(meta),
+        n = len(query_embeddings)
+        all_docs = res.get("documents") or [[]] * n
+        all_metas = res.get("metadatas") or [[]] * n
+        all_dists = res.get("distances") or [[]] * n
+        all_ids = res.get("ids") or [[]] * n
+
+        out: List[List[SearchResult]] = []
+        for docs, metas, dists, ids in zip(all_docs, all_metas, all_dists, all_ids):
+            hits: List[SearchResult] = []
+            for doc, meta, dist, cid in zip(docs, metas, dists, ids):
+                score = 1.0 - float(dist)  # cosine distance -> similarity-ish
+                hits.append(
+                    SearchResult(
+                        score=score,
+                        text=doc,
+                        source=str(meta.get("source_path", "")),
+                        chunk_id=str(cid),
+                        metadata=dict(meta),
+                    )
                 )
-            )
+            out.append(hits)
         return out
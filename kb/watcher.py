@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from kb.config import AppConfig
+from kb.loaders import SUPPORTED_EXTS
+
+logger = logging.getLogger("kb")
+
+# Event types that can change what a path contains; opened/closed_no_write cannot.
+_RELEVANT_EVENTS = {"created", "modified", "deleted", "moved", "closed"}
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher: "IngestWatcher"):
+        self.watcher = watcher
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.event_type not in _RELEVANT_EVENTS:
+            return
+        paths = [event.src_path] + ([event.dest_path] if getattr(event, "dest_path", "") else [])
+        for p in paths:
+            self.watcher.record(Path(str(p)), is_directory=event.is_directory)
+
+
+class IngestWatcher:
+    """Turns inotify events under kb.paths.raw_dir (and on the notes file) into ingest batches.
+
+    Events are coalesced per path; `on_batch` receives the affected paths once no event has
+    arrived for `debounce_seconds`, or at the latest `max_delay_seconds` after the first one,
+    so a large copy is ingested in a few batches instead of one ingest per file. Batches run
+    one at a time on the watcher thread; events that arrive meanwhile form the next batch.
+    """
+
+    def __init__(
+        self,
+        cfg: AppConfig,
+        on_batch: Callable[[List[Path]], Any],
+        debounce_seconds: Optional[float] = None,
+        max_delay_seconds: Optional[float] = None,
+    ):
+        self.cfg = cfg
+        self.on_batch = on_batch
+        self.debounce_seconds = cfg.kb.watch.debounce_seconds if debounce_seconds is None else debounce_seconds
+        self.max_delay_seconds = cfg.kb.watch.max_delay_seconds if max_delay_seconds is None else max_delay_seconds
+        self.batches = 0
+        self._pending: Dict[Path, None] = {}
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._observer: Optional[Any] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, path: Path, is_directory: bool = False) -> None:
+        paths = self.cfg.kb.paths
+        if path != paths.notes_file:
+            if paths.raw_dir not in path.parents:
+                return
+            if not is_directory and path.suffix.lower() not in SUPPORTED_EXTS:
+                return  # editor swap files, partial downloads, ...
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_at = now
+            self._last_at = now
+            self._pending[path] = None
+            self._cond.notify()
+
+    def _next_batch(self) -> Optional[List[Path]]:
+        with self._cond:
+            while not self._stopped:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                due = min(self._last_at + self.debounce_seconds, self._first_at + self.max_delay_seconds)
+                if now >= due:
+                    batch = list(self._pending)
+                    self._pending = {}
+                    return batch
+                self._cond.wait(due - now)
+            return None
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.on_batch(batch)
+            except Exception:
+                # Keep watching; the same files are picked up again on their next change.
+                logger.exception("Watch ingest of %d path(s) failed.", len(batch))
+            self.batches += 1
+
+    def start(self) -> None:
+        paths = self.cfg.kb.paths
+        paths.raw_dir.mkdir(parents=True, exist_ok=True)
+        paths.notes_file.parent.mkdir(parents=True, exist_ok=True)
+        handler = _Handler(self)
+        observer = Observer()
+        observer.schedule(handler, str(paths.raw_dir), recursive=True)
+        if paths.raw_dir not in paths.notes_file.parents:
+            observer.schedule(handler, str(paths.notes_file.parent), recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        self._thread = threading.Thread(target=self._loop, name="kb-watch", daemon=True)
+        self._thread.start()
+        logger.info("Watching %s and %s.", paths.raw_dir, paths.notes_file)
+
+    def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import html
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from kb.config import AppConfig, load_config
+from kb.logging_setup import setup_logging
+from kb.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+from kb.output import apply_options, iter_ndjson
+from kb.reliability import CircuitOpenError
+from kb.service import KBService
+
+
+class OutputOptions(BaseModel):
+    # See kb.output: result fields, snippet (true or a width in characters), a total
+    # character budget, and NDJSON streaming instead of one JSON document.
+    fields: Optional[List[str]] = None
+    snippet: Optional[Union[bool, int]] = None
+    max_chars: Optional[int] = None
+    metrics: bool = True
+    stream: bool = False
+
+
+class SearchRequest(OutputOptions):
+    query: str
+    top_k: Optional[int] = None
+    mode: Optional[str] = None
+
+
+class SearchBatchRequest(OutputOptions):
+    queries: List[str]
+    top_k: Optional[int] = None
+    mode: Optional[str] = None
+
+
+def _respond(res: Dict[str, Any], body: OutputOptions) -> Any:
+    options = (body.fields, body.snippet, body.max_chars, body.metrics)
+    try:
+        if body.stream:
+            return StreamingResponse(iter_ndjson(res, *options), media_type="application/x-ndjson")
+        return apply_options(res, *options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+async def _run(request: Request, fn: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+    # Searches block on the embedder and the vector DB, so they run in the thread pool;
+    # the semaphore bounds how many do at once, later requests queue here.
+    state = request.app.state
+    async with state.limit:
+        state.in_flight += 1
+        try:
+            return await run_in_threadpool(fn, *args)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e)) from e
+        finally:
+            state.in_flight -= 1
+
+
+def create_app(
+    cfg: Optional[AppConfig] = None,
+    service: Optional[Any] = None,
+    config_path: str = "agent_config.yaml",
+) -> FastAPI:
+    """The KB search web service.
+
+    The config, embedder, vector DB and lexical index are built once at startup (see
+    KBService) and shared by every request. `service` replaces the KBService, e.g. in tests.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        app_cfg = cfg or load_config(config_path)
+        setup_logging(app_cfg.kb.paths.logs_dir, name="kb")
+        svc = service or KBService(app_cfg)
+        await run_in_threadpool(svc.warm_up)
+        app.state.cfg = app_cfg
+        app.state.service = svc
+        app.state.limit = asyncio.Semaphore(app_cfg.kb.web.max_concurrency)
+        app.state.in_flight = 0
+        yield
+
+    app = FastAPI(title="KnowledgeBot KB", lifespan=lifespan)
+
+    @app.post("/api/search")
+    async def api_search(body: SearchRequest, request: Request) -> Any:
+        res = await _run(request, request.app.state.service.search, body.query, body.top_k, body.mode)
+        return _respond(res, body)
+
+    @app.post("/api/search_batch")
+    async def api_search_batch(body: SearchBatchRequest, request: Request) -> Any:
+        res = await _run(request, request.app.state.service.search_batch, body.queries, body.top_k, body.mode)
+        return _respond(res, body)
+
+    @app.get("/healthz")
+    async def healthz(request: Request) -> Dict[str, Any]:
+        state = request.app.state
+        return {
+            "ok": True,
+            "generation": getattr(state.service, "generation", None),
+            "in_flight": state.in_flight,
+            "max_concurrency": state.cfg.kb.web.max_concurrency,
+        }
+
+    @app.get("/metrics")
+    async def metrics() -> Response:
+        return Response(REGISTRY.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.get("/", response_class=HTMLResponse)
+    async def home(request: Request, q: str = "") -> str:
+        page = ["<html><body style='font-family: sans-serif; max-width: 900px; margin: 40px;'>"]
+        page.append("<h1>KnowledgeBot KB Search</h1>")
+        page.append("<form method='get'>")
+        page.append("<input name='q' style='width: 70%; padding: 8px;' placeholder='Search your KB...'/>")
+        page.append("<button style='padding: 8px;'>Search</button>")
+        page.append("</form>")
+
+        if q.strip():
+            res = await _run(request, request.app.state.service.search, q, 5, None)
+            page.append(f"<h2>Results for: {html.escape(q)}</h2>")
+            for r in res["results"]:
+                page.append("<div style='border: 1px solid #ddd; padding: 12px; margin: 12px 0;'>")
+                page.append(f"<div><b>Score:</b> {r['score']:.3f} <b>Source:</b> {html.escape(r['source'])}</div>")
+                page.append("<pre style='white-space: pre-wrap;'>")
+                page.append(html.escape(r["text"][:1200]))
+                page.append("</pre>")
+                page.append("</div>")
+
+        page.append("</body></html>")
+        return "\n".join(page)
+
+    return app
@@ -2,11 +2,144 @@ from __future__ import annotations
 
 import argparse
 import json
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 
-from kb.config import load_config
-from kb.pipeline import ingest, search
+from kb.config import AppConfig, load_config
+from kb.notes import append_note
+
+if TYPE_CHECKING:
+    from kb.metrics import Metrics, StageProfiler
+    from kb.service import KBService
+    from kb.watcher import IngestWatcher
+
+# kb.pipeline pulls in chromadb, requests and the embedding clients, so it is imported
+# inside the subcommands that need it; add-note without --ingest never loads it.
+
+
+def _add_profile_arg(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="DIR",
+        help="Dump per-stage cProfile stats and tracemalloc peaks (default DIR: logs/profile/<timestamp>)",
+    )
+
+
+def _metrics_for(cfg: AppConfig, args: argparse.Namespace) -> Tuple[Optional["Metrics"], Optional["StageProfiler"]]:
+    if args.profile is None:
+        return None, None
+    from kb.metrics import REGISTRY, Metrics, StageProfiler
+
+    out_dir = Path(args.profile) if args.profile else cfg.kb.paths.logs_dir / "profile" / time.strftime("%Y%m%d-%H%M%S")
+    profiler = StageProfiler(out_dir)
+    profiler.start()
+    return Metrics(parent=REGISTRY, profiler=profiler), profiler
+
+
+def _read_queries(args: argparse.Namespace) -> Iterator[Tuple[int, Any, str]]:
+    """Yield (line number, id, query) from --query flags or from JSONL lines.
+
+    A line may be a JSON object (query under --field) or a bare JSON string.
+    """
+    if args.query:
+        for i, q in enumerate(args.query, start=1):
+            yield i, None, q
+        return
+    fh = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        for i, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                yield i, None, item
+            elif isinstance(item, dict) and isinstance(item.get(args.field), str):
+                yield i, item.get(args.id_field), item[args.field]
+            else:
+                raise ValueError(f"Line {i}: expected a JSON string or an object with a {args.field!r} string.")
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def _coordinated_ingest(
+    cfg: AppConfig,
+    rebuild: bool = False,
+    resume: bool = False,
+    wait: bool = True,
+    serial: Optional[bool] = None,
+    metrics: Optional["Metrics"] = None,
+) -> Dict[str, Any]:
+    """Ingest under the cross-process ingest lock; merged into a running ingest's follow-up if there is one."""
+    from kb.coordinator import IngestCoordinator
+    from kb.pipeline import ingest
+
+    def run(rebuild: bool, resume: bool, paths: Optional[List[Path]]) -> Dict[str, Any]:
+        return ingest(cfg, rebuild=rebuild, serial=serial, metrics=metrics, resume=resume, paths=paths)
+
+    return IngestCoordinator(cfg).ingest(run, rebuild=rebuild, resume=resume, wait=wait)
+
+
+def _add_output_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--fields", default=None, help="Comma-separated result fields, e.g. source,score,metadata.page_start")
+    parser.add_argument(
+        "--snippet",
+        nargs="?",
+        type=int,
+        const=True,  # kb.output.DEFAULT_SNIPPET_CHARS
+        default=None,
+        metavar="CHARS",
+        help="Return a window of CHARS (default: kb.output.DEFAULT_SNIPPET_CHARS) around the best-matching sentence with highlight offsets instead of the full text",
+    )
+    parser.add_argument("--max-chars", type=int, default=None, help="Total characters of text/snippets across results")
+    parser.add_argument("--no-metrics", action="store_true", help="Leave out the metrics and cache sections")
+
+
+def _shape(res: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    from kb.output import apply_options
+
+    return apply_options(res, args.fields, args.snippet, args.max_chars, metrics=not args.no_metrics)
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _start_watcher(service: "KBService", as_json: bool) -> "IngestWatcher":
+    """Catch up on changes made while nobody was watching, then ingest changed paths as they come."""
+    from kb.watcher import IngestWatcher
+
+    def run(paths: Optional[List[Path]]) -> None:
+        t0 = time.perf_counter()
+        res = service.ingest(paths=paths)
+        seconds = time.perf_counter() - t0
+        if as_json:
+            print(json.dumps({"paths": [str(p) for p in paths or []], "seconds": round(seconds, 3), **res}), flush=True)
+        elif res["updated_docs"] or res["removed_docs"] or res["failed_docs"]:
+            print(
+                f"Indexed {res['updated_docs']} doc(s), removed {len(res['removed_docs'])}, "
+                f"failed {len(res['failed_docs'])} in {seconds:.2f}s.",
+                flush=True,
+            )
+
+    run(None)
+    watcher = IngestWatcher(service.cfg, on_batch=run)
+    watcher.start()
+    return watcher
 
 
 def main() -> int:
@@ -19,25 +152,109 @@ def main() -> int:
 
     s_ingest = sub.add_parser("ingest", help="Ingest new/changed documents incrementally.")
     s_ingest.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+    s_ingest.add_argument("--serial", action="store_true", help="Process one document at a time (debugging)")
+    s_ingest.add_argument("--resume", action="store_true", help="Continue an interrupted rebuild instead of the live index")
+    s_ingest.add_argument("--no-wait", action="store_true", help="If another ingest is running, queue this one and exit")
+    _add_profile_arg(s_ingest)
 
-    s_rebuild = sub.add_parser("rebuild", help="Rebuild index from scratch (deletes old index).")
+    s_rebuild = sub.add_parser("rebuild", help="Rebuild the index from scratch into a new generation, then switch to it.")
     s_rebuild.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+    s_rebuild.add_argument("--serial", action="store_true", help="Process one document at a time (debugging)")
+    s_rebuild.add_argument("--no-wait", action="store_true", help="If another ingest is running, queue this one and exit")
+    _add_profile_arg(s_rebuild)
+
+    s_status = sub.add_parser("ingest-status", help="Show queued/running ingests, or wait for one (see ingest --no-wait).")
+    s_status.add_argument("--seq", type=int, default=None, help="Request number printed by ingest --no-wait")
+    s_status.add_argument("--wait", action="store_true", help="Block until the run covering --seq has finished")
 
     s_search = sub.add_parser("search", help="Search the knowledge base.")
     s_search.add_argument("--query", required=True, help="Search query text")
     s_search.add_argument("--top-k", type=int, default=5, help="How many results to return")
+    s_search.add_argument(
+        "--mode",
+        choices=["vector", "lexical", "hybrid"],
+        default=None,
+        help="Ranking: embeddings, local BM25 (offline) or both fused (default: kb.retrieval.mode)",
+    )
     s_search.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+    s_search.add_argument(
+        "--format",
+        choices=["text", "json", "compact", "ndjson"],
+        default=None,
+        help="text (default), json (indented, same as --json), compact (one-line JSON) or ndjson (one line per hit, streamed)",
+    )
+    _add_output_args(s_search)
+    _add_profile_arg(s_search)
+
+    s_batch = sub.add_parser("search-batch", help="Search many queries at once (JSONL in, JSONL out).")
+    s_batch.add_argument("--input", default="-", help="JSONL file of queries, '-' for stdin (ignored with --query)")
+    s_batch.add_argument("--query", action="append", default=[], help="Query text (repeatable) instead of --input")
+    s_batch.add_argument("--field", default="query", help="Key holding the query text in JSON object lines")
+    s_batch.add_argument("--id-field", default="id", help="Key echoed back as `id` on each output line")
+    s_batch.add_argument("--top-k", type=int, default=5, help="How many results per query")
+    s_batch.add_argument("--mode", choices=["vector", "lexical", "hybrid"], default=None, help="Ranking (default: kb.retrieval.mode)")
+    s_batch.add_argument("--batch-size", type=int, default=256, help="Queries embedded and looked up per round trip")
+    s_batch.add_argument("--json", action="store_true", help="One JSON document ({results: [...]}) instead of JSONL")
+    _add_output_args(s_batch)
+
+    s_migrate = sub.add_parser(
+        "migrate-store", help="Copy the index from another vector backend into kb.vector_store (no re-embedding)."
+    )
+    s_migrate.add_argument(
+        "--from",
+        dest="source",
+        choices=["chroma", "flat"],
+        default=None,
+        help="Backend to copy from (default: the one kb.vector_store.backend is not)",
+    )
+    s_migrate.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+
+    s_gens = sub.add_parser("generations", help="List index generations (the live one is marked with *).")
+    s_gens.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+
+    s_rollback = sub.add_parser("rollback", help="Switch back to a previous index generation.")
+    s_rollback.add_argument("--to", default=None, help="Generation name (default: the newest one before the live one)")
+    s_rollback.add_argument("--json", action="store_true", help="Machine-readable JSON output")
+
+    s_snapshot = sub.add_parser("snapshot", help="Copy the live index generation into a new one (stays inactive).")
+    s_snapshot.add_argument("--json", action="store_true", help="Machine-readable JSON output")
 
     s_note = sub.add_parser("add-note", help="Append a note to knowledge/notes/notes.md")
     s_note.add_argument("--text", required=True, help="Note text to append")
     s_note.add_argument("--ingest", action="store_true", help="Ingest after writing the note")
     s_note.add_argument("--json", action="store_true", help="Machine-readable JSON output")
 
+    s_serve = sub.add_parser("serve", help="Run a resident KB daemon (search/add-note/ingest over localhost HTTP).")
+    s_serve.add_argument("--host", default=None, help="Bind address (default: kb.server.host)")
+    s_serve.add_argument("--port", type=int, default=None, help="Port (default: kb.server.port)")
+    s_serve.add_argument("--watch", action="store_true", help="Also ingest files as they change (see `watch`)")
+
+    s_watch = sub.add_parser("watch", help="Keep the index current: ingest files in raw_dir/notes as they change.")
+    s_watch.add_argument("--json", action="store_true", help="One JSON line per ingested batch")
+
     args = p.parse_args()
     cfg = load_config(args.config)
 
     if args.cmd in ("ingest", "rebuild"):
-        res = ingest(cfg, rebuild=(args.cmd == "rebuild"))
+        metrics, profiler = _metrics_for(cfg, args)
+        res = _coordinated_ingest(
+            cfg,
+            rebuild=(args.cmd == "rebuild"),
+            resume=getattr(args, "resume", False),
+            wait=not args.no_wait,
+            serial=True if args.serial else None,
+            metrics=metrics,
+        )
+        if not res["ingest_run"]["done"]:
+            seq = res["ingest_run"]["seq"]
+            if args.json:
+                print(json.dumps(res, indent=2))
+            else:
+                print(f"Another ingest is running; request {seq} will be in its follow-up run.")
+                print(f"Check with: python scripts/kb_cli.py ingest-status --seq {seq} [--wait]")
+            return 0
+        if profiler is not None:
+            res["profile"] = profiler.dump()
         if getattr(args, "json", False):
             print(json.dumps(res, indent=2))
         else:
@@ -46,38 +263,131 @@ def main() -> int:
                 print(f"- {k}: {v}")
         return 0
 
+    if args.cmd == "ingest-status":
+        from kb.coordinator import IngestCoordinator
+
+        coordinator = IngestCoordinator(cfg)
+        if args.wait and args.seq is not None:
+            from kb.pipeline import ingest
+
+            coordinator.wait(args.seq, lambda rebuild, resume, paths: ingest(cfg, rebuild=rebuild, resume=resume, paths=paths))
+        print(json.dumps(coordinator.status(args.seq), indent=2))
+        return 0
+
     if args.cmd == "search":
-        res = search(cfg, query=args.query, top_k=args.top_k)
-        if args.json:
+        from kb.pipeline import search
+
+        metrics, profiler = _metrics_for(cfg, args)
+        res = search(cfg, query=args.query, top_k=args.top_k, mode=args.mode, metrics=metrics)
+        if profiler is not None:
+            res["profile"] = profiler.dump()
+        fmt = args.format or ("json" if args.json else "text")
+        if fmt == "ndjson":
+            from kb.output import iter_ndjson
+
+            # Each hit is shaped just before its line is written.
+            for line in iter_ndjson(res, args.fields, args.snippet, args.max_chars, metrics=not args.no_metrics):
+                sys.stdout.write(line)
+                sys.stdout.flush()  # a reader can act on the first hits before the rest are written
+            return 0
+        res = _shape(res, args)
+        if fmt == "json":
             print(json.dumps(res, indent=2))
+        elif fmt == "compact":
+            from kb.output import dumps_compact
+
+            print(dumps_compact(res))
         else:
             print(f"\nQuery: {res['query']}\n")
             for i, r in enumerate(res["results"], start=1):
-                print(f"[{i}] score={r['score']:.3f} source={r['source']} chunk_id={r['chunk_id']}")
-                print(r["text"][:800].strip())
+                # With --fields, only the fields that were asked for are printed.
+                meta = r.get("metadata") or {}
+                parts = [f"[{i}]"]
+                if "score" in r:
+                    parts.append(f"score={r['score']:.3f}")
+                if "source" in r:
+                    parts.append(f"source={r['source']}")
+                if "page_start" in meta:
+                    first, last = meta["page_start"], meta.get("page_end", meta["page_start"])
+                    parts.append(f"p.{first}" if first == last else f"pp.{first}-{last}")
+                if "chunk_id" in r:
+                    parts.append(f"chunk_id={r['chunk_id']}")
+                if meta.get("duplicates"):
+                    parts.append(f"(+{len(meta['duplicates'])} near-duplicates)")
+                print(" ".join(parts))
+                body = r["snippet"] if "snippet" in r else r.get("text")
+                if body is not None:
+                    print(body[:800].strip())
                 print("-" * 60)
         return 0
 
+    if args.cmd == "search-batch":
+        from kb.service import KBService
+
+        service = KBService(cfg)
+        t0 = time.perf_counter()
+        rows: List[Dict[str, Any]] = []
+        n = 0
+        for batch in _batched(_read_queries(args), max(1, args.batch_size)):
+            res = _shape(service.search_batch([q for _, _, q in batch], top_k=args.top_k, mode=args.mode), args)
+            for (line_no, qid, _), hit in zip(batch, res["results"]):
+                row = {"line": line_no, **({"id": qid} if qid is not None else {}), **hit}
+                if args.json:
+                    rows.append(row)
+                else:
+                    sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+            n += len(batch)
+        if args.json:
+            print(json.dumps({"top_k": args.top_k, "mode": args.mode or cfg.kb.retrieval.mode, "results": rows}, indent=2))
+        sys.stderr.write(f"{n} queries in {time.perf_counter() - t0:.2f}s\n")
+        return 0
+
+    if args.cmd == "migrate-store":
+        from kb.pipeline import migrate_store
+
+        source = args.source or ("chroma" if cfg.kb.vector_store.backend == "flat" else "flat")
+        res = migrate_store(cfg, source_backend=source)
+        if args.json:
+            print(json.dumps(res, indent=2))
+        else:
+            print(f"Migrated {res['copied_chunks']} chunks from {res['source']} to {res['target']} in {res['seconds']}s.")
+        return 0
+
+    if args.cmd in ("generations", "rollback", "snapshot"):
+        from kb import generations
+
+        if args.cmd == "generations":
+            res: Any = generations.list_generations(cfg)
+        elif args.cmd == "rollback":
+            prev, to = generations.rollback(cfg, to=args.to)
+            res = {"previous": prev, "current": to}
+        else:
+            current = generations.current_generation(cfg.kb.paths.snapshots_dir)
+            snap_cfg, methods = generations.clone_generation(cfg, current)
+            res = {
+                "source": current,
+                "snapshot": snap_cfg.kb.paths.generation,
+                "files": methods,
+                "pruned": generations.prune(cfg, keep=cfg.kb.snapshots.keep),
+            }
+        if args.json:
+            print(json.dumps(res, indent=2))
+        elif args.cmd == "generations":
+            for g in res:
+                state = "*" if g["current"] else (" " if g["complete"] else "?")
+                print(f"{state} {g['name']}  {g['path']}")
+        elif args.cmd == "rollback":
+            print(f"Live generation: {res['previous']} -> {res['current']}")
+        else:
+            print(f"Snapshot {res['snapshot']} of {res['source']} ({res['files']}).")
+        return 0
+
     if args.cmd == "add-note":
-        notes_path = cfg.kb.paths.notes_file
-        notes_path.parent.mkdir(parents=True, exist_ok=True)
-        if not notes_path.exists():
-            notes_path.write_text("# Notes\n", encoding="utf-8")
-
-        from datetime import datetime
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entry = f"\n\n## {ts}\n\n{args.text.strip()}\n"
-        with notes_path.open("a", encoding="utf-8") as f:
-            f.write(entry)
-
-        out = {
-            "notes_file": str(notes_path),
-            "appended_chars": len(entry),
-            "ingested": False,
-        }
+        out = append_note(cfg, args.text)
 
         if args.ingest:
-            ingest(cfg, rebuild=False)
+            _coordinated_ingest(cfg)
             out["ingested"] = True
 
         if args.json:
@@ -88,6 +398,39 @@ def main() -> int:
             print(f"- ingested: {out['ingested']}")
         return 0
 
+    if args.cmd == "serve":
+        from kb.logging_setup import setup_logging
+        from kb.server import serve
+        from kb.service import KBService
+
+        setup_logging(cfg.kb.paths.logs_dir, name="kb")
+        service = KBService(cfg)
+        service.warm_up()
+        watcher = _start_watcher(service, as_json=False) if args.watch else None
+        try:
+            serve(service, host=args.host or cfg.kb.server.host, port=args.port or cfg.kb.server.port)
+        finally:
+            if watcher is not None:
+                watcher.stop()
+        return 0
+
+    if args.cmd == "watch":
+        from kb.logging_setup import setup_logging
+        from kb.service import KBService
+
+        setup_logging(cfg.kb.paths.logs_dir, name="kb")
+        service = KBService(cfg)
+        watcher = _start_watcher(service, as_json=args.json)
+        print("Watching for changes (Ctrl+C to stop).", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.stop()
+        return 0
+
     raise RuntimeError("unreachable")
 
 
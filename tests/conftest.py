@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import pytest
+import yaml
+
+from bench.fake_embed_server import FakeEmbedState, start_server
+from kb.config import AppConfig, load_config
+from kb.embedder import Embedder, EmbedderSpec
+
+
+@pytest.fixture
+def kb_cfg(tmp_path: Path, monkeypatch) -> AppConfig:
+    """A throwaway KB layout under tmp_path with the working directory set to it."""
+    for d in ("knowledge/raw", "knowledge/notes", "knowledge/index/chroma", "knowledge/processed", "knowledge/snapshots", "logs"):
+        (tmp_path / d).mkdir(parents=True)
+    (tmp_path / "knowledge/notes/notes.md").write_text("# Notes\n", encoding="utf-8")
+
+    cfg = {
+        "agent": {"name": "T", "role": "T", "description": "T"},
+        "mode": "local",
+        "kb": {
+            "paths": {
+                "raw_dir": str(tmp_path / "knowledge/raw"),
+                "notes_file": str(tmp_path / "knowledge/notes/notes.md"),
+                "processed_dir": str(tmp_path / "knowledge/processed"),
+                "index_dir": str(tmp_path / "knowledge/index"),
+                "chroma_dir": str(tmp_path / "knowledge/index/chroma"),
+                "manifest_path": str(tmp_path / "knowledge/index/manifest.json"),
+                "snapshots_dir": str(tmp_path / "knowledge/snapshots"),
+                "logs_dir": str(tmp_path / "logs"),
+            },
+            "chunking": {"chunk_size": 200, "chunk_overlap": 50},
+            "embeddings": {
+                "local": {"provider": "ollama", "model": "nomic-embed-text", "base_url": "http://127.0.0.1:11434", "timeout_seconds": 1},
+            },
+        },
+        "reliability": {"retries": 1, "retry_backoff_seconds": 0.1},
+    }
+    (tmp_path / "agent_config.yaml").write_text(yaml.safe_dump(cfg, sort_keys=False), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return load_config("agent_config.yaml")
+
+
+@pytest.fixture
+def fake_embedder() -> Iterator[Tuple[Embedder, FakeEmbedState]]:
+    """An Ollama Embedder backed by bench's fake embedding server (16-dim vectors), and the server's stats."""
+    server, state = start_server(dim=16)
+    spec = EmbedderSpec(provider="ollama", model="m", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    yield Embedder(spec, retries=1), state
+    server.shutdown()
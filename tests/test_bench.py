@@ -0,0 +1,43 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+import requests
+
+from bench.corpus import generate_corpus
+from bench.fake_embed_server import fake_vector
+from bench.run import percentiles
+from kb.embedder import Embedder
+from kb.loaders import load_all
+
+
+def test_fake_server_speaks_ollama_and_openai(fake_embedder):
+    url = fake_embedder[0].spec.base_url
+    batch = requests.post(f"{url}/api/embed", json={"model": "m", "input": ["a b", "c"]}, timeout=5).json()
+    single = requests.post(f"{url}/api/embeddings", json={"model": "m", "prompt": "a b"}, timeout=5).json()
+    oa = requests.post(f"{url}/v1/embeddings", json={"model": "m", "input": ["c"]}, timeout=5).json()
+
+    assert batch["embeddings"][0] == single["embedding"] == fake_vector("a b", 16)
+    assert oa["data"][0]["embedding"] == batch["embeddings"][1]
+    stats = requests.get(f"{url}/stats", timeout=5).json()
+    assert stats["requests"] == 3 and stats["inputs"] == 4
+
+
+def test_embedder_against_fake_server(fake_embedder):
+    emb, state = fake_embedder
+    emb = Embedder(dataclasses.replace(emb.spec, batch_size=4), retries=1)
+    texts = [f"text number {i}" for i in range(10)]
+    assert emb.embed_many(texts) == [fake_vector(t, 16) for t in texts]
+    assert state.stats["requests:/api/embed"] == 3
+
+
+def test_corpus_covers_every_format(tmp_path: Path):
+    counts = generate_corpus(tmp_path, 8, words_per_doc=120)
+    assert counts == {"txt": 2, "md": 2, "docx": 2, "pdf": 2}
+    docs = load_all(tmp_path)
+    assert len(docs) == 8 and all(len(d.text.split()) > 20 for d in docs)
+
+
+def test_percentiles():
+    p = percentiles([i / 1000 for i in range(1, 101)])
+    assert p["p50_ms"] == pytest.approx(50.5) and p["p99_ms"] == pytest.approx(99.01)
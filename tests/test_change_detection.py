@@ -0,0 +1,69 @@
+import dataclasses
+import os
+import random
+
+import pytest
+
+import kb.pipeline as pipeline
+from bench.corpus import make_paragraphs
+from kb.manifest import Manifest
+
+
+def test_unchanged_files_are_not_hashed(kb_cfg, monkeypatch):
+    doc = kb_cfg.kb.paths.raw_dir / "doc.txt"
+    doc.write_text("Cats are mammals.", encoding="utf-8")
+    manifest = Manifest.empty(kb_cfg.kb.paths.manifest_path)
+
+    changes, skipped = pipeline.plan_changes(kb_cfg, manifest)
+    assert [c.rel_source for c in changes] == ["knowledge/raw/doc.txt", "knowledge/notes/notes.md"]
+    assert skipped == 0
+    for c in changes:
+        manifest.upsert_doc(c.rel_source, c.sha256, 1, stat=c.stat)
+
+    def no_hashing(path):
+        raise AssertionError(f"hashed {path}")
+
+    monkeypatch.setattr(pipeline, "sha256_file", no_hashing)
+    assert pipeline.plan_changes(kb_cfg, manifest) == ([], 2)
+
+
+def test_touched_but_identical_file_is_skipped(kb_cfg):
+    doc = kb_cfg.kb.paths.raw_dir / "doc.txt"
+    doc.write_text("Cats are mammals.", encoding="utf-8")
+    manifest = Manifest.empty(kb_cfg.kb.paths.manifest_path)
+    for c in pipeline.plan_changes(kb_cfg, manifest)[0]:
+        manifest.upsert_doc(c.rel_source, c.sha256, 1, stat=c.stat)
+
+    st = doc.stat()
+    os.utime(doc, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert pipeline.plan_changes(kb_cfg, manifest) == ([], 2)
+    assert manifest.get_doc("knowledge/raw/doc.txt")["stat"]["mtime_ns"] == st.st_mtime_ns + 1_000_000_000
+
+    doc.write_text("Dogs are mammals too.", encoding="utf-8")
+    changes, skipped = pipeline.plan_changes(kb_cfg, manifest)
+    assert [c.rel_source for c in changes] == ["knowledge/raw/doc.txt"] and skipped == 1
+
+
+@pytest.mark.parametrize("backend", ["chroma", "flat"])
+def test_content_chunking_reembeds_only_edited_chunks(kb_cfg, fake_embedder, backend):
+    chunking = dataclasses.replace(kb_cfg.kb.chunking, chunk_size=600, strategy="content", min_size=300, max_size=1200)
+    store = dataclasses.replace(kb_cfg.kb.vector_store, backend=backend)
+    cfg = dataclasses.replace(kb_cfg, kb=dataclasses.replace(kb_cfg.kb, chunking=chunking, vector_store=store))
+    embedder, state = fake_embedder
+    text = "\n\n".join(make_paragraphs(random.Random(5), 3000))
+    doc = cfg.kb.paths.raw_dir / "book.md"
+    doc.write_text(text, encoding="utf-8")
+    first = pipeline.ingest(cfg, embedder=embedder)
+    assert first["added_chunks"] > 10
+
+    state.reset()
+    cut = len(text) // 3
+    doc.write_text(text[:cut] + " A freshly inserted sentence. " + text[cut:], encoding="utf-8")
+    second = pipeline.ingest(cfg, embedder=embedder)
+    assert second["updated_docs"] == 1 and 1 <= second["added_chunks"] <= 2
+    assert second["reused_chunks"] >= first["added_chunks"] - 2
+    assert state.stats["inputs"] == second["added_chunks"]
+    assert second["total_chunks"] == first["total_chunks"]
+
+    hits = pipeline.search(cfg, "freshly inserted sentence", top_k=1, mode="lexical")["results"]
+    assert "freshly inserted" in hits[0]["text"] and hits[0]["metadata"]["sha256"] == pipeline.sha256_file(doc)
@@ -1,4 +1,7 @@
-from kb.chunker import chunk_text
+import random
+
+from bench.corpus import make_paragraphs
+from kb.chunker import chunk_text, chunk_text_cdc, content_chunk_ids
 
 
 def test_chunking_non_empty():
@@ -9,3 +12,38 @@ def test_chunking_non_empty():
 
 def test_empty_returns_none():
     assert chunk_text("", 100, 10) == []
+
+
+def test_chunk_start_points_into_stripped_text():
+    text = "  alpha beta\n\n   gamma delta epsilon zeta eta theta  "
+    stripped = text.strip()
+    for c in chunk_text(text, chunk_size=12, chunk_overlap=2):
+        assert stripped[c.start : c.start + len(c.text)] == c.text
+
+
+def _book(n=40):
+    return "\n\n".join(make_paragraphs(random.Random(3), 120 * n))
+
+
+def test_content_chunks_cover_text_within_limits():
+    text = _book()
+    chunks = chunk_text_cdc(text, chunk_size=600, min_size=300, max_size=1200)
+    assert len(chunks) > 5
+    assert all(len(c.text) <= 1200 for c in chunks)
+    assert all(len(c.text) >= 250 for c in chunks[:-1])
+    squash = lambda s: "".join(s.split())  # noqa: E731
+    assert squash("".join(c.text for c in chunks)) == squash(text)
+    for c in chunks:
+        assert text.strip()[c.start : c.start + len(c.text)] == c.text
+
+
+def test_content_chunks_survive_an_insert():
+    text = _book()
+    cut = len(text) // 5
+    edited = text[:cut] + " An entirely new sentence lands here. " + text[cut:]
+    before = {c.text for c in chunk_text_cdc(text, 600)}
+    after = {c.text for c in chunk_text_cdc(edited, 600)}
+    assert len(after - before) <= 2 and len(before - after) <= 2
+
+    ids = content_chunk_ids("doc.md", ["same", "other", "same"])
+    assert len(set(ids)) == 3 and content_chunk_ids("doc.md", ["other"])[0] == ids[1]
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from kb.coordinator import IngestCoordinator
+from kb.pipeline import search
+
+
+class _SlowIngest:
+    def __init__(self):
+        self.runs = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, rebuild, resume, paths):
+        self.runs.append(None if paths is None else sorted(p.name for p in paths))
+        self.started.set()
+        assert self.release.wait(5)
+        return {"updated_docs": len(self.runs)}
+
+
+def test_requests_during_an_ingest_share_one_follow_up_run(kb_cfg):
+    coordinator = IngestCoordinator(kb_cfg, poll_seconds=0.01)
+    fn = _SlowIngest()
+    results = {}
+
+    def call(name, paths):
+        results[name] = IngestCoordinator(kb_cfg, poll_seconds=0.01).ingest(fn, paths=paths)
+
+    first = threading.Thread(target=call, args=("first", [kb_cfg.kb.paths.raw_dir / "a.txt"]))
+    first.start()
+    assert fn.started.wait(5)
+    assert coordinator.running()
+
+    queued = coordinator.ingest(fn, paths=[kb_cfg.kb.paths.raw_dir / "b.txt"], wait=False)
+    assert queued["ingest_run"] == {"seq": 2, "done": False, "running": True}
+    others = [threading.Thread(target=call, args=(n, [kb_cfg.kb.paths.raw_dir / f"{n}.txt"])) for n in ("c", "d")]
+    for t in others:
+        t.start()
+    while coordinator.status()["requested"] < 4:
+        time.sleep(0.01)
+
+    # Searches do not wait for the ingest lock.
+    assert search(kb_cfg, "anything", top_k=1, mode="lexical")["results"] == []
+
+    fn.release.set()
+    for t in [first, *others]:
+        t.join(5)
+    assert fn.runs == [["a.txt"], ["b.txt", "c.txt", "d.txt"]]
+    # The first caller held the lock, so it also ran the follow-up; the others only waited.
+    assert [results[n]["ingest_run"]["ran_here"] for n in ("first", "c", "d")] == [True, False, False]
+    assert results["c"]["ingest_run"]["covers"] == results["d"]["ingest_run"]["covers"] == 4
+    assert coordinator.status(2)["done"] and not coordinator.running()
+
+
+def test_scope_of_a_dead_runner_is_run_again(kb_cfg):
+    coordinator = IngestCoordinator(kb_cfg)
+    seq = coordinator.request(paths=[kb_cfg.kb.paths.raw_dir / "a.txt"])
+    with coordinator._state() as state:  # a runner took the request, then its process died
+        state["active"], state["pending"] = state["pending"], None
+    coordinator.request(rebuild=True)
+
+    calls = []
+    record = coordinator.wait(seq, lambda rebuild, resume, paths: calls.append((rebuild, paths)) or {})
+    assert calls == [(True, None)] and record["covers"] == 2
+
+
+def test_a_later_failed_run_does_not_fail_an_earlier_request(kb_cfg):
+    coordinator = IngestCoordinator(kb_cfg)
+
+    def fail(rebuild, resume, paths):
+        raise OSError("disk full")
+
+    seq = coordinator.request()
+    coordinator.run_pending(lambda rebuild, resume, paths: {"updated_docs": 1})
+    coordinator.request()
+    with pytest.raises(OSError):
+        coordinator.run_pending(fail)
+
+    assert coordinator.wait(seq, fail)["result"] == {"updated_docs": 1}
+    assert coordinator.wait(seq + 1, fail)["error"] == "OSError: disk full"
+    assert coordinator.status()["last"]["covers"] == seq + 1
+
+
+def test_paths_of_a_failed_run_are_retried_by_the_next(kb_cfg):
+    coordinator = IngestCoordinator(kb_cfg)
+    raw = kb_cfg.kb.paths.raw_dir
+    calls = []
+
+    def fail_once(rebuild, resume, paths):
+        calls.append(sorted(p.name for p in paths))
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return {"updated_docs": len(paths)}
+
+    seq = coordinator.request(paths=[raw / "a.txt"])
+    with pytest.raises(OSError):
+        coordinator.run_pending(fail_once)
+    assert coordinator.wait(seq, fail_once)["error"] == "OSError: disk full"
+
+    record = coordinator.wait(coordinator.request(paths=[raw / "b.txt"]), fail_once)
+    assert calls == [["a.txt"], ["a.txt", "b.txt"]]
+    assert record["result"] == {"updated_docs": 2}
@@ -0,0 +1,79 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+
+from kb.dedup import DedupIndex, hamming, simhash
+from kb.pipeline import ingest, search
+
+DISCLAIMER = (
+    "This document is provided for internal use only and may not be copied, distributed or "
+    "disclosed to third parties without the prior written consent of the publisher, who accepts "
+    "no liability for errors, omissions or any loss arising from reliance on its contents."
+)
+
+
+@pytest.fixture
+def dedup_cfg(kb_cfg):
+    dedup = dataclasses.replace(kb_cfg.kb.dedup, enabled=True)
+    return dataclasses.replace(kb_cfg, kb=dataclasses.replace(kb_cfg.kb, dedup=dedup))
+
+
+def test_simhash_distance():
+    edited = DISCLAIMER.replace("third parties", "third-parties").replace("contents.", "contents!")
+    assert simhash(DISCLAIMER) == simhash(edited.upper())
+    unrelated = hamming(simhash(DISCLAIMER), simhash("Camels cross the desert in long caravans " * 5))
+    assert hamming(simhash(DISCLAIMER), simhash(DISCLAIMER.replace("publisher", "author"))) < unrelated
+    assert simhash("too short to compare") is None
+
+
+def test_index_assigns_and_promotes(tmp_path: Path):
+    index = DedupIndex(tmp_path / "dedup.sqlite3")
+    assert index.assign("a", ["a:0", "a:1"], [DISCLAIMER, DISCLAIMER.upper()]) == [None, "a:0"]
+    index.replace_source("a", ["a:0"], [DISCLAIMER], [("a:1", "a:0", DISCLAIMER.upper(), {"source_path": "a"})])
+    assert index.assign("b", ["b:0"], [DISCLAIMER + " Revised."]) == ["a:0"]
+    index.replace_source("b", [], [], [("b:0", "a:0", DISCLAIMER, {"source_path": "b", "chunk_index": 0})])
+    assert [m["source_path"] for m in index.locations(["a:0"])["a:0"]] == ["a", "b"]
+
+    index.drop_source("a")
+    assert [o[0] for o in index.orphans()] == ["b:0"]
+    index.promote("b:0", [])
+    assert index.orphans() == [] and index.count_duplicates() == 0
+    assert index.assign("c", ["c:0"], [DISCLAIMER]) == ["b:0"]
+    index.close()
+
+
+def test_ingest_skips_near_duplicates(dedup_cfg, fake_embedder):
+    embedder, state = fake_embedder
+    raw = dedup_cfg.kb.paths.raw_dir
+    (raw / "a.txt").write_text(DISCLAIMER, encoding="utf-8")
+    (raw / "b.txt").write_text(DISCLAIMER.replace("  ", " ").upper(), encoding="utf-8")
+    (raw / "c.txt").write_text("Camels cross the desert in long caravans between the oases. " * 3, encoding="utf-8")
+    res = ingest(dedup_cfg, embedder=embedder, serial=True)
+
+    chunks = res["added_chunks"] + res["duplicate_chunks"]
+    assert res["duplicate_chunks"] > 0 and res["total_duplicates"] == res["duplicate_chunks"]
+    assert res["total_chunks"] == res["added_chunks"]
+    assert state.stats["inputs"] == chunks - res["duplicate_chunks"]
+
+    hits = search(dedup_cfg, "written consent of the publisher", top_k=5, mode="lexical")["results"]
+    assert Path(hits[0]["source"]).name == "a.txt" and "b.txt" not in {Path(h["source"]).name for h in hits}
+    assert {Path(d["source_path"]).name for d in hits[0]["metadata"]["duplicates"]} == {"b.txt"}
+
+    # Once the original goes, a copy is stored in its place and stays searchable.
+    (raw / "a.txt").unlink()
+    res = ingest(dedup_cfg, embedder=embedder)
+    assert res["removed_docs"] == ["knowledge/raw/a.txt"]
+    assert res["promoted_chunks"] > 0 and res["total_duplicates"] == 0
+    hits = search(dedup_cfg, "written consent of the publisher", top_k=5, mode="lexical")["results"]
+    assert Path(hits[0]["source"]).name == "b.txt"
+    assert "duplicates" not in hits[0]["metadata"]
+
+
+def test_dedup_is_part_of_the_signature(kb_cfg, dedup_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    (kb_cfg.kb.paths.raw_dir / "a.txt").write_text(DISCLAIMER, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    with pytest.raises(RuntimeError, match="config changed"):
+        ingest(dedup_cfg, embedder=embedder)
+    assert ingest(dedup_cfg, rebuild=True, embedder=embedder)["failed_docs"] == []
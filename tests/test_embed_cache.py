@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from kb.embed_cache import EmbeddingCache
+from kb.pipeline import ingest
+
+
+def test_cache_roundtrip_and_counters(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3")
+    cache.put_many("ollama:m", ["hello  world"], [[0.5, -1.25]])
+
+    assert cache.get_many("ollama:m", ["hello world", "other"]) == [[0.5, -1.25], None]
+    assert cache.get_many("openai:m", ["hello world"]) == [None]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_entries=2)
+    cache.put_many("e", ["a"], [[1.0]])
+    cache.put_many("e", ["b"], [[2.0]])
+    cache.get_many("e", ["a"])
+    cache.put_many("e", ["c"], [[3.0]])
+
+    assert len(cache) == 2
+    assert cache.get_many("e", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_reingest_only_sends_new_chunks_to_the_provider(kb_cfg, fake_embedder):
+    embedder, state = fake_embedder
+    notes = kb_cfg.kb.paths.notes_file
+    notes.write_text("".join(f"Note {i}: the caravan rested at oasis number {i}.\n" for i in range(30)), encoding="utf-8")
+    first = ingest(kb_cfg, embedder=embedder)
+    assert state.stats["inputs"] == first["added_chunks"] > 3
+
+    state.reset()
+    with notes.open("a", encoding="utf-8") as f:
+        f.write("Note 30: a ship from the harbor brought letters.\n")
+    second = ingest(kb_cfg, embedder=embedder)
+    counters = second["metrics"]["counters"]
+    assert second["updated_docs"] == 1
+    assert state.stats["inputs"] == counters["embed_cache_misses"] == 1  # the chunk holding the new note
+    assert counters["embed_cache_hits"] == second["added_chunks"] - 1
+
+    # A rebuild stores every chunk again, but their vectors all come from the cache.
+    state.reset()
+    rebuilt = ingest(kb_cfg, rebuild=True, embedder=embedder)
+    assert rebuilt["added_chunks"] == rebuilt["total_chunks"] == rebuilt["metrics"]["counters"]["embed_cache_hits"]
+    assert state.stats.get("inputs", 0) == 0
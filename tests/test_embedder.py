@@ -0,0 +1,131 @@
+import pytest
+import requests
+
+from kb.embedder import Embedder, EmbedderSpec, EmbeddingError
+
+
+class _Resp:
+    def __init__(self, status_code, payload, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+    def json(self):
+        return self._payload
+
+
+def test_ollama_batches_keep_input_order(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json, timeout):
+        calls.append(list(json["input"]))
+        return _Resp(200, {"embeddings": [[float(len(t))] for t in json["input"]]})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = Embedder(EmbedderSpec(provider="ollama", model="m", batch_size=2))
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    assert emb.embed_many(texts) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert calls == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
+
+
+def test_failing_batch_is_split(monkeypatch):
+    def fake_post(self, url, json, timeout):
+        if len(json["input"]) > 2:
+            return _Resp(413, {})
+        return _Resp(200, {"embeddings": [[float(len(t))] for t in json["input"]]})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = Embedder(EmbedderSpec(provider="ollama", model="m", batch_size=8))
+
+    assert emb.embed_many(["a", "bb", "ccc", "dddd"]) == [[1.0], [2.0], [3.0], [4.0]]
+
+
+def test_rejected_input_does_not_fail_the_rest(monkeypatch):
+    def fake_post(self, url, json, timeout):
+        texts = json.get("input") or [json.get("prompt")]
+        if "bad" in texts:
+            return _Resp(400, {})
+        return _Resp(200, {"embeddings": [[float(len(t))] for t in texts], "embedding": [float(len(texts[0]))]})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = Embedder(EmbedderSpec(provider="ollama", model="m", batch_size=8))
+    texts = ["a", "bb", "ccc", "bad", "ddddd", "eeeeee"]
+
+    assert emb.embed_many(texts, skip_failed=True) == [[1.0], [2.0], [3.0], None, [5.0], [6.0]]
+    assert emb.metrics.counters()["embed_failed_inputs"] == 1
+    with pytest.raises(EmbeddingError, match="rejected 1 input"):
+        emb.embed_many(texts)
+
+
+def test_auth_failure_raises_without_splitting(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json, timeout):
+        calls.append(url)
+        return _Resp(401, {})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = Embedder(EmbedderSpec(provider="ollama", model="m", base_url="http://auth.test", batch_size=8))
+    with pytest.raises(EmbeddingError, match="refused"):
+        emb.embed_many([f"text {i}" for i in range(16)], skip_failed=True)
+    assert len(calls) == 1 and "embed_batch_failures" not in emb.metrics.counters()
+
+
+def test_missing_api_key_fails_before_throttling(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(requests.Session, "post", lambda *a, **k: pytest.fail("no request without a key"))
+    emb = Embedder(EmbedderSpec(provider="gemini", model="m", base_url="http://no-key.test", rate_limit_rpm=1))
+    with pytest.raises(EmbeddingError, match="GOOGLE_API_KEY"):
+        emb.embed_many([f"text {i}" for i in range(16)], skip_failed=True)
+    assert emb.metrics.counters().get("embed_requests", 0) == 0 and emb.limiter.throttled_seconds == 0
+
+
+def test_batches_respect_token_budget():
+    emb = Embedder(EmbedderSpec(provider="ollama", model="m", batch_size=100, batch_max_tokens=10))
+    assert emb.plan_batches(["x" * 20, "x" * 20, "x" * 20]) == [[0, 1], [2]]
+
+
+def test_429_retry_after_pauses_the_shared_limiter(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json, timeout):
+        calls.append(url)
+        if len(calls) == 1:
+            return _Resp(429, {}, headers={"Retry-After": "0.2"})
+        return _Resp(200, {"embeddings": [[1.0]] * len(json["input"])})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    spec = EmbedderSpec(provider="ollama", model="m", base_url="http://retry-after.test")
+    with pytest.raises(requests.HTTPError):
+        Embedder(spec, retries=0).embed_many(["a", "b"])
+
+    other = Embedder(spec)  # same endpoint, so it waits out the Retry-After too
+    assert other.embed_many(["a", "b"]) == [[1.0], [1.0]]
+    assert other.limiter.throttled_seconds > 0.1
+
+
+def test_ollama_route_is_probed_once_and_connections_are_reused():
+    from bench.fake_embed_server import start_server
+
+    # An older Ollama without /api/embed: batches fall back to the OpenAI-compatible /v1.
+    server, state = start_server(dim=8, missing=("/api/embed",))
+    try:
+        emb = Embedder(EmbedderSpec(provider="ollama", model="m", base_url=f"http://127.0.0.1:{server.server_address[1]}"))
+        for i in range(5):
+            assert len(emb.embed_batch([f"a {i}", f"b {i}"])) == 2
+            assert len(emb.embed_one(f"c {i}")) == 8
+        client = emb._compat_client
+        emb.embed_batch(["d"])
+        assert emb._compat_client is client
+        assert state.stats["requests:/api/embed"] == 1  # the probe, not once per call
+        assert state.stats["requests:/v1/embeddings"] == 6
+        assert state.stats["requests:/api/embeddings"] == 5
+        assert state.stats["connections"] <= 2  # one keep-alive pool each for requests and openai
+        assert emb.metrics.counters()["embed_route_misses"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,129 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+from kb.flatindex import FlatIndex
+from kb.pipeline import ingest, migrate_store, search
+
+
+def _data(n=300, dim=24, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    metas = [{"source_path": f"s{i % 7}.txt", "chunk_index": i} for i in range(n)]
+    return ids, vecs, metas
+
+
+def _exact_top(vecs, q, k):
+    v = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return list(np.argsort(-(v @ (q / np.linalg.norm(q))))[:k])
+
+
+@pytest.mark.parametrize("quant,min_recall", [("fp16", 1.0), ("int8", 0.9)])
+def test_query_matches_exact_search(tmp_path, quant, min_recall):
+    ids, vecs, metas = _data()
+    idx = FlatIndex(tmp_path / "flat", quantization=quant)
+    idx.upsert(ids, [f"doc {i}" for i in ids], vecs.tolist(), metas)
+
+    queries = np.random.default_rng(1).normal(size=(20, vecs.shape[1])).astype(np.float32)
+    results = idx.query_many(queries.tolist(), top_k=5)
+    hits = sum(
+        len({r.chunk_id for r in res} & {ids[i] for i in _exact_top(vecs, q, 5)}) for q, res in zip(queries, results)
+    )
+    assert hits / (20 * 5) >= min_recall
+    assert results[0][0].metadata["chunk_index"] == int(results[0][0].chunk_id[1:])
+    assert results[0][0].score >= results[0][-1].score
+
+
+def test_overwrite_delete_compact_and_reopen(tmp_path):
+    ids, vecs, metas = _data(n=1500)
+    idx = FlatIndex(tmp_path / "flat")
+    idx.upsert(ids, ids, vecs.tolist(), metas)
+    idx.upsert(["c0"], ["new"], [vecs[1].tolist()], [{"source_path": "x.txt"}])
+    assert idx.count() == 1500
+    assert {r.chunk_id for r in idx.query(vecs[1].tolist(), top_k=2)} == {"c0", "c1"}
+
+    other = FlatIndex(tmp_path / "flat")  # e.g. the daemon, watching another process's writes
+    for s in range(7):
+        idx.delete_where({"source_path": f"s{s}.txt"})
+    assert idx.count() == 1
+    assert len(idx._vec_path.read_bytes()) == 24 * 2  # compacted
+    assert [r.chunk_id for r in other.query(vecs[5].tolist(), top_k=3)] == ["c0"]
+    idx.close()
+
+    reopened = FlatIndex(tmp_path / "flat")
+    assert [r.text for r in reopened.query(vecs[1].tolist(), top_k=5)] == ["new"]
+    with pytest.raises(ValueError, match="dimension"):
+        reopened.upsert(["z"], ["z"], [[1.0, 0.0]], [{}])
+    with pytest.raises(ValueError, match="fp16"):
+        FlatIndex(tmp_path / "flat", quantization="int8")
+
+
+def test_migrate_from_chroma(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    for i, topic in enumerate(["camel caravan", "harbor ship", "judge palace"]):
+        (kb_cfg.kb.paths.raw_dir / f"d{i}.txt").write_text(f"{topic} " * 50, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    before = search(kb_cfg, "harbor ship", top_k=3, mode="vector", embedder=embedder)
+
+    flat_cfg = dataclasses.replace(
+        kb_cfg, kb=dataclasses.replace(kb_cfg.kb, vector_store=dataclasses.replace(kb_cfg.kb.vector_store, backend="flat"))
+    )
+    res = migrate_store(flat_cfg, source_backend="chroma")
+    assert res["copied_chunks"] == res["total_chunks"] > 0
+
+    after = search(flat_cfg, "harbor ship", top_k=3, mode="vector", embedder=embedder)
+    # Repeated chunks tie exactly, so compare scores rather than the order among ties.
+    assert [round(r["score"], 3) for r in after["results"]] == [round(r["score"], 3) for r in before["results"]]
+    assert after["results"][0]["source"].endswith("d1.txt")
+    assert ingest(flat_cfg, embedder=embedder)["skipped_docs"] == 4  # manifest accepted the new store
+
+
+def test_query_keeps_its_rows_while_another_process_compacts(tmp_path, monkeypatch):
+    ids, vecs, metas = _data(n=10, dim=8)
+    writer = FlatIndex(tmp_path / "flat")
+    writer.upsert(ids, [f"doc {i}" for i in ids], vecs.tolist(), metas)
+    reader = FlatIndex(tmp_path / "flat")
+
+    top_k = reader._top_k
+
+    def compact_midway(q, k):
+        found = top_k(q, k)
+        writer.delete_ids(ids[:6])  # more dead rows than live ones: renumbers the rest
+        return found
+
+    monkeypatch.setattr(reader, "_top_k", compact_midway)
+    hit = reader.query(vecs[9].tolist(), top_k=1)[0]
+    assert (hit.chunk_id, hit.text) == ("c9", "doc c9")
+    assert len(writer._vec_path.read_bytes()) == 4 * 8 * 2
+    monkeypatch.undo()
+    assert [r.chunk_id for r in reader.query(vecs[9].tolist(), top_k=1)] == ["c9"]
+
+
+def test_second_handle_reads_old_files_until_compaction_commits(tmp_path, monkeypatch):
+    ids, vecs, metas = _data(n=10, dim=8)
+    writer = FlatIndex(tmp_path / "flat", quantization="int8")
+    writer.upsert(ids, [f"doc {i}" for i in ids], vecs.tolist(), metas)
+    old_files = [writer._vec_path, writer._scale_path]
+    reader = FlatIndex(tmp_path / "flat", quantization="int8")
+
+    write_files = writer._write_files
+    seen = []
+
+    def query_between_write_and_commit(*args):
+        write_files(*args)
+        seen.append([r.chunk_id for r in reader.query(vecs[9].tolist(), top_k=1)])
+        seen.append(next(reader.iter_all())[0])
+
+    monkeypatch.setattr(writer, "_write_files", query_between_write_and_commit)
+    writer.delete_ids(ids[:6])
+    assert seen == [["c9"], ids[6:]]  # old row numbers, old files
+    assert not any(p.exists() for p in old_files)
+    assert writer._vec_path.name == "vectors.1.int8"
+
+    fresh = FlatIndex(tmp_path / "flat", quantization="int8")
+    for handle in (reader, fresh):
+        hit = handle.query(vecs[9].tolist(), top_k=1)[0]
+        assert (hit.chunk_id, hit.text) == ("c9", "doc c9")
+        assert next(handle.iter_all())[0] == ids[6:]
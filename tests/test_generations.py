@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from kb import generations
+from kb.manifest import Manifest
+from kb.pipeline import ingest, search
+from kb.service import KBService
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _write(cfg, name, text):
+    (cfg.kb.paths.raw_dir / name).write_text(f"{text} " * 40, encoding="utf-8")
+
+
+def _sources(res):
+    return {Path(r["source"]).name for r in res["results"]}
+
+
+def test_rebuild_switches_generation_while_old_one_serves(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    _write(kb_cfg, "a.txt", "camel caravan")
+    first = ingest(kb_cfg, embedder=embedder)
+    assert first["generation"] == generations.BASE
+
+    service = KBService(kb_cfg)
+    service._embedder = embedder
+    old_vdb = service.vdb
+    (kb_cfg.kb.paths.raw_dir / "a.txt").unlink()
+    _write(kb_cfg, "b.txt", "harbor ship")
+
+    res = service.ingest(rebuild=True)
+    name = res["generation"]
+    assert name.startswith(generations.GEN_PREFIX)
+    assert generations.current_generation(kb_cfg.kb.paths.snapshots_dir) == name
+    assert res["manifest_path"].startswith(str(kb_cfg.kb.paths.snapshots_dir))
+
+    # A handle on the previous generation still answers from it; new requests use the new one.
+    old = {Path(r.source).name for r in old_vdb.query(embedder.embed_many(["x"])[0], top_k=10)}
+    assert "a.txt" in old and "b.txt" not in old
+    assert _sources(service.search("harbor ship", top_k=10, mode="vector")) == {"b.txt", "notes.md"}
+    assert _sources(search(kb_cfg, "caravan ship", top_k=5, mode="lexical")) == {"b.txt"}
+
+    # Incremental ingest updates the live generation in place.
+    _write(kb_cfg, "c.txt", "judge palace")
+    assert ingest(kb_cfg, embedder=embedder)["generation"] == name
+    assert _sources(search(kb_cfg, "judge palace", top_k=1, mode="lexical")) == {"c.txt"}
+
+
+def test_rollback_and_prune(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    _write(kb_cfg, "a.txt", "camel caravan")
+    ingest(kb_cfg, embedder=embedder)
+    names = [ingest(kb_cfg, rebuild=True, embedder=embedder)["generation"] for _ in range(2)]
+
+    prev, to = generations.rollback(kb_cfg)
+    assert (prev, to) == (names[1], names[0])
+    assert _sources(search(kb_cfg, "camel", top_k=1, mode="lexical")) == {"a.txt"}
+    with pytest.raises(ValueError, match="incomplete"):
+        generations.activate(kb_cfg, "gen-missing")
+
+    # Live generation plus `keep` others survive; the base layout goes first.
+    assert generations.prune(kb_cfg, keep=1) == [generations.BASE]
+    assert not Manifest.exists(kb_cfg.kb.paths.manifest_path)
+    assert kb_cfg.kb.paths.embed_cache_path.exists()
+    assert [g["name"] for g in generations.list_generations(kb_cfg)] == names
+
+
+def test_cli_snapshot_copies_live_generation(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    _write(kb_cfg, "a.txt", "camel caravan")
+    ingest(kb_cfg, embedder=embedder)
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    cli = [sys.executable, str(REPO_ROOT / "scripts" / "kb_cli.py")]
+
+    out = json.loads(subprocess.run([*cli, "snapshot", "--json"], capture_output=True, text=True, env=env, check=True).stdout)
+    assert out["source"] == generations.BASE and out["files"]["sqlite_backup"] >= 1
+    assert generations.current_generation(kb_cfg.kb.paths.snapshots_dir) == generations.BASE
+
+    subprocess.run([*cli, "rollback", "--to", out["snapshot"]], capture_output=True, env=env, check=True)
+    assert _sources(search(kb_cfg, "camel", top_k=1, mode="vector", embedder=embedder)) == {"a.txt"}
+    listed = json.loads(subprocess.run([*cli, "generations", "--json"], capture_output=True, text=True, env=env, check=True).stdout)
+    assert [g["name"] for g in listed if g["current"]] == [out["snapshot"]]
@@ -0,0 +1,77 @@
+import pytest
+import requests
+
+import kb.pipeline as pipeline
+from kb.embedder import Embedder, EmbeddingError
+from kb.ingest_engine import Stage, StagedPipeline
+
+
+def test_staged_pipeline_processes_every_item():
+    seen = []
+    engine = StagedPipeline(
+        "source",
+        [Stage("double", lambda x: x * 2, workers=3), Stage("sink", seen.append)],
+        queue_size=2,
+    )
+    stats = engine.run(range(50))
+
+    assert sorted(seen) == [x * 2 for x in range(50)]
+    assert stats["source"]["items"] == 50 and stats["double"]["items"] == 50
+    assert stats["double"]["workers"] == 3
+
+
+def test_staged_pipeline_reraises_stage_errors():
+    def boom(x):
+        if x == 7:
+            raise RuntimeError("bad item")
+        return x
+
+    engine = StagedPipeline("source", [Stage("boom", boom, workers=2), Stage("sink", lambda x: None)], queue_size=1)
+    with pytest.raises(RuntimeError, match="bad item"):
+        engine.run(range(1000))
+
+
+def _fake_embed_batch(self, texts):
+    return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.mark.parametrize("serial", [True, False])
+def test_ingest_counts_match_between_serial_and_pipelined(kb_cfg, monkeypatch, serial):
+    monkeypatch.setattr(Embedder, "embed_batch", _fake_embed_batch)
+    for i in range(5):
+        (kb_cfg.kb.paths.raw_dir / f"doc{i}.txt").write_text(f"Document {i}. " * 40, encoding="utf-8")
+
+    res = pipeline.ingest(kb_cfg, serial=serial)
+
+    assert res["pipelined"] is (not serial)
+    assert res["updated_docs"] == 6  # five docs + notes.md
+    assert res["added_chunks"] == res["total_chunks"] == 16
+    assert res["stages"]["write"]["items"] == 6
+    assert pipeline.ingest(kb_cfg, serial=serial)["skipped_docs"] == 6
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=response)
+
+
+def test_document_with_a_rejected_chunk_is_retried_next_ingest(kb_cfg, monkeypatch):
+    def embed_batch(self, texts):
+        if any("poison" in t for t in texts):
+            raise EmbeddingError("input rejected") from _http_error(400)
+        return _fake_embed_batch(self, texts)
+
+    monkeypatch.setattr(Embedder, "embed_batch", embed_batch)
+    monkeypatch.setattr(Embedder, "embed_one", lambda self, t: embed_batch(self, [t])[0])
+    (kb_cfg.kb.paths.raw_dir / "good.txt").write_text("Good text. " * 40, encoding="utf-8")
+    (kb_cfg.kb.paths.raw_dir / "bad.txt").write_text("Fine text. " * 30 + "poison", encoding="utf-8")
+
+    res = pipeline.ingest(kb_cfg)
+    assert res["failed_docs"] == ["knowledge/raw/bad.txt"]
+    assert res["updated_docs"] == 2  # good.txt + notes.md
+
+    monkeypatch.setattr(Embedder, "embed_batch", _fake_embed_batch)
+    monkeypatch.setattr(Embedder, "embed_one", lambda self, t: _fake_embed_batch(self, [t])[0])
+    again = pipeline.ingest(kb_cfg)
+    assert again["failed_docs"] == [] and again["updated_docs"] == 1
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import kb.pipeline as pipeline
+from kb.embedder import Embedder
+from kb.lexical import LexicalIndex, reciprocal_rank_fusion
+from kb.vectordb import SearchResult
+
+
+def test_bm25_ranks_and_updates_per_source(tmp_path: Path):
+    idx = LexicalIndex(tmp_path / "lex.sqlite3")
+    idx.replace_source("a.md", ["a:0", "a:1"], ["cats purr and cats sleep", "dogs bark"], [{"i": 0}, {"i": 1}])
+    idx.replace_source("b.md", ["b:0"], ["a cat and a dog"], [{"i": 0}])
+
+    hits = idx.search("cats", top_k=5)
+    assert [h.chunk_id for h in hits] == ["a:0"]
+    assert hits[0].source == "a.md" and hits[0].metadata == {"i": 0}
+
+    idx.replace_source("a.md", ["a:9"], ["birds sing"], [{}])
+    assert idx.search("cats") == []
+    assert [h.chunk_id for h in idx.search("birds dog")] in (["a:9", "b:0"], ["b:0", "a:9"])
+    assert idx.count() == 2
+
+    idx.delete_source("a.md")
+    assert idx.search("birds") == [] and idx.count() == 1
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    def r(cid):
+        return SearchResult(score=0.0, text=cid, source="s", chunk_id=cid, metadata={})
+
+    fused = reciprocal_rank_fusion([[r("x"), r("y")], [r("y"), r("z")]], top_k=3)
+    assert [f.chunk_id for f in fused] == ["y", "x", "z"]
+
+
+def test_lexical_search_needs_no_embedder(kb_cfg, monkeypatch):
+    monkeypatch.setattr(Embedder, "embed_batch", lambda self, texts: [[float(len(t)), 1.0] for t in texts])
+    (kb_cfg.kb.paths.raw_dir / "zoo.txt").write_text("The zebra lives in the savanna.", encoding="utf-8")
+    pipeline.ingest(kb_cfg)
+
+    def no_embedder(cfg):
+        raise AssertionError("lexical search must not build an embedder")
+
+    monkeypatch.setattr(pipeline, "build_embedder", no_embedder)
+    res = pipeline.search(kb_cfg, "zebra", top_k=3, mode="lexical")
+    assert res["mode"] == "lexical"
+    assert [r["source"] for r in res["results"]] == ["knowledge/raw/zoo.txt"]
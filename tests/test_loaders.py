@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+import kb.loaders as loaders
+from bench.corpus import write_pdf
+from kb.loaders import PdfSplit, iter_docs, load_any
+from kb.page_cache import PageCache
+from kb.pipeline import ingest, search
+
+
+def test_iter_docs_isolates_failures(tmp_path: Path):
+    good = tmp_path / "good.txt"
+    good.write_text("hello", encoding="utf-8")
+    bad = tmp_path / "broken.pdf"
+    bad.write_bytes(b"not really a pdf")
+
+    docs = {d.source_path.name: d for d in iter_docs([bad, good], workers=1, max_in_flight=1)}
+
+    assert docs["good.txt"].text == "hello" and docs["good.txt"].error is None
+    assert docs["broken.pdf"].text == "" and docs["broken.pdf"].error
+
+
+@pytest.fixture
+def book(tmp_path: Path) -> Path:
+    # One paragraph per page; page 5 is blank.
+    paras = [f"marker{i} " + "filler words here " * 2 if i != 4 else "" for i in range(9)]
+    path = tmp_path / "book.pdf"
+    write_pdf(path, paras, lines_per_page=2)
+    return path
+
+
+def test_pdf_pages_are_located_in_text(book: Path):
+    doc = load_any(book)
+    assert [n for _, n in doc.pages] == [1, 2, 3, 4, 6, 7, 8, 9]
+    for off, n in doc.pages:
+        assert doc.text[off:].startswith(f"marker{n - 1}")
+
+
+def test_split_extraction_matches_whole_file(book: Path):
+    whole = load_any(book)
+    split = PdfSplit(min_pages=2, pages_per_task=2)
+    [doc] = list(iter_docs([book], workers=2, max_in_flight=2, pdf=split))
+    assert doc.error is None
+    assert (doc.text, doc.pages) == (whole.text, whole.pages)
+
+
+def test_page_cache_resumes_extraction(book: Path, tmp_path: Path, monkeypatch):
+    cache = PageCache(tmp_path / "pages.sqlite3")
+    cache.put_pages("h", {0: "marker0 cached"})  # as if an earlier run got through page 1
+    calls = []
+    real = loaders.extract_pdf_pages
+
+    def extract(path, start=0, stop=None):
+        calls.append((start, stop))
+        return real(path, start, stop)
+
+    monkeypatch.setattr(loaders, "extract_pdf_pages", extract)
+    split = PdfSplit(cache=cache, hashes={book: "h"})
+    [doc] = list(iter_docs([book], workers=0, pdf=split))
+    assert calls == [(1, 9)] and doc.text.startswith("marker0 cached\n\nmarker1")
+
+    calls.clear()
+    [again] = list(iter_docs([book], workers=0, pdf=split))
+    assert calls == [] and again.text == doc.text
+    assert cache.retain({"other"}) == 9
+
+
+def test_chunks_cite_pages(kb_cfg, fake_embedder, book: Path):
+    book.rename(kb_cfg.kb.paths.raw_dir / "book.pdf")
+    embedder, _ = fake_embedder
+    res = ingest(kb_cfg, embedder=embedder)
+    assert res["metrics"]["counters"]["page_cache_misses"] == 9
+    hit = search(kb_cfg, "marker6", top_k=1, mode="lexical")["results"][0]
+    assert hit["metadata"]["page_start"] <= 7 <= hit["metadata"]["page_end"]
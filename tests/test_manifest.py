@@ -1,5 +1,12 @@
+import json
 from pathlib import Path
+
+import pytest
+
+from kb import generations
 from kb.manifest import Manifest
+import kb.pipeline as pipeline
+from kb.pipeline import ingest
 
 
 def test_manifest_roundtrip(tmp_path: Path):
@@ -12,3 +19,71 @@ def test_manifest_roundtrip(tmp_path: Path):
     m2 = Manifest.load(p)
     assert m2.get_signature() == "sig1"
     assert m2.get_doc("a.txt")["num_chunks"] == 3
+
+
+def test_legacy_json_manifest_is_migrated(tmp_path: Path):
+    p = tmp_path / "manifest.json"
+    stat = {"size": 1, "mtime_ns": 2, "inode": 3}
+    docs = {"a.txt": {"sha256": "h", "num_chunks": 2, "ingested_at": "t", "stat": stat}}
+    p.write_text(json.dumps({"version": 1, "docs": docs, "signature": "sig"}), encoding="utf-8")
+
+    m = Manifest.load(p)
+    assert m.get_signature() == "sig"
+    assert m.docs() == docs
+    assert m.stat_matches("a.txt", stat)
+    assert not p.exists() and p.with_name("manifest.json.migrated").exists()
+
+
+class _Crash(BaseException):
+    pass
+
+
+def _crash_after(monkeypatch, n):
+    """Make the next ingest die (like a killed process) after `n` documents were chunked."""
+    left = [n]
+
+    def chunk_text(*args, **kwargs):
+        if left[0] == 0:
+            raise _Crash()
+        left[0] -= 1
+        return real(*args, **kwargs)
+
+    real = pipeline.chunk_text
+    monkeypatch.setattr(pipeline, "chunk_text", chunk_text)
+
+
+def _docs(cfg, n):
+    for i in range(n):
+        (cfg.kb.paths.raw_dir / f"d{i}.txt").write_text(f"document number {i} " * 20, encoding="utf-8")
+
+
+def test_interrupted_ingest_keeps_finished_documents(kb_cfg, fake_embedder, monkeypatch):
+    embedder, _ = fake_embedder
+    _docs(kb_cfg, 5)
+    with monkeypatch.context() as m:
+        _crash_after(m, 3)
+        with pytest.raises(_Crash):
+            ingest(kb_cfg, embedder=embedder, serial=True)
+
+    res = ingest(kb_cfg, embedder=embedder, serial=True)
+    assert res["skipped_docs"] == 3 and res["updated_docs"] == 3  # 2 docs + notes left
+
+
+def test_resume_continues_interrupted_rebuild(kb_cfg, fake_embedder, monkeypatch):
+    embedder, _ = fake_embedder
+    _docs(kb_cfg, 5)
+    ingest(kb_cfg, embedder=embedder)
+
+    with monkeypatch.context() as m:
+        _crash_after(m, 2)
+        with pytest.raises(_Crash):
+            ingest(kb_cfg, rebuild=True, embedder=embedder, serial=True)
+    pending = generations.resumable(kb_cfg)
+    assert pending and generations.current_generation(kb_cfg.kb.paths.snapshots_dir) == generations.BASE
+
+    res = ingest(kb_cfg, embedder=embedder, serial=True, resume=True)
+    assert res["resumed"] and res["generation"] == pending
+    assert res["skipped_docs"] == 2 and res["updated_docs"] == 4
+    assert generations.current_generation(kb_cfg.kb.paths.snapshots_dir) == pending
+    assert generations.resumable(kb_cfg) is None
+    assert ingest(kb_cfg, embedder=embedder, resume=True)["updated_docs"] == 0
@@ -0,0 +1,51 @@
+import pstats
+
+from kb.metrics import Metrics, StageProfiler
+from kb.pipeline import ingest, search
+
+
+def test_run_metrics_roll_up_into_parent():
+    parent = Metrics()
+    run = Metrics(parent=parent)
+    with run.time("embed"):
+        pass
+    run.inc("embed_requests", 3)
+    Metrics(parent=parent).inc("embed_requests")
+
+    assert run.snapshot()["counters"] == {"embed_requests": 3}
+    assert parent.snapshot()["stages"]["embed"]["calls"] == 1
+    text = parent.render_prometheus()
+    assert 'kb_stage_calls_total{stage="embed"} 1' in text
+    assert "kb_embed_requests_total 4" in text
+
+
+def test_ingest_and_search_report_stage_metrics(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    for i in range(3):
+        (kb_cfg.kb.paths.raw_dir / f"d{i}.txt").write_text(f"caravan route {i} " * 80, encoding="utf-8")
+
+    res = ingest(kb_cfg, embedder=embedder)
+    stages, counters = res["metrics"]["stages"], res["metrics"]["counters"]
+    assert {"load", "chunk", "embed", "upsert"} <= set(stages)
+    assert stages["load"]["calls"] == 4  # three docs plus the notes file
+    assert counters["chunks"] == res["added_chunks"]
+    assert counters["embed_inputs"] == res["added_chunks"]
+    assert counters["embed_requests"] >= 1 and counters["embed_tokens_sent"] > 0 and counters["embed_bytes_sent"] > 0
+
+    out = search(kb_cfg, "caravan route", top_k=2, embedder=embedder)
+    assert set(out["metrics"]["stages"]) == {"embed", "query"}
+    assert out["metrics"]["counters"]["embed_requests"] == 1
+
+
+def test_profiled_ingest_dumps_each_stage(kb_cfg, fake_embedder, tmp_path):
+    embedder, _ = fake_embedder
+    (kb_cfg.kb.paths.raw_dir / "a.txt").write_text("oasis " * 300, encoding="utf-8")
+    profiler = StageProfiler(tmp_path / "prof")
+    profiler.start()
+    res = ingest(kb_cfg, embedder=embedder, metrics=Metrics(profiler=profiler))
+    summary = profiler.dump()
+
+    assert res["pipelined"] is False
+    assert {"load", "chunk", "embed", "upsert"} <= set(summary)
+    assert pstats.Stats(summary["chunk"]["profile"]).total_calls > 0
+    assert summary["embed"]["tracemalloc_peak_bytes"] > 0
@@ -0,0 +1,62 @@
+import pytest
+
+from kb.output import best_snippet, iter_ndjson, parse_fields, shape_response, shape_results
+
+TEXT = (
+    "The caravan left Tangier at dawn. Camels carried salt and cloth across the desert for twenty days. "
+    "Nobody spoke of the storm that had buried the last one."
+)
+
+
+def _hits(n=3):
+    return [
+        {"score": 1.0 - i / 10, "source": f"d{i}.txt", "chunk_id": f"c{i}", "text": TEXT, "metadata": {"page_start": i}}
+        for i in range(n)
+    ]
+
+
+def test_snippet_centres_on_the_best_sentence_with_highlights():
+    snippet, start, highlights = best_snippet(TEXT, "salt desert", 80)
+    assert TEXT[start : start + len(snippet)] == snippet
+    assert "salt and cloth across the desert" in snippet and len(snippet) <= 80
+    assert [snippet[a:b] for a, b in highlights] == ["salt", "desert"]
+    assert not snippet[0].isspace() and TEXT[start - 1] == " "
+
+
+def test_fields_snippets_and_budget():
+    shaped = shape_results(_hits(), "storm", fields=parse_fields("source,metadata.page_start"), snippet_chars=60)
+    assert shaped[0]["metadata"] == {"page_start": 0} and set(shaped[0]) == {
+        "source", "metadata", "snippet", "snippet_start", "highlights",
+    }
+    assert "storm" in shaped[0]["snippet"]
+
+    capped = shape_results(_hits(), "salt", max_chars=150)
+    assert sum(len(h["text"]) for h in capped) <= 150 and all(h["truncated"] for h in capped)
+    assert capped[0]["text"] == TEXT[: len(capped[0]["text"])] and TEXT[len(capped[0]["text"])] == " "
+    assert shape_results(_hits(1), "salt", max_chars=10_000)[0]["text"] == TEXT
+
+    with pytest.raises(ValueError, match="Unknown result field"):
+        parse_fields(["source", "body"])
+
+
+def test_ndjson_lines_per_hit_then_summary():
+    res = shape_response({"query": "salt", "top_k": 2, "results": _hits(2), "metrics": {"x": 1}}, ["source"], metrics=False)
+    lines = list(iter_ndjson(res))
+    assert lines == [
+        '{"rank":1,"source":"d0.txt"}\n',
+        '{"rank":2,"source":"d1.txt"}\n',
+        '{"done":true,"query":"salt","top_k":2}\n',
+    ]
+
+
+def test_ndjson_shapes_each_hit_when_its_line_is_due():
+    res = {"query": "salt", "results": _hits(2), "metrics": {"x": 1}}
+    with pytest.raises(ValueError, match="Unknown result field"):
+        iter_ndjson(res, fields="source,body")  # before any line is written
+
+    lines = iter_ndjson(res, fields="source", snippet=30, metrics=False)
+    first = next(lines)
+    assert first.startswith('{"rank":1,"source":"d0.txt","snippet":') and "salt" in first
+    res["results"][1]["source"] = "changed.txt"  # not shaped yet
+    assert '"source":"changed.txt"' in next(lines)
+    assert next(lines) == '{"done":true,"query":"salt"}\n'
@@ -0,0 +1,48 @@
+import time
+
+from kb.pipeline import ingest, search
+from kb.query_cache import ResultCache
+from kb.service import KBService
+
+
+def test_result_cache_lru_and_ttl():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None and cache.get("c") == 3
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_rate": 0.6667, "entries": 2}
+
+    short = ResultCache(ttl_seconds=0.01)
+    short.put("a", 1)
+    time.sleep(0.02)
+    assert short.get("a") is None and len(short) == 0
+
+
+def test_repeat_searches_skip_ranking_until_the_index_changes(kb_cfg, fake_embedder):
+    embedder, state = fake_embedder
+    raw = kb_cfg.kb.paths.raw_dir
+    (raw / "a.txt").write_text("camel caravan crossing the desert " * 10, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    service = KBService(kb_cfg)
+    service._embedder = embedder
+
+    state.reset()
+    first = service.search("camel  caravan", top_k=2, mode="vector")
+    assert first["cache"]["results"]["misses"] == 1 and state.stats["inputs"] == 1
+    again = service.search("camel caravan", top_k=2, mode="vector")
+    assert again["cache"]["results"]["hits"] == 1 and state.stats["inputs"] == 1
+    assert again["results"] == first["results"]
+
+    (raw / "b.txt").write_text("camel caravan resting at the oasis " * 10, encoding="utf-8")
+    service.ingest()
+    state.reset()
+    after = service.search("camel caravan", top_k=2, mode="vector")
+    assert after["cache"]["results"]["misses"] == 1
+    assert after["cache"]["query_vectors"]["hits"] == 1 and state.stats.get("inputs", 0) == 0
+    assert {h["source"].rsplit("/", 1)[-1] for h in after["results"]} == {"a.txt", "b.txt"}
+
+    # One-shot searches have no result cache but still reuse the stored query vector.
+    cold = search(kb_cfg, "camel caravan", top_k=2, mode="hybrid", embedder=embedder)
+    assert cold["cache"]["results"] == {"enabled": False} and state.stats.get("inputs", 0) == 0
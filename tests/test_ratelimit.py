@@ -0,0 +1,32 @@
+import time
+
+from kb.ratelimit import RateLimiter, get_limiter, parse_retry_after
+
+
+def test_token_budget_throttles_once_exhausted():
+    lim = RateLimiter(tpm=600)  # 10 tokens/s, burst of 600
+    assert lim.acquire(tokens=600) == 0.0
+
+    t0 = time.monotonic()
+    waited = lim.acquire(tokens=5)
+    assert 0.4 < waited < 0.6
+    assert time.monotonic() - t0 >= 0.4
+    assert abs(lim.throttled_seconds - waited) < 1e-9
+
+
+def test_penalize_blocks_all_callers():
+    lim = RateLimiter(rpm=1000)
+    lim.penalize(0.2)
+    assert 0.1 < lim.acquire() <= 0.2
+
+
+def test_limiters_are_shared_per_key():
+    assert get_limiter("gemini:", 13.0, None) is get_limiter("gemini:", 13.0, None)
+    assert get_limiter("gemini:", 13.0, None) is not get_limiter("openai:", 13.0, None)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
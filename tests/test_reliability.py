@@ -0,0 +1,84 @@
+import time
+
+import pytest
+import requests
+
+from kb.embedder import Embedder, EmbedderSpec, EmbeddingError
+from kb.reliability import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+
+
+class _Resp:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+    def json(self):
+        return self._payload
+
+
+def _embedder(threshold=3, retries=2):
+    policy = RetryPolicy(retries=retries, backoff_seconds=0.01, max_backoff_seconds=0.05)
+    breaker = CircuitBreaker("test", failure_threshold=threshold, reset_seconds=0.2)
+    return Embedder(EmbedderSpec(provider="ollama", model="m", base_url="http://reliability.test"), policy=policy, breaker=breaker)
+
+
+def test_classification_and_backoff():
+    assert is_retryable(requests.Timeout())
+    assert is_retryable(requests.HTTPError(response=_Resp(503)))
+    assert not is_retryable(requests.HTTPError(response=_Resp(400)))
+    assert not is_retryable(EmbeddingError("Cannot embed empty text."))
+    try:
+        raise EmbeddingError("Failed to embed via Ollama.") from requests.ConnectionError()
+    except EmbeddingError as e:
+        assert is_retryable(e)
+
+    policy = RetryPolicy(retries=3, backoff_seconds=1.0, max_backoff_seconds=3.0)
+    timeout = requests.Timeout()
+    assert 0.5 <= policy.delay(0, timeout) <= 1.0 and 1.5 <= policy.delay(2, timeout) <= 3.0
+    assert policy.delay(3, timeout) is None
+    assert policy.delay(0, requests.HTTPError(response=_Resp(429, headers={"Retry-After": "2"}))) == 2.0
+    assert policy.delay(0, requests.HTTPError(response=_Resp(429, headers={"Retry-After": "3600"}))) is None
+
+
+def test_fatal_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def fake_post(self, url, json, timeout):
+        calls.append(url)
+        return _Resp(400)
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = _embedder()
+    with pytest.raises(requests.HTTPError):
+        emb.embed_one("hello")
+    assert len(calls) == 1 and "embed_retries" not in emb.metrics.counters()
+    with pytest.raises(EmbeddingError, match="empty"):
+        emb.embed_one("  ")
+
+
+def test_breaker_opens_fails_fast_and_recovers(monkeypatch):
+    state = {"status": 503, "calls": 0}
+
+    def fake_post(self, url, json, timeout):
+        state["calls"] += 1
+        return _Resp(state["status"], {"embeddings": [[1.0]] * len(json["input"])})
+
+    monkeypatch.setattr(requests.Session, "post", fake_post)
+    emb = _embedder(threshold=3, retries=2)
+    with pytest.raises(requests.HTTPError):
+        emb.embed_many(["a", "b"])  # the batch is retried, not split: 3 transient failures
+    assert state["calls"] == 3 and emb.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        emb.embed_many(["c"])
+    assert state["calls"] == 3 and emb.metrics.counters()["embed_circuit_open"] == 1
+
+    state["status"] = 200
+    time.sleep(0.25)
+    assert emb.embed_many(["c"]) == [[1.0]]
+    assert emb.breaker.state == "closed"
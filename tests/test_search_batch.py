@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from kb.pipeline import ingest, search, search_batch
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def indexed(kb_cfg, fake_embedder):
+    embedder, state = fake_embedder
+    for i, topic in enumerate(["camel caravan desert", "harbor ship monsoon", "scholar judge palace"]):
+        (kb_cfg.kb.paths.raw_dir / f"d{i}.txt").write_text(f"{topic} " * 60, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    return kb_cfg, embedder, state
+
+
+@pytest.mark.parametrize("mode", ["vector", "lexical", "hybrid"])
+def test_batch_matches_single_queries_in_order(indexed, mode):
+    cfg, embedder, _ = indexed
+    queries = ["harbor ship", "camel desert", "judge palace", "harbor ship"]
+    batch = search_batch(cfg, queries, top_k=2, mode=mode, embedder=embedder)
+
+    assert [r["query"] for r in batch["results"]] == queries
+    for q, got in zip(queries, batch["results"]):
+        single = search(cfg, q, top_k=2, mode=mode, embedder=embedder)
+        assert [h["chunk_id"] for h in got["results"]] == [h["chunk_id"] for h in single["results"]]
+    assert batch["results"][0]["results"][0]["source"].endswith("d1.txt")
+
+
+def test_batch_uses_one_embed_request(indexed):
+    cfg, embedder, state = indexed
+    state.reset()
+    res = search_batch(cfg, [f"query {i}" for i in range(40)], top_k=3, mode="vector", embedder=embedder)
+    assert len(res["results"]) == 40
+    assert state.stats["requests"] == 1 and state.stats["inputs"] == 40
+
+
+def test_batch_rejects_empty_queries(kb_cfg):
+    with pytest.raises(ValueError, match="index 1"):
+        search_batch(kb_cfg, ["ok", "  "], top_k=3, mode="lexical")
+
+
+def test_cli_search_batch_jsonl(indexed, tmp_path):
+    cfg, _, _ = indexed
+    lines = [json.dumps({"id": "a", "query": "camel desert"}), "", json.dumps("harbor ship")]
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    proc = subprocess.run(
+        [sys.executable, str(REPO_ROOT / "scripts" / "kb_cli.py"), "search-batch", "--mode", "lexical", "--top-k", "1"],
+        input="\n".join(lines),
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    rows = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [(r["line"], r.get("id"), r["query"]) for r in rows] == [(1, "a", "camel desert"), (3, None, "harbor ship")]
+    assert rows[1]["results"][0]["source"].endswith("d1.txt")
+
+
+def test_cli_search_streams_compact_ndjson(indexed):
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    cmd = [sys.executable, str(REPO_ROOT / "scripts" / "kb_cli.py"), "search", "--query", "harbor ship", "--mode", "lexical"]
+    proc = subprocess.run(
+        cmd + ["--top-k", "2", "--format", "ndjson", "--snippet", "40", "--fields", "source", "--no-metrics"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    lines = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [line.get("rank") for line in lines] == [1, 2, None] and lines[-1]["done"]
+    assert lines[0]["source"].endswith("d1.txt") and len(lines[0]["snippet"]) <= 40
+    assert "metrics" not in lines[-1] and "text" not in lines[0]
+
+
+def test_cli_text_output_prints_only_requested_fields(indexed):
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    cmd = [sys.executable, str(REPO_ROOT / "scripts" / "kb_cli.py"), "search", "--query", "harbor ship", "--mode", "lexical"]
+    proc = subprocess.run(cmd + ["--top-k", "1", "--fields", "source"], capture_output=True, text=True, env=env, check=True)
+    header = next(line for line in proc.stdout.splitlines() if line.startswith("[1]"))
+    assert header.startswith("[1] source=") and header.endswith("d1.txt")
+    assert "score=" not in proc.stdout and "chunk_id=" not in proc.stdout
@@ -0,0 +1,59 @@
+import json
+import threading
+import urllib.request
+
+from kb.server import make_server
+
+
+class _FakeService:
+    def search(self, query, top_k=None, mode=None):
+        if not query:
+            raise ValueError("Query must be non-empty.")
+        hits = [{"score": 0.9, "source": "a.txt", "chunk_id": "c1", "text": "Dogs bark. Cats purr softly.", "metadata": {}}]
+        return {"query": query, "top_k": top_k, "results": hits if query == "purr" else []}
+
+    def search_batch(self, queries, top_k=None, mode=None):
+        return {"results": [{"query": q, "results": []} for q in queries]}
+
+
+def _post(port, path, body):
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=5) as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_daemon_serves_search_requests():
+    server = make_server(_FakeService(), "127.0.0.1", 0)
+    port = server.server_address[1]
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        assert _post(port, "/search", {"query": "cats", "top_k": 3}) == (200, {"query": "cats", "top_k": 3, "results": []})
+        status, body = _post(port, "/search", {"query": ""})
+        assert status == 400 and "non-empty" in body["error"]
+        assert _post(port, "/search-batch", {"queries": ["a", "b"]})[1]["results"][1]["query"] == "b"
+        assert _post(port, "/nope", {})[0] == 404
+
+        req = urllib.request.Request(
+            f"http://127.0.0.1:{port}/search",
+            data=json.dumps({"query": "purr", "snippet": 20, "fields": ["source"], "stream": True}).encode("utf-8"),
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=5) as r:
+            assert r.headers["Content-Type"] == "application/x-ndjson"
+            lines = [json.loads(line) for line in r.read().splitlines()]
+        assert lines[0] == {"rank": 1, "source": "a.txt", "snippet": "Cats purr softly.", "snippet_start": 11, "highlights": [[5, 9]]}
+        assert lines[1] == {"done": True, "query": "purr", "top_k": None}
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain") and b"kb_stage_seconds_total" in r.read()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,48 @@
+"""Cold-start budget for the agent-facing CLI paths (every kb_* tool call pays it)."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from kb.pipeline import ingest
+
+REPO = Path(__file__).resolve().parents[1]
+# Budgets are in seconds of cumulative import time; scale them up on slow CI machines.
+SCALE = float(os.environ.get("KB_STARTUP_BUDGET_SCALE", "1.0"))
+ADD_NOTE_BUDGET = 0.5 * SCALE
+SEARCH_BUDGET = 2.5 * SCALE
+
+
+def _imports(args, cwd):
+    env = {**os.environ, "PYTHONPATH": str(REPO)}
+    r = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=cwd, env=env, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr[-2000:]
+    modules = {}
+    top_level = 0.0
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        modules[raw_name.strip()] = int(cumulative) / 1e6
+        if raw_name[1:2] != " ":  # nested imports are indented further
+            top_level += int(cumulative) / 1e6
+    return modules, top_level
+
+
+def test_add_note_does_not_load_vector_db_or_parsers(kb_cfg, tmp_path):
+    modules, seconds = _imports([str(REPO / "scripts/kb_cli.py"), "add-note", "--text", "hello", "--json"], tmp_path)
+
+    for heavy in ("chromadb", "openai", "pypdf", "docx", "requests", "kb.pipeline", "kb.vectordb"):
+        assert heavy not in modules, f"add-note imported {heavy}"
+    assert seconds < ADD_NOTE_BUDGET, f"add-note spent {seconds:.2f}s importing modules"
+
+
+def test_search_does_not_load_parsers_or_vector_db(kb_cfg, fake_embedder, tmp_path):
+    (kb_cfg.kb.paths.raw_dir / "a.txt").write_text("harbor ship " * 40, encoding="utf-8")
+    ingest(kb_cfg, embedder=fake_embedder[0])
+    args = ["search", "--query", "harbor", "--mode", "lexical", "--json"]
+    modules, seconds = _imports([str(REPO / "scripts/kb_cli.py"), *args], tmp_path)
+
+    for heavy in ("pypdf", "docx", "openai", "chromadb"):
+        assert heavy not in modules, f"search imported {heavy}"
+    assert seconds < SEARCH_BUDGET, f"search spent {seconds:.2f}s importing modules"
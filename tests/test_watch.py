@@ -0,0 +1,91 @@
+import threading
+import time
+from pathlib import Path
+
+from kb.pipeline import ingest, search
+from kb.service import KBService
+from kb.watcher import IngestWatcher
+
+
+def _sources(cfg, query):
+    return {Path(r["source"]).name for r in search(cfg, query, top_k=10, mode="lexical")["results"]}
+
+
+def test_scoped_ingest_and_deletions(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    raw = kb_cfg.kb.paths.raw_dir
+    (raw / "sub").mkdir()
+    for name in ("a.txt", "b.txt", "sub/c.md", "sub/d.md"):
+        (raw / name).write_text(f"{Path(name).stem}word shared " * 20, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+
+    (raw / "a.txt").unlink()
+    (raw / "b.txt").write_text("bword changed " * 20, encoding="utf-8")
+    res = ingest(kb_cfg, embedder=embedder, paths=[raw / "a.txt"])
+    assert res["removed_docs"] == ["knowledge/raw/a.txt"] and res["updated_docs"] == 0  # b.txt not in scope
+    assert _sources(kb_cfg, "shared") == {"b.txt", "c.md", "d.md"}
+
+    for f in (raw / "sub").iterdir():
+        f.unlink()
+    (raw / "sub").rmdir()
+    res = ingest(kb_cfg, embedder=embedder, paths=[raw / "sub", raw / "b.txt"])
+    assert sorted(res["removed_docs"]) == ["knowledge/raw/sub/c.md", "knowledge/raw/sub/d.md"]
+    assert res["updated_docs"] == 1
+    assert _sources(kb_cfg, "shared changed") == {"b.txt"}
+
+
+def test_full_ingest_removes_stale_documents(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    raw = kb_cfg.kb.paths.raw_dir
+    (raw / "a.txt").write_text("alpha " * 20, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    (raw / "a.txt").unlink()
+    assert ingest(kb_cfg, embedder=embedder)["removed_docs"] == ["knowledge/raw/a.txt"]
+    assert _sources(kb_cfg, "alpha") == set()
+
+
+def test_watcher_coalesces_bursts(kb_cfg):
+    batches = []
+    got = threading.Event()
+
+    def on_batch(paths):
+        batches.append(sorted(p.name for p in paths))
+        got.set()
+
+    watcher = IngestWatcher(kb_cfg, on_batch, debounce_seconds=0.3, max_delay_seconds=5)
+    watcher.start()
+    try:
+        raw = kb_cfg.kb.paths.raw_dir
+        for i in range(5):
+            (raw / f"f{i}.txt").write_text("x", encoding="utf-8")
+        (raw / "ignored.swp").write_text("x", encoding="utf-8")
+        assert got.wait(5)
+        time.sleep(0.5)
+        assert batches == [[f"f{i}.txt" for i in range(5)]]
+    finally:
+        watcher.stop()
+
+
+def test_watched_changes_become_searchable(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    service = KBService(kb_cfg)
+    service._embedder = embedder
+    done = threading.Semaphore(0)
+
+    def on_batch(paths):
+        service.ingest(paths=paths)
+        done.release()
+
+    watcher = IngestWatcher(kb_cfg, on_batch, debounce_seconds=0.2)
+    watcher.start()
+    try:
+        doc = kb_cfg.kb.paths.raw_dir / "new.md"
+        doc.write_text("zebra migration " * 20, encoding="utf-8")
+        assert done.acquire(timeout=10)
+        assert _sources(kb_cfg, "zebra") == {"new.md"}
+
+        doc.unlink()
+        assert done.acquire(timeout=10)
+        assert _sources(kb_cfg, "zebra") == set()
+    finally:
+        watcher.stop()
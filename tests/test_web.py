@@ -0,0 +1,71 @@
+import dataclasses
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from kb.pipeline import ingest
+from kb.service import KBService
+from kb.web import create_app
+
+
+class _SlowService:
+    def __init__(self):
+        self.warmed = 0
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        self.warmed += 1
+
+    def search(self, query, top_k=None, mode=None):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.1)
+        with self._lock:
+            self.running -= 1
+        return {"query": query, "results": []}
+
+
+def test_search_api_on_warm_service(kb_cfg, fake_embedder):
+    embedder, _ = fake_embedder
+    (kb_cfg.kb.paths.raw_dir / "a.txt").write_text("camel <caravan> crossing the desert " * 10, encoding="utf-8")
+    ingest(kb_cfg, embedder=embedder)
+    service = KBService(kb_cfg)
+    service._embedder = embedder
+
+    with TestClient(create_app(cfg=kb_cfg, service=service)) as client:
+        health = client.get("/healthz").json()
+        assert health["ok"] and health["generation"] == "base"
+
+        res = client.post("/api/search", json={"query": "caravan", "top_k": 2}).json()
+        assert res["results"][0]["source"].endswith("a.txt")
+        assert client.post("/api/search", json={"query": "desert", "mode": "lexical"}).json()["mode"] == "lexical"
+
+        streamed = client.post("/api/search", json={"query": "caravan", "snippet": 30, "metrics": False, "stream": True})
+        assert streamed.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in streamed.text.splitlines()]
+        assert lines[0]["rank"] == 1 and len(lines[0]["snippet"]) <= 30 and "metrics" not in lines[-1]
+
+        batch = client.post("/api/search_batch", json={"queries": ["camel", "desert"], "top_k": 1}).json()
+        assert [r["query"] for r in batch["results"]] == ["camel", "desert"]
+
+        r = client.post("/api/search", json={"query": " "})
+        assert r.status_code == 400 and "non-empty" in r.json()["detail"]
+        assert client.post("/api/search", json={}).status_code == 422
+        assert "&lt;caravan&gt;" in client.get("/", params={"q": "caravan"}).text
+
+
+def test_concurrency_is_bounded(kb_cfg):
+    web = dataclasses.replace(kb_cfg.kb.web, max_concurrency=2)
+    cfg = dataclasses.replace(kb_cfg, kb=dataclasses.replace(kb_cfg.kb, web=web))
+    service = _SlowService()
+    with TestClient(create_app(cfg=cfg, service=service)) as client:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            codes = list(pool.map(lambda i: client.post("/api/search", json={"query": f"q{i}"}).status_code, range(6)))
+    assert codes == [200] * 6
+    assert service.peak == 2 and service.warmed == 1